@@ -1,15 +1,27 @@
 import json
-from typing import Generator
+from collections import deque
+from itertools import islice
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Callable, Generator, Iterable
 from collections import OrderedDict
 
 import casanova
+from ebbe import as_chunks
+from spacy.attrs import DEP, ENT_TYPE, LEMMA, LOWER, ORTH, POS, TAG
+from spacy.parts_of_speech import NOUN, PRON, PROPN
+from spacy.strings import get_string_id
 from spacy.tokens.doc import Doc
+from spacy.vocab import Vocab
 
-from src.parsers import ConLLParser, SpacyParser
+from src.constants import MatchLayout
+from src.parsers import ConLLParser, SemgrexMatcher, SpacyParser, set_torch_threads
+from src.utils.filesystem import read_docbin
+from src.utils.metrics import NO_STAGE, Metrics
 
 from rich.progress import (
     BarColumn,
-    MofNCompleteColumn,
+    DownloadColumn,
     Progress,
     TaskProgressColumn,
     TextColumn,
@@ -20,7 +32,10 @@ from rich.progress import (
 MatchProgress = Progress(
     TextColumn("[progress.description]{task.description}"),
     BarColumn(),
-    MofNCompleteColumn(),
+    # Progress is measured in bytes of the in-file, which doesn't need
+    # to be read beforehand to count its rows
+    TextColumn("{task.fields[rows]} rows"),
+    DownloadColumn(),
     TaskProgressColumn(),
     TimeElapsedColumn(),
     TimeRemainingColumn(),
@@ -38,14 +53,87 @@ def display_columns(new_cols: list):
 
 
 def conll_converter(
-    enricher: casanova.Enricher, conll_col: str, parser: ConLLParser
-) -> Generator[tuple[list, Doc], None, None]:
-    for row, conll_str in enricher.cells(conll_col, with_rows=True):
+    enricher: casanova.Enricher,
+    conll_col: str,
+    parser: ConLLParser,
+    match_index: "MatchIndex | None" = None,
+    metrics: Metrics | None = None,
+) -> Generator[tuple[list, Doc | None], None, None]:
+    metrics = metrics or Metrics()
+    cells = enricher.cells(conll_col, with_rows=True)
+    for row, conll_str in metrics.timed("read", cells):
+        # Don't convert documents that can't match any pattern
+        with metrics.stage("prefilter"):
+            could_match = not match_index or match_index.could_match_conll(conll_str)
+        if not could_match:
+            yield row, None
+            continue
         # Convert CoNLL into SpaCy Doc -------
-        doc = parser(conll_str)
+        with metrics.stage("conll_to_doc"):
+            doc = parser(conll_str)
         yield row, doc
 
 
+def docbin_converter(
+    enricher: casanova.Enricher,
+    id_col: str,
+    docbin_file: Path,
+    vocab: Vocab,
+    skip: int = 0,
+    match_index: "MatchIndex | None" = None,
+    metrics: Metrics | None = None,
+) -> Generator[tuple[list, Doc | None], None, None]:
+    metrics = metrics or Metrics()
+    # Read the parsed documents alongside the rows they were parsed from,
+    # skipping as many documents as the rows already skipped in the enricher
+    id_pos = enricher.headers[id_col]
+    docs = islice(
+        metrics.timed("read_docbin", read_docbin(docbin_file, vocab)), skip, None
+    )
+    rows = metrics.timed("read", enricher)
+    for row, (doc_id, doc) in zip(rows, docs, strict=True):
+        if row[id_pos] != doc_id:
+            raise ValueError(
+                "The DocBin side-car file is not aligned with the data file: expected row '{}' but got '{}'.".format(
+                    row[id_pos], doc_id
+                )
+            )
+        # Don't match documents that can't match any pattern
+        with metrics.stage("prefilter"):
+            could_match = not match_index or match_index.could_match_doc(doc)
+        if not could_match:
+            yield row, None
+            continue
+        yield row, doc
+
+
+def match_docs(
+    docs: Iterable[tuple[list, Doc | None]],
+    parser: SemgrexMatcher,
+    match_index: "MatchIndex",
+    match_rows: Callable | None = None,
+    metrics: Metrics | None = None,
+) -> Generator[tuple[list, list[list]], None, None]:
+    """
+    Match the documents of a converter and yield each row with its output
+    rows, which are empty for documents that were skipped.
+    """
+    match_rows = match_rows or match_dependencies
+    metrics = metrics or Metrics()
+    for row, doc in docs:
+        if doc is None:
+            yield row, []
+            continue
+        metrics.count("tokens", len(doc))
+        with metrics.stage("match_rows"):
+            doc_matches = list(
+                match_rows(
+                    doc=doc, parser=parser, match_index=match_index, metrics=metrics
+                )
+            )
+        yield row, doc_matches
+
+
 class MatchIndex:
     def __init__(self, file) -> None:
         with open(file, "r") as f:
@@ -74,50 +162,381 @@ class MatchIndex:
         self.row_dict = OrderedDict()
         [self.row_dict.update({k: None}) for k in self.columns]
 
+        # For each pattern, the names of its nodes, as in the columns' prefixes
+        self.node_names = {
+            pattern_name: [node.get("RIGHT_ID").upper() for node in pattern_nodes]
+            for pattern_name, pattern_nodes in self.patterns()
+        }
+
+        # For each pattern, the index in an output row of each node's first
+        # column, in the order of the pattern's nodes
+        column_indices = {column: i for i, column in enumerate(self.row_dict)}
+        self.slots = {
+            pattern_name: [
+                column_indices[
+                    "{}id".format(
+                        form_column_prefix(
+                            pattern_name=pattern_name, node_name=node.get("RIGHT_ID")
+                        )
+                    )
+                ]
+                for node in pattern_nodes
+            ]
+            for pattern_name, pattern_nodes in self.patterns()
+        }
+
+        # Compile the token attribute values that the patterns' nodes require,
+        # to skip documents that can't match any pattern
+        requirements = [
+            [node_requirements(node) for node in pattern_nodes]
+            for _, pattern_nodes in self.patterns()
+        ]
+        # Nodes without any required value can match any token, and
+        # patterns without any required value can match any document
+        requirements = [[node for node in pattern if node] for pattern in requirements]
+        self.prefilter = all(requirements)
+        self.attrs = sorted(
+            {attr for pattern in requirements for node in pattern for attr in node}
+        )
+        self.conll_requirements = [
+            [
+                [(self.attrs.index(attr), values) for attr, values in node.items()]
+                for node in pattern
+            ]
+            for pattern in requirements
+        ]
+        self.doc_requirements = [
+            [
+                [
+                    (i, frozenset(get_string_id(value) for value in values))
+                    for i, values in node
+                ]
+                for node in pattern
+            ]
+            for pattern in self.conll_requirements
+        ]
+
     def patterns(self) -> Generator[tuple[str, list], None, None]:
         for pattern_name, pattern_nodes in self.matches.items():
             yield pattern_name, pattern_nodes
 
+    def could_match_conll(self, conll_str: str) -> bool:
+        """
+        Cheaply tell, from the raw columns of a CoNLL string, whether the
+        document it describes could match one of the patterns.
+        """
+        if not self.prefilter:
+            return True
+        tokens = set()
+        for line in conll_str.splitlines():
+            if not line or line.startswith("#"):
+                continue
+            fields = line.split("\t")
+            if len(fields) != 10:
+                # Let the CoNLL reader raise its error
+                return True
+            tokens.add(tuple(CONLL_ATTR_VALUES[attr](fields) for attr in self.attrs))
+        return could_match(tokens, self.conll_requirements)
+
+    def could_match_doc(self, doc: Doc) -> bool:
+        """
+        Tell, from its token attributes, whether a document could match
+        one of the patterns.
+        """
+        if not self.prefilter:
+            return True
+        array = doc.to_array([DOC_ATTR_IDS[attr] for attr in self.attrs])
+        tokens = set(map(tuple, array.reshape(len(doc), -1).tolist()))
+        return could_match(tokens, self.doc_requirements)
+
+
+# Token attributes that can be required by a pattern's node, as they are
+# read from a CoNLL-U line by the CoNLL reader
+CONLL_ATTR_VALUES = {
+    "ORTH": lambda fields: fields[1],
+    "LOWER": lambda fields: fields[1].lower(),
+    "LEMMA": lambda fields: fields[2],
+    "POS": lambda fields: fields[3],
+    "TAG": lambda fields: fields[3] if fields[4] == "_" else fields[4],
+    "DEP": lambda fields: "ROOT" if fields[7] == "root" else fields[7],
+}
+
+# Token attributes written in the columns of each matched node
+MATCH_ATTR_IDS = [LEMMA, POS, DEP, ENT_TYPE]
+# The same attributes, among those that a parser can leave out
+MATCH_ATTR_NEEDS = {"LEMMA", "POS", "ENT_TYPE"}
+
+# Columns of the long layout, which has one row per node of each match
+LONG_COLUMNS = [
+    "pattern",
+    "match",
+    "node",
+    "token_id",
+    "lemma",
+    "pos",
+    "deprel",
+    "entity",
+    "noun_phrase",
+]
+
+# Parts of speech of the tokens that head a noun phrase
+NOMINAL_POS = {NOUN, PRON, PROPN}
+
+DOC_ATTR_IDS = {
+    "ORTH": ORTH,
+    "LOWER": LOWER,
+    "LEMMA": LEMMA,
+    "POS": POS,
+    "TAG": TAG,
+    "DEP": DEP,
+}
+
+
+def node_requirements(node: dict) -> dict[str, frozenset]:
+    """
+    Return the values that a token must have, for each attribute, to match
+    a pattern's node. Only exact values and 'IN' lists are required; other
+    attributes and operators don't restrict the tokens.
+    """
+    requirements = {}
+    for attr, value in node.get("RIGHT_ATTRS", {}).items():
+        attr = "ORTH" if attr.upper() == "TEXT" else attr.upper()
+        if attr not in CONLL_ATTR_VALUES:
+            continue
+        if isinstance(value, str):
+            requirements[attr] = frozenset([value])
+        elif isinstance(value, dict) and isinstance(value.get("IN"), list):
+            requirements[attr] = frozenset(value["IN"])
+    return requirements
+
+
+def could_match(tokens: set[tuple], requirements: list) -> bool:
+    """
+    Whether, for every node of at least one pattern, one of the tokens
+    has the values that the node requires.
+    """
+    return any(
+        all(
+            any(all(token[i] in values for i, values in node) for token in tokens)
+            for node in pattern
+        )
+        for pattern in requirements
+    )
+
 
 def match_dependencies(
-    doc: Doc, parser: SpacyParser, match_index: MatchIndex
+    doc: Doc,
+    parser: SpacyParser | SemgrexMatcher,
+    match_index: MatchIndex,
+    metrics: Metrics | None = None,
 ) -> Generator[list, None, None]:
     # Deploy DependencyMatcher
-    matches_in_doc = parser.matcher(doc)
+    with metrics.stage("dependency_matcher") if metrics else NO_STAGE:
+        matches_in_doc = parser.matcher(doc)
+    if not matches_in_doc:
+        return
+
+    # Get the matched tokens' lemma, POS, deprel and entity type in bulk,
+    # and the character span of every nominal token's phrase
+    strings = parser.matcher.vocab.strings
+    token_attrs = doc.to_array(MATCH_ATTR_IDS).tolist()
+    phrase_spans = noun_phrase_spans(doc)
+    text = doc.text
+    width = len(match_index.row_dict)
 
     # Parse matches in the document
     for pattern_hash, token_ids in matches_in_doc:
-        # Unhash name matched pattern
-        pattern_name = parser.nlp.vocab.strings[pattern_hash]
-
-        # Get a list of the pattern's nodes
-        _, pattern = parser.matcher.get(pattern_hash)
-
-        # For this match pattern, create a new dictionary
-        # in which to store node data
-        d = match_index.row_dict.copy()
-
-        # Add all the match's nodes to a row
-        for i in range(len(token_ids)):
-            node_name = pattern[0][i]["RIGHT_ID"]
-            node_token = doc[token_ids[i]]
-            col_prefix = form_column_prefix(
-                pattern_name=pattern_name, node_name=node_name
-            )
-            d.update(
-                {
-                    "{}id".format(col_prefix): node_token.i,
-                    "{}id".format(col_prefix): node_token.i,
-                    "{}lemma".format(col_prefix): node_token.lemma_,
-                    "{}pos".format(col_prefix): node_token.pos_,
-                    "{}deprel".format(col_prefix): node_token.dep_,
-                    "{}entity".format(col_prefix): node_token.ent_type_,
-                }
-            )
+        # Unhash name matched pattern and get its nodes' columns
+        slots = match_index.slots[strings[pattern_hash]]
+
+        # Add all the match's nodes to a row, in which each node's columns
+        # are its token's index, lemma, POS, deprel, entity and noun phrase
+        row = [None] * width
+        for slot, token_id in zip(slots, token_ids):
+            row[slot] = token_id
+            row[slot + 1 : slot + 5] = [strings[h] for h in token_attrs[token_id]]
+            span = phrase_spans[token_id]
+            if span:
+                row[slot + 5] = text[span[0] : span[1]]
+        yield row
+
+
+def match_dependencies_long(
+    doc: Doc,
+    parser: SpacyParser | SemgrexMatcher,
+    match_index: MatchIndex,
+    metrics: Metrics | None = None,
+) -> Generator[list, None, None]:
+    """
+    Yield one row per node of each match in the document, with the columns
+    of LONG_COLUMNS: the pattern's name, the match's index in the document,
+    the node's name, and the token's index, lemma, POS, deprel, entity and
+    noun phrase. Unlike the wide rows of match_dependencies, the rows don't
+    hold empty columns for the other patterns' nodes.
+    """
+    with metrics.stage("dependency_matcher") if metrics else NO_STAGE:
+        matches_in_doc = parser.matcher(doc)
+    if not matches_in_doc:
+        return
 
-        # "{}noun_phrase".format(col_prefix): node_token.,
-        yield list(d.values())
+    strings = parser.matcher.vocab.strings
+    token_attrs = doc.to_array(MATCH_ATTR_IDS).tolist()
+    phrase_spans = noun_phrase_spans(doc)
+    text = doc.text
+
+    for match_id, (pattern_hash, token_ids) in enumerate(matches_in_doc):
+        pattern_name = strings[pattern_hash]
+        node_names = match_index.node_names[pattern_name]
+        for node_name, token_id in zip(node_names, token_ids):
+            span = phrase_spans[token_id]
+            yield [
+                pattern_name,
+                match_id,
+                node_name,
+                token_id,
+                *[strings[h] for h in token_attrs[token_id]],
+                text[span[0] : span[1]] if span else None,
+            ]
+
+
+def noun_phrase_spans(doc: Doc) -> list[tuple[int, int] | None]:
+    """
+    Map each token of a document to the character span of its noun phrase,
+    in one pass. A nominal token's phrase is its whole subtree, whose edges
+    SpaCy keeps for every token, so no subtree is walked. Other tokens
+    don't have a noun phrase.
+    """
+    spans = []
+    for token in doc:
+        if token.pos in NOMINAL_POS:
+            right_edge = token.right_edge
+            spans.append((token.left_edge.idx, right_edge.idx + len(right_edge)))
+        else:
+            spans.append(None)
+    return spans
 
 
 def form_column_prefix(pattern_name: str, node_name: str):
     return "{}_{}_".format(pattern_name, node_name.upper())
+
+
+# Number of rows sent to a worker process of a MatcherPool at a time
+MATCH_CHUNK_SIZE = 500
+
+
+class MatcherPool:
+    """
+    Pool of worker processes, each of which loads its own ConLLParser and
+    compiles the Semgrex patterns once, then converts and matches whole
+    chunks of CoNLL strings. Output rows are yielded in input order.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        spacy_language: str,
+        matchfile: Path,
+        layout: MatchLayout = MatchLayout.wide,
+        metrics: Metrics | None = None,
+        chunk_size: int = MATCH_CHUNK_SIZE,
+    ) -> None:
+        self.workers = workers
+        self.spacy_language = spacy_language
+        self.matchfile = matchfile
+        self.layout = layout
+        self.chunk_size = chunk_size
+        # The workers' stage times are added to these metrics
+        self.metrics = metrics or Metrics()
+
+    def match(
+        self, enricher: casanova.Enricher, conll_col: str
+    ) -> Generator[tuple[list, list[list]], None, None]:
+        """
+        Yield the same rows and output rows as match_docs, for the CoNLL
+        strings of the enricher. Only a couple of chunks per worker are in
+        flight at any time.
+        """
+        cells = self.metrics.timed(
+            "read", enricher.cells(conll_col, with_rows=True)
+        )
+        with get_context("spawn").Pool(
+            processes=self.workers,
+            initializer=_init_match_worker,
+            initargs=(
+                self.spacy_language,
+                self.matchfile,
+                self.layout,
+                self.metrics.enabled,
+            ),
+        ) as pool:
+            pending = deque()
+            for chunk in as_chunks(self.chunk_size, cells):
+                rows, conll_strings = zip(*chunk)
+                pending.append((rows, pool.apply_async(_match_chunk, (conll_strings,))))
+                if len(pending) >= 2 * self.workers:
+                    yield from self._get(*pending.popleft())
+            while pending:
+                yield from self._get(*pending.popleft())
+
+    def _get(self, rows, result):
+        chunk_matches, (stages, counters) = result.get()
+        self.metrics.merge(stages, counters)
+        return zip(rows, chunk_matches)
+
+
+# Parsers and patterns loaded once by each worker process of a MatcherPool
+_worker_matcher = None
+_worker_error = None
+
+
+def _init_match_worker(
+    spacy_language: str, matchfile: Path, layout: MatchLayout, profile: bool
+):
+    global _worker_matcher, _worker_error
+    # An exception raised in a pool's initializer makes multiprocessing
+    # respawn the worker endlessly, so keep it for the first task instead
+    try:
+        conll_parser = ConLLParser(spacy_language=spacy_language)
+        dep_parser = SemgrexMatcher(conll_parser.vocab)
+        match_index = MatchIndex(file=matchfile)
+        dep_parser.add_semgrex(match_index.matches)
+        if layout == MatchLayout.long:
+            match_rows = match_dependencies_long
+        else:
+            match_rows = match_dependencies
+        _worker_matcher = (
+            conll_parser,
+            dep_parser,
+            match_index,
+            match_rows,
+            Metrics(enabled=profile),
+        )
+    except Exception as e:
+        _worker_error = str(e)
+    set_torch_threads(1)
+
+
+def _match_chunk(conll_strings: list[str]) -> tuple[list[list[list]], tuple[dict, dict]]:
+    if _worker_matcher is None:
+        raise RuntimeError(_worker_error)
+    conll_parser, dep_parser, match_index, match_rows, metrics = _worker_matcher
+
+    def docs():
+        for conll_str in conll_strings:
+            with metrics.stage("prefilter"):
+                could_match = match_index.could_match_conll(conll_str)
+            if not could_match:
+                yield None, None
+                continue
+            with metrics.stage("conll_to_doc"):
+                doc = conll_parser(conll_str)
+            yield None, doc
+
+    chunk_matches = [
+        doc_matches
+        for _, doc_matches in match_docs(
+            docs(), dep_parser, match_index, match_rows, metrics
+        )
+    ]
+    # Send the chunk's stage times back along with its output rows
+    return chunk_matches, metrics.drain()
@@ -1,10 +1,15 @@
+import os
+from collections import deque
+from multiprocessing import get_context
 from typing import Generator, Iterable, Tuple
 
 from casanova import Enricher, Reader
 from ebbe import as_chunks
+from spacy.tokens import DocBin
+from spacy.vocab import Vocab
 from rich.progress import (
     BarColumn,
-    MofNCompleteColumn,
+    DownloadColumn,
     Progress,
     TaskProgressColumn,
     TextColumn,
@@ -12,46 +17,485 @@ from rich.progress import (
     TimeRemainingColumn,
 )
 
-from src.utils.normalizer import normalizer
+from src.constants import ModelType
+from src.parsers import (
+    PRUNABLE_ATTRIBUTES,
+    SpacyParser,
+    ensure_stanza_models,
+    set_torch_threads,
+    stanza_processors,
+)
+from src.utils.cache import ParseCache
+from src.utils.metrics import Metrics, current_rss_mb
+from src.utils.normalizer import normalize_batch
 
 
 ParseProgress = Progress(
     TextColumn("[progress.description]{task.description}"),
     BarColumn(),
-    MofNCompleteColumn(),
+    # Progress is measured in bytes of the in-file, which doesn't need
+    # to be read beforehand to count its rows
+    TextColumn("{task.fields[rows]} rows"),
+    DownloadColumn(),
     TaskProgressColumn(),
     TimeElapsedColumn(),
     TimeRemainingColumn(),
 )
 
 
+# Character budget of the first batches when it adapts to a memory target,
+# and the smallest budget it can shrink to
+DEFAULT_BATCH_CHARS = 1_000_000
+MIN_BATCH_CHARS = 10_000
+
+
+class BatchBudget:
+    """
+    Maximum number of characters of the texts of a batch, so that batches
+    of long texts hold fewer rows than batches of short ones. With a memory
+    target, in megabytes, the budget adapts after each parsed batch: it's
+    halved whenever the parsing processes' resident memory exceeds the
+    target, and grows by a quarter, up to `max_chars`, while the memory
+    stays well under the target and the batches' throughput doesn't drop.
+    """
+
+    # Share of the memory target under which the budget may grow
+    HEADROOM = 0.8
+    GROWTH = 1.25
+    # Share of the best throughput under which the budget stops growing
+    SLOWDOWN = 0.9
+
+    def __init__(
+        self, max_chars: int | None = None, max_memory: float | None = None
+    ) -> None:
+        self.limit = max_chars
+        self.max_memory = max_memory
+        if max_memory is None:
+            self.max_chars = max_chars
+        else:
+            self.max_chars = min(max_chars or DEFAULT_BATCH_CHARS, DEFAULT_BATCH_CHARS)
+        self.best_rate = 0.0
+
+    def update(self, chars: int, seconds: float, rss: float):
+        """
+        Adapt the budget to the characters and latency of a parsed batch,
+        and to the resident memory of the parsing processes since.
+        """
+        if self.max_memory is None:
+            return
+        if rss > self.max_memory:
+            self.max_chars = max(MIN_BATCH_CHARS, self.max_chars // 2)
+            # The throughput of the smaller batches starts over
+            self.best_rate = 0.0
+            return
+        rate = chars / seconds if seconds > 0 else 0.0
+        # Batches cut by their number of rows, or by the end of the in-file,
+        # don't fill the budget and wouldn't grow with it
+        if (
+            rss < self.HEADROOM * self.max_memory
+            and chars >= self.max_chars / 2
+            and rate >= self.SLOWDOWN * self.best_rate
+        ):
+            grown = int(self.max_chars * self.GROWTH)
+            self.max_chars = grown if self.limit is None else min(self.limit, grown)
+        self.best_rate = max(self.best_rate, rate)
+
+
+def chunks_of_texts(
+    items: Iterable[Tuple[str, list[str]]],
+    batch_size: int,
+    budget: BatchBudget | None = None,
+) -> Generator[list[Tuple[str, list[str]]], None, None]:
+    """
+    Group text-row tuples into batches of at most `batch_size` rows, and
+    of at most the budget's characters, or a single text longer than that.
+    The budget is read anew for each batch, since it can adapt meanwhile.
+    """
+    if budget is None or budget.max_chars is None:
+        yield from as_chunks(size=batch_size, iterable=items)
+        return
+    batch, chars = [], 0
+    for text, row in items:
+        if batch and chars + len(text) > budget.max_chars:
+            yield batch
+            batch, chars = [], 0
+        batch.append((text, row))
+        chars += len(text)
+        if len(batch) >= batch_size:
+            yield batch
+            batch, chars = [], 0
+    if batch:
+        yield batch
+
+
 def yield_batches_of_texts(
-    reader: Enricher | Reader, text_col: str, batch_size: int
+    reader: Enricher | Reader,
+    text_col: str,
+    batch_size: int,
+    budget: BatchBudget | None = None,
 ) -> Generator[Iterable[Tuple[str, list[str]]], None, None]:
     """
     From a tuple (a CSV row and a selected column), yield batches
     of tuples but inverted so that the first item in each tuple
     is the selected column (str) and the second item is the row (list).
+    With a budget, the batches are also bounded by their characters.
+    """
+    items = ((text, row) for row, text in reader.cells(text_col, with_rows=True))
+    yield from chunks_of_texts(items, batch_size, budget)
+
+
+def preprocess(batch) -> Iterable[Tuple[str, list[str]]]:
+    """
+    For every tuple of text and CSV row in a batch, pre-process the
+    text and return the batch of text-row tuples.
+    """
+    texts, rows = zip(*batch) if batch else ((), ())
+    return list(zip(normalize_batch(texts), rows))
+
+
+def preprocess_batches(
+    batches: Iterable[Iterable[Tuple[str, list[str]]]],
+    workers: int = 1,
+    metrics: Metrics | None = None,
+) -> Generator[list[Tuple[str, list[str]]], None, None]:
+    """
+    Pre-process successive batches of text-row tuples. With several workers,
+    the texts are normalized in a pool of processes, a couple of batches
+    ahead of the parser, and the batches are yielded in their input order.
+    """
+    metrics = metrics or Metrics()
+    if workers <= 1:
+        for batch in batches:
+            with metrics.stage("normalize"):
+                batch = preprocess(batch)
+            yield batch
+        return
+
+    with get_context("spawn").Pool(processes=workers) as pool:
+        pending = deque()
+        for batch in batches:
+            # Only send the texts to the workers, not the rows
+            texts, rows = zip(*batch) if batch else ((), ())
+            pending.append((pool.apply_async(normalize_batch, (texts,)), rows))
+            if len(pending) >= 2 * workers:
+                result, rows = pending.popleft()
+                with metrics.stage("normalize"):
+                    texts = result.get()
+                yield list(zip(texts, rows))
+        while pending:
+            result, rows = pending.popleft()
+            with metrics.stage("normalize"):
+                texts = result.get()
+            yield list(zip(texts, rows))
+
+
+# Parser loaded once by each worker process of a ParserPool
+_worker_parser = None
+_worker_error = None
+
+
+def _init_worker(
+    model_type: ModelType,
+    lang: str,
+    model_path: str,
+    needs: set[str] | None,
+    offline: bool,
+    threads: int,
+    profile: bool,
+):
+    global _worker_parser, _worker_error
+    # An exception raised in a pool's initializer makes multiprocessing
+    # respawn the worker endlessly, so keep it for the first task instead
+    try:
+        # The parent process already downloaded the missing Stanza models,
+        # which concurrent downloads into the same directory could corrupt
+        _worker_parser = SpacyParser(
+            model_type, lang, model_path, needs, offline, download=False
+        )
+        _worker_parser.metrics = Metrics(enabled=profile)
+    except Exception as e:
+        _worker_error = str(e)
+    set_torch_threads(threads)
+
+
+def _annotate_batch(
+    batch: list[Tuple[str, list[str]]], batch_size: int, docbin: bool
+) -> Tuple[
+    Tuple[list[Tuple[list[str], str, str]], bytes | None],
+    tuple[dict, dict],
+    Tuple[int, float],
+]:
+    if _worker_parser is None:
+        raise RuntimeError(_worker_error)
+    annotated = _worker_parser.annotate_batch(
+        batch=batch, batch_size=batch_size, docbin=docbin
+    )
+    # Send the batch's stage times and the worker's memory back along with
+    # its annotations
+    return annotated, _worker_parser.metrics.drain(), (os.getpid(), current_rss_mb())
+
+
+class ParserPool:
+    """
+    Pool of worker processes, each of which loads its own SpacyParser once
+    and annotates whole batches of (text, row) tuples. Results are yielded
+    in the order in which the batches were submitted.
     """
 
-    def reverse_tuples(
-        batch: Iterable[Tuple[list[str], str]]
-    ) -> Iterable[Tuple[str, list[str]]]:
+    def __init__(
+        self,
+        workers: int,
+        model_type: ModelType,
+        lang: str,
+        model_path: str = "",
+        metrics: Metrics | None = None,
+        needs: set[str] | None = None,
+        offline: bool = False,
+    ) -> None:
+        self.workers = workers
+        self.model_type = model_type
+        self.lang = lang
+        self.model_path = model_path
+        self.needs = needs
+        self.offline = offline
+        self.threads = max(1, (os.cpu_count() or 1) // workers)
+        # Download the missing Stanza models once, before the workers load them
+        if model_type == ModelType.stanza:
+            processors = stanza_processors(
+                set(PRUNABLE_ATTRIBUTES) if needs is None else needs
+            )
+            ensure_stanza_models(lang, processors, offline)
+        # The workers' stage times are added to these metrics
+        self.metrics = metrics or Metrics()
+        # Resident memory of each worker after its last batch, in megabytes
+        self.workers_rss: dict[int, float] = {}
+
+    def annotate_batches(
+        self,
+        batches: Iterable[list[Tuple[str, list[str]]]],
+        batch_size: int,
+        docbin: bool = False,
+    ) -> Generator[Tuple[list[Tuple[list[str], str, str]], bytes | None], None, None]:
         """
-        For every tuple in the batch, reverse the order, putting
-        the text column (string) first and the row (list) second.
+        Dispatch batches to the workers and yield, in input order, the same
+        annotated batches as SpacyParser.annotate_batches. Only a couple of
+        batches per worker are in flight at any time.
         """
-        return [(text, row) for row, text in batch]
+        # Torch and Stanza are not fork-safe, so start fresh interpreters
+        with get_context("spawn").Pool(
+            processes=self.workers,
+            initializer=_init_worker,
+            initargs=(
+                self.model_type,
+                self.lang,
+                self.model_path,
+                self.needs,
+                self.offline,
+                self.threads,
+                self.metrics.enabled,
+            ),
+        ) as pool:
+            pending = deque()
+            for batch in batches:
+                pending.append(
+                    pool.apply_async(_annotate_batch, (batch, batch_size, docbin))
+                )
+                if len(pending) >= 2 * self.workers:
+                    yield self._get(pending.popleft())
+            while pending:
+                yield self._get(pending.popleft())
 
-    for batch in as_chunks(
-        size=batch_size, iterable=reader.cells(text_col, with_rows=True)
-    ):
-        yield reverse_tuples(batch)
+    def _get(self, result):
+        annotated, (stages, counters), (pid, rss) = result.get()
+        self.metrics.merge(stages, counters)
+        self.workers_rss[pid] = rss
+        return annotated
 
 
-def preprocess(batch) -> Iterable[Tuple[str, list[str]]]:
+class LengthSortedParser:
     """
-    For every tuple of text and CSV row in a batch, pre-process the
-    text and return the batch of text-row tuples.
+    Wrapper around a SpacyParser or a ParserPool that buffers a window of
+    rows, sorts its texts by length and sends them to the parser in batches
+    of texts of similar lengths, so that transformer-based models pad them
+    less. The annotations are put back in the order of the input batches.
     """
-    return [(normalizer(text), row) for text, row in batch]
+
+    def __init__(
+        self,
+        parser: SpacyParser | ParserPool,
+        window: int,
+        budget: BatchBudget | None = None,
+    ) -> None:
+        self.parser = parser
+        self.window = window
+        self.budget = budget
+        # Deserializing the parsed documents only needs their strings,
+        # which DocBins store, so any vocabulary will do
+        self.vocab = Vocab()
+
+    def windows(
+        self, batches: Iterable[Iterable[Tuple[str, list[str]]]]
+    ) -> Generator[list[list[Tuple[str, list[str]]]], None, None]:
+        """
+        Group successive input batches into windows of at least `window`
+        rows, or fewer for the last window.
+        """
+        window, rows = [], 0
+        for batch in batches:
+            batch = list(batch)
+            window.append(batch)
+            rows += len(batch)
+            if rows >= self.window:
+                yield window
+                window, rows = [], 0
+        if window:
+            yield window
+
+    def annotate_batches(
+        self,
+        batches: Iterable[Iterable[Tuple[str, list[str]]]],
+        batch_size: int,
+        docbin: bool = False,
+    ) -> Generator[Tuple[list[Tuple[list[str], str, str]], bytes | None], None, None]:
+        """
+        Yield the same annotated batches as the wrapped parser, one for each
+        input batch and in the same order.
+        """
+        # The wrapped parser may hold several batches in flight, so queue
+        # each window until all of its sorted batches come back parsed
+        pending = deque()
+
+        def sorted_batches():
+            for window in self.windows(batches):
+                texts = [item for batch in window for item in batch]
+                order = sorted(range(len(texts)), key=lambda i: len(texts[i][0]))
+                sorted_texts = (texts[i] for i in order)
+                window_batches = list(
+                    chunks_of_texts(sorted_texts, batch_size, self.budget)
+                )
+                pending.append((window, order, len(window_batches)))
+                yield from window_batches
+
+        parsed = []
+        for annotated in self.parser.annotate_batches(
+            batches=sorted_batches(), batch_size=batch_size, docbin=docbin
+        ):
+            parsed.append(annotated)
+            while pending and len(parsed) >= pending[0][2]:
+                window, order, n_batches = pending.popleft()
+                yield from self.restore_order(window, order, parsed[:n_batches], docbin)
+                del parsed[:n_batches]
+        # Windows without any text
+        while pending:
+            window, order, _ = pending.popleft()
+            yield from self.restore_order(window, order, [], docbin)
+
+    def restore_order(
+        self,
+        window: list[list[Tuple[str, list[str]]]],
+        order: list[int],
+        parsed: list[Tuple[list[Tuple[list[str], str, str]], bytes | None]],
+        docbin: bool,
+    ) -> Generator[Tuple[list[Tuple[list[str], str, str]], bytes | None], None, None]:
+        """
+        Split a window's parsed batches, sorted by length, back into its
+        input batches.
+        """
+        annotations, docs = [None] * len(order), [None] * len(order)
+        sorted_annotations = (a for batch, _ in parsed for a in batch)
+        for i, annotation in zip(order, sorted_annotations):
+            annotations[i] = annotation
+        if docbin:
+            sorted_docs = (
+                doc
+                for _, doc_bin in parsed
+                for doc in DocBin().from_bytes(doc_bin).get_docs(self.vocab)
+            )
+            for i, doc in zip(order, sorted_docs):
+                docs[i] = doc
+
+        start = 0
+        for batch in window:
+            end = start + len(batch)
+            doc_bin = DocBin(docs=docs[start:end]).to_bytes() if docbin else None
+            yield annotations[start:end], doc_bin
+            start = end
+
+
+class CachedParser:
+    """
+    Wrapper around a SpacyParser or a ParserPool that looks up each text of
+    a batch in a ParseCache and only sends the cache misses to the parser.
+    Texts repeated within a batch are parsed once.
+    """
+
+    def __init__(
+        self,
+        parser: SpacyParser | ParserPool,
+        cache: ParseCache,
+        metrics: Metrics | None = None,
+    ) -> None:
+        self.parser = parser
+        self.cache = cache
+        self.metrics = metrics or Metrics()
+        # Deserializing the parsed documents only needs their strings,
+        # which DocBins store, so any vocabulary will do
+        self.vocab = Vocab()
+
+    def annotate_batches(
+        self,
+        batches: Iterable[Iterable[Tuple[str, list[str]]]],
+        batch_size: int,
+        docbin: bool = False,
+    ) -> Generator[Tuple[list[Tuple[list[str], str, str]], bytes | None], None, None]:
+        """
+        Yield the same annotated batches as the wrapped parser, filling
+        cached texts directly and saving the newly parsed ones in the cache.
+        """
+        # The wrapped parser may hold several batches in flight, so queue
+        # each batch's cache hits until its misses come back parsed
+        pending = deque()
+
+        def batches_of_misses():
+            for batch in batches:
+                with self.metrics.stage("cache"):
+                    batch = list(batch)
+                    keys = [self.cache.key(text) for text, _ in batch]
+                    hits = self.cache.get_many(keys, docbin=docbin)
+                    misses = {}
+                    for key, (text, row) in zip(keys, batch):
+                        if key not in hits and key not in misses:
+                            misses[key] = (text, row)
+                pending.append((batch, keys, hits, list(misses)))
+                yield list(misses.values())
+
+        for parsed, parsed_docbin in self.parser.annotate_batches(
+            batches=batches_of_misses(), batch_size=batch_size, docbin=docbin
+        ):
+            with self.metrics.stage("cache"):
+                batch, keys, entries, missed_keys = pending.popleft()
+                if docbin:
+                    docs = DocBin().from_bytes(parsed_docbin).get_docs(self.vocab)
+                    docs_bytes = [DocBin(docs=[doc]).to_bytes() for doc in docs]
+                else:
+                    docs_bytes = [None] * len(parsed)
+                new_entries = [
+                    (key, parsed_text, conll_string, doc_bytes)
+                    for key, (_, parsed_text, conll_string), doc_bytes in zip(
+                        missed_keys, parsed, docs_bytes
+                    )
+                ]
+                self.cache.put_many(new_entries)
+                entries.update((key, tuple(entry)) for key, *entry in new_entries)
+                self.cache.misses += len(missed_keys)
+                self.cache.hits += len(batch) - len(missed_keys)
+
+                # Put the batch back together in its original order
+                annotations = []
+                doc_bin = DocBin() if docbin else None
+                for key, (_, row) in zip(keys, batch):
+                    parsed_text, conll_string, doc_bytes = entries[key]
+                    annotations.append((row, parsed_text, conll_string))
+                    if doc_bin is not None:
+                        doc_bin.merge(DocBin().from_bytes(doc_bytes))
+            yield annotations, doc_bin.to_bytes() if doc_bin is not None else None
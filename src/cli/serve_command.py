@@ -0,0 +1,203 @@
+import inspect
+import json
+import os
+import socket
+import socketserver
+import stat
+import time
+import typing
+from collections import OrderedDict
+from enum import Enum
+from pathlib import Path
+from typing import Callable, Hashable
+
+import typer
+from rich import print
+
+from src.constants import INTERRUPTED_EXIT_CODE
+
+# This module doesn't import SpaCy, so that clients start fast
+
+# Number of parsers that a server keeps loaded by default
+DEFAULT_MAX_PARSERS = 2
+
+
+class ResidentParsers:
+    """
+    Parsers that the 'serve' command keeps loaded between the jobs it runs,
+    by configuration. Until it's enabled, every parser is loaded anew. Once
+    it holds `max_parsers` parsers, the least recently used one is dropped.
+    """
+
+    def __init__(self, max_parsers: int = DEFAULT_MAX_PARSERS) -> None:
+        self.enabled = False
+        self.max_parsers = max_parsers
+        self.parsers = OrderedDict()
+
+    def get(self, key: Hashable, load: Callable):
+        if not self.enabled:
+            return load()
+        if key in self.parsers:
+            self.parsers.move_to_end(key)
+            return self.parsers[key]
+        # Drop the parsers to make room before loading the new one,
+        # so that both aren't in memory at once
+        while self.parsers and len(self.parsers) >= self.max_parsers:
+            self.parsers.popitem(last=False)
+        parser = load()
+        self.parsers[key] = parser
+        return parser
+
+
+RESIDENT_PARSERS = ResidentParsers()
+
+
+def encode_options(options: dict) -> dict:
+    """
+    Make a command's options JSON-serializable. Paths are made absolute,
+    since the server doesn't run in the client's working directory.
+    """
+    encoded = {}
+    for name, value in options.items():
+        if isinstance(value, Path):
+            value = str(value.absolute())
+        elif isinstance(value, Enum):
+            value = value.value
+        encoded[name] = value
+    return encoded
+
+
+def option_type(annotation) -> type | None:
+    """The Path or Enum type of an option's annotation, if any."""
+    if typing.get_origin(annotation) is typing.Annotated:
+        annotation = typing.get_args(annotation)[0]
+    for candidate in [annotation, *typing.get_args(annotation)]:
+        if isinstance(candidate, type) and issubclass(candidate, (Path, Enum)):
+            return candidate
+
+
+def decode_options(command: Callable, options: dict) -> dict:
+    """Give back the options of a command their Path and Enum types."""
+    parameters = inspect.signature(command).parameters
+    decoded = {}
+    for name, value in options.items():
+        if name not in parameters:
+            raise ValueError("Unknown option '{}'.".format(name))
+        cast = option_type(parameters[name].annotation)
+        if value is not None and cast is not None:
+            value = cast(value)
+        decoded[name] = value
+    return decoded
+
+
+def submit_job(server: Path, command: str, options: dict):
+    """
+    Send a command to a server started with 'keyfayqua serve' and wait for
+    the server to run it with its loaded parsers.
+    """
+    request = {"command": command, "options": encode_options(options)}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(str(server))
+        except OSError as e:
+            raise typer.BadParameter(
+                "Cannot connect to the server at '{}': {}".format(server, e)
+            )
+        with client.makefile("rwb") as f:
+            f.write(json.dumps(request).encode() + b"\n")
+            f.flush()
+            print("Sent the {} job to the server at '{}'...".format(command, server))
+            line = f.readline()
+    if not line:
+        print("[bold red]The server closed the connection before the job ended.")
+        raise typer.Exit(code=1)
+    response = json.loads(line)
+    if response["error"] is not None:
+        print("[bold red]The job failed:[/bold red] {}".format(response["error"]))
+        raise typer.Exit(code=1)
+    print(
+        "The server ran the {} job in {:.1f} seconds.".format(
+            command, response["seconds"]
+        )
+    )
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """
+    Run the job of a connection, given as a line of JSON, and answer with
+    another line of JSON once it's done. A job interrupted with Ctrl+C fails
+    and stops the server.
+    """
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        start = time.perf_counter()
+        error = None
+        interrupted = False
+        try:
+            request = json.loads(line)
+            command = self.server.commands[request["command"]]
+            options = decode_options(command, request["options"])
+            # A job can't be sent back to a server
+            options.pop("server", None)
+            print("Running a {} job...".format(request["command"]))
+            command(**options)
+        except typer.Exit as e:
+            interrupted = e.exit_code == INTERRUPTED_EXIT_CODE
+            if e.exit_code:
+                error = "The command exited with code {}.".format(e.exit_code)
+        except KeyboardInterrupt:
+            interrupted = True
+        except Exception as e:
+            error = "{}: {}".format(type(e).__name__, e)
+            print("[bold red]The job failed:[/bold red] {}".format(error))
+        if interrupted:
+            error = "The job was interrupted on the server, which stopped."
+        response = {"error": error, "seconds": time.perf_counter() - start}
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+        if interrupted:
+            # Leave serve_forever, as Ctrl+C would outside of a job
+            raise KeyboardInterrupt
+
+
+class JobServer(socketserver.UnixStreamServer):
+    """
+    Server running the jobs sent to its Unix socket one at a time, in the
+    order of their connections, so that they share its loaded parsers.
+    """
+
+    def __init__(self, path: Path, commands: dict[str, Callable]) -> None:
+        self.commands = commands
+        # Replace the socket of a server that didn't shut down cleanly
+        if path.exists() and stat.S_ISSOCK(path.stat().st_mode):
+            path.unlink()
+        # Only the user may connect: the socket is created without access
+        # for others, rather than restricted after the bind
+        umask = os.umask(0o077)
+        try:
+            super().__init__(str(path), JobHandler)
+        finally:
+            os.umask(umask)
+        self.path = path
+
+    def server_close(self):
+        super().server_close()
+        self.path.unlink(missing_ok=True)
+
+
+def serve(
+    path: Path,
+    commands: dict[str, Callable],
+    max_parsers: int = DEFAULT_MAX_PARSERS,
+):
+    # Keep the parsers that the jobs load for the next jobs
+    RESIDENT_PARSERS.enabled = True
+    RESIDENT_PARSERS.max_parsers = max_parsers
+    with JobServer(path, commands) as server:
+        print("Waiting for jobs on '{}'. Press Ctrl+C to stop.".format(path))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\nServer stopped.")
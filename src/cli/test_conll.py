@@ -1,9 +1,6 @@
 from pathlib import Path
 
 import casanova
-from spacy.tokens.doc import Doc
-from spacy_conll import init_parser
-from spacy_conll.parser import ConllParser
 from rich.progress import (
     Progress,
     SpinnerColumn,
@@ -14,18 +11,29 @@ from rich.progress import (
 
 
 def parse_conll_string(datafile: Path, conll_string_col: str):
-    # Set up a ConLL parser.
-    # For testing, the language doesn't matter
-    print("Initializing parser...")
-    nlp = ConllParser(init_parser("en_core_web_lg", "spacy"))
+    # SpaCy, which imports Thinc, is only imported once the command runs
+    from spacy.tokens.doc import Doc
+    from spacy.vocab import Vocab
 
-    print("Counting data file length...")
-    with Progress(SpinnerColumn()):
-        file_length = casanova.reader.count(datafile)
+    from src.utils.conll import conll_to_doc
+    from src.utils.filesystem import ParquetReader, is_parquet
+
+    # For testing, the language doesn't matter,
+    # so the documents are built on an empty vocabulary
+    vocab = Vocab()
+
+    if is_parquet(datafile):
+        reader = ParquetReader(datafile)
+        file_length = reader.total
+    else:
+        print("Counting data file length...")
+        with Progress(SpinnerColumn()):
+            file_length = casanova.reader.count(datafile)
+        reader = casanova.reader(datafile)
 
     # In the file, assert that every CoNLL string
     # can be converted to a SpaCy document
-    with casanova.reader(datafile) as reader, Progress(
+    with reader, Progress(
         TextColumn("[progress.description]{task.description}"),
         BarColumn(),
         MofNCompleteColumn(),
@@ -33,7 +41,7 @@ def parse_conll_string(datafile: Path, conll_string_col: str):
         task = progress.add_task(description="Test CoNLL string", total=file_length)
         for conllstr in reader.cells(conll_string_col):
             try:
-                doc = nlp.parse_conll_text_as_spacy(conllstr)  # type: ignore
+                doc = conll_to_doc(vocab, conllstr)
                 assert isinstance(doc, Doc)
                 progress.advance(task_id=task)
             except Exception as e:
@@ -1,6 +1,8 @@
 from enum import Enum
 
 CHUNK_SIZE = 5000
+# Exit code of a command interrupted with Ctrl+C, as in shells
+INTERRUPTED_EXIT_CODE = 130
 DEFAULT_HOPSPARSER_MODEL_URI = "https://zenodo.org/record/7703346/files/UD_all_spoken_French-flaubert.tar.xz?download=1"
 DEFAULT_HOPSPARSER_MODEL_NAME = "UD_all_spoken_French-flaubert"
 
@@ -9,3 +11,19 @@ class ModelType(str, Enum):
     hop = "hopsparser"
     stanza = "stanza"
     spacy = "spacy"
+
+
+class Compression(str, Enum):
+    gzip = "gzip"
+    zstd = "zstd"
+    none = "none"
+
+
+class OutputFormat(str, Enum):
+    csv = "csv"
+    parquet = "parquet"
+
+
+class MatchLayout(str, Enum):
+    wide = "wide"
+    long = "long"
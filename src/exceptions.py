@@ -28,3 +28,38 @@ class StanzaDownloadException(Exception):
             self.lang, self.e
         )
         return msg
+
+
+class StanzaModelsMissingException(Exception):
+    def __init__(self, lang: str, processors: str):
+        self.lang = lang
+        self.processors = processors
+
+    def __str__(self):
+        msg = """
+        The Stanza models for '{}' (processors: {}) aren't downloaded, and they can't be downloaded offline.
+        Run the command once without '--offline' on a machine connected to the internet, or copy its Stanza resources directory.
+        """.format(
+            self.lang, self.processors
+        )
+        return msg
+
+
+class ZstdImportException(Exception):
+    def __str__(self):
+        msg = """
+        Zstandard compression requires the 'zstandard' package. Install it with:
+
+            pip install zstandard
+        """
+        return msg
+
+
+class ParquetImportException(Exception):
+    def __str__(self):
+        msg = """
+        Reading and writing Parquet files requires the 'pyarrow' package. Install it with:
+
+            pip install pyarrow
+        """
+        return msg
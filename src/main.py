@@ -1,27 +1,29 @@
+import json
+import time
+from contextlib import nullcontext
 from pathlib import Path
+from typing import TYPE_CHECKING, Optional
 
-import torch
 import typer
 from rich import print
 from typing_extensions import Annotated
 
-from src.cli.match_command import (
-    MatchIndex,
-    MatchProgress,
-    conll_converter,
-    display_columns,
-    match_dependencies,
-)
-from src.cli.parse_command import ParseProgress, preprocess, yield_batches_of_texts
-from src.cli.test_conll import parse_conll_string
-from src.constants import CHUNK_SIZE, ModelType
-from src.parsers import ConLLParser, setup_parser
-from src.utils.filesystem import (
-    MatchEnricher,
-    ParseEnricher,
-    compress_outfile,
-    count_file_length,
+from src.constants import (
+    CHUNK_SIZE,
+    INTERRUPTED_EXIT_CODE,
+    Compression,
+    MatchLayout,
+    ModelType,
+    OutputFormat,
 )
+from src.cli.serve_command import DEFAULT_MAX_PARSERS
+from src.utils.cache import DEFAULT_CACHE_SIZE
+from src.utils.metrics import DEFAULT_METRICS_INTERVAL, Metrics, current_rss_mb
+
+# The commands' modules import SpaCy, which imports Torch, so they're
+# only imported when a command runs and '--help' stays fast
+if TYPE_CHECKING:
+    from src.utils.filesystem import ParseEnricher
 
 app = typer.Typer()
 
@@ -47,48 +49,352 @@ def parse(
     model_path: str = "",
     clean_social: Annotated[bool, typer.Option("--clean-social")] = False,
     batch_size: int = CHUNK_SIZE,
+    max_batch_chars: Annotated[
+        Optional[int],
+        typer.Option(
+            help="Maximum number of characters of the texts of a batch, so that batches of long texts hold fewer rows",
+            min=1,
+        ),
+    ] = None,
+    max_memory: Annotated[
+        Optional[float],
+        typer.Option(
+            help="Target resident memory of each parsing process, in megabytes, to which the batches' characters adapt",
+            min=1,
+        ),
+    ] = None,
+    workers: Annotated[
+        int, typer.Option(help="Number of parsing processes", min=1)
+    ] = 1,
+    needs: Annotated[
+        Optional[str],
+        typer.Option(
+            help="Comma-separated token attributes to parse, among LEMMA, POS, TAG, MORPH, ENT_TYPE and DEP (default: all)",
+        ),
+    ] = None,
+    matchfile: Annotated[
+        Optional[Path],
+        typer.Option(
+            exists=True,
+            dir_okay=False,
+            readable=True,
+            resolve_path=True,
+            help="Semgrex file whose patterns' attributes are parsed (with those of --needs)",
+        ),
+    ] = None,
+    offline: Annotated[
+        bool,
+        typer.Option(
+            "--offline",
+            help="Never connect to the internet: the models must already be downloaded",
+        ),
+    ] = False,
+    sort_window: Annotated[
+        int,
+        typer.Option(
+            help="Number of rows whose texts are sorted by length before parsing, so that batches hold texts of similar lengths (0: don't sort)",
+            min=0,
+        ),
+    ] = 0,
+    docbin: Annotated[
+        bool,
+        typer.Option(
+            "--docbin",
+            help="Also save the parsed documents in a binary side-car file for match",
+        ),
+    ] = False,
+    compression: Annotated[
+        Compression, typer.Option(case_sensitive=False, help="Out-file compression")
+    ] = Compression.gzip,
+    compress_level: Annotated[
+        Optional[int], typer.Option(help="Compression level (default: 6 for gzip, 3 for zstd)")
+    ] = None,
+    output_format: Annotated[
+        Optional[OutputFormat],
+        typer.Option(
+            case_sensitive=False,
+            help="Out-file format: CSV, or columnar Parquet (requires pyarrow) [default: parquet if the out-file ends with '.parquet', csv otherwise]",
+        ),
+    ] = None,
+    resume: Annotated[
+        bool,
+        typer.Option(
+            "--resume", help="Continue an interrupted run, appending to its out-file"
+        ),
+    ] = False,
+    cache: Annotated[
+        Optional[Path],
+        typer.Option(
+            dir_okay=False,
+            help="SQLite file caching the annotations of already parsed texts",
+        ),
+    ] = None,
+    cache_size: Annotated[
+        int, typer.Option(help="Maximum size of the cache, in megabytes", min=1)
+    ] = DEFAULT_CACHE_SIZE,
+    profile: Annotated[
+        bool,
+        typer.Option(
+            "--profile", help="Print the time spent in each stage at the end of the run"
+        ),
+    ] = False,
+    metrics_file: Annotated[
+        Optional[Path],
+        typer.Option(
+            dir_okay=False,
+            help="JSON file in which to save the time spent in each stage, throughput and memory",
+        ),
+    ] = None,
+    metrics_interval: Annotated[
+        float,
+        typer.Option(help="Seconds between snapshots of the metrics file", min=0),
+    ] = DEFAULT_METRICS_INTERVAL,
+    server: Annotated[
+        Optional[Path],
+        typer.Option(
+            dir_okay=False,
+            help="Unix socket of a 'keyfayqua serve' server that runs the job with its already loaded models",
+        ),
+    ] = None,
 ):
+    if server:
+        # Send the command's options, which are its only local variables yet
+        options = dict(locals())
+        del options["server"]
+        from src.cli.serve_command import submit_job
+
+        return submit_job(server, "parse", options)
+
+    output_format = resolve_output_format(outfile, output_format)
+
+    from src.cli.parse_command import (
+        BatchBudget,
+        CachedParser,
+        LengthSortedParser,
+        ParseProgress,
+        ParserPool,
+        preprocess_batches,
+        yield_batches_of_texts,
+    )
+    from src.parsers import (
+        confirm_hopsparser_model_path,
+        parse_needs,
+        parser_fingerprint,
+        pattern_needs,
+        set_torch_threads,
+        setup_parser,
+    )
+    from src.cli.serve_command import RESIDENT_PARSERS
+    from src.utils.cache import ParseCache
+    from src.utils.filesystem import (
+        DocBinWriter,
+        ParseEnricher,
+        docbin_outfile,
+    )
+
+    check_resumable(resume, output_format)
+    # Record the time spent in each stage, if requested
+    metrics = Metrics(profile, metrics_file, "parse", metrics_interval)
+
+    # Only parse the token attributes that are needed
+    needed = parse_needs(needs) if needs is not None else None
+    if matchfile:
+        with open(matchfile) as f:
+            patterns_needed = pattern_needs(json.load(f))
+        if patterns_needed is None:
+            needed = None
+        else:
+            needed = (needed or set()) | patterns_needed
+
     # STEP ONE --------------------------
     # Set up the Parser
-    torch.set_num_threads(2)
     print("Setting up parser...")
-    parser = setup_parser(model, lang, model_path)
+    # Settle the model path here, where the user can still be prompted,
+    # because worker processes load their own pipeline and the cache
+    # depends on the model
+    if model == ModelType.hop:
+        # A server can't prompt the user, who waits for the job elsewhere
+        model_path = confirm_hopsparser_model_path(
+            model_path, offline, interactive=not RESIDENT_PARSERS.enabled
+        )
+    if workers > 1:
+        parser = ParserPool(
+            workers,
+            model,
+            lang,
+            model_path,
+            metrics=metrics,
+            needs=needed,
+            offline=offline,
+        )
+    else:
+        # A server keeps the parser loaded for its next jobs
+        needed_key = None if needed is None else tuple(sorted(needed))
+        parser = RESIDENT_PARSERS.get(
+            ("parser", model, lang, model_path, needed_key, offline),
+            lambda: setup_parser(model, lang, model_path, needed, offline),
+        )
+        parser.metrics = metrics
+        set_torch_threads(2)
     if parser:
+        # Bound the batches by their characters, adapting them to the
+        # parsing processes' memory if requested
+        budget = BatchBudget(max_batch_chars, max_memory)
+        pool = parser if workers > 1 else None
+
+        # Group the texts by length, which transformer-based models
+        # need to pad less
+        if sort_window:
+            parser = LengthSortedParser(parser, sort_window, budget)
+
         # STEP TWO --------------------------
-        # Count the length of the in-file
-        infile_length = count_file_length(datafile)
+        # Only send the texts that weren't already parsed to the parser
+        parse_cache = nullcontext()
+        if cache:
+            parse_cache = ParseCache(
+                cache, parser_fingerprint(model, lang, model_path, needed), cache_size
+            )
+            parser = CachedParser(parser, parse_cache, metrics)
 
         # STEP THREE --------------------------
         # Parse the document's texts
         with ParseProgress as p:
-            task = p.add_task(description="[bold cyan]Parsing...", total=infile_length)
+            # Progress is measured in bytes of the in-file
+            task = p.add_task(
+                description="[bold cyan]Parsing...", total=datafile.stat().st_size, rows=0
+            )
             try:
-                with ParseEnricher(datafile, outfile, id_col) as enricher:
-                    for batch in yield_batches_of_texts(enricher, text_col, batch_size):
-                        # If necessary, pre-process the texts in the batch
-                        if clean_social:
-                            batch = preprocess(batch)
-
-                        # Write each text document's ID, parsed text, and CoNLL string
-                        for row, parsed_text, conll_string in parser.annotate(
-                            batch=batch, batch_size=batch_size
-                        ):
-                            enricher.writerow(
-                                row,  # row contains only ID column
-                                [
-                                    parsed_text,
-                                    conll_string,
-                                ],  # addendum contains parsed text and CoNLL string
+                with ParseEnricher(
+                    datafile,
+                    outfile,
+                    id_col,
+                    compression,
+                    compress_level,
+                    resume,
+                    output_format,
+                ) as enricher, DocBinWriter(
+                    docbin_outfile(outfile) if docbin else None,
+                    offset=resumed_docbin_offset(enricher, docbin),
+                ) as docbin_writer, parse_cache:
+                    # Skip the rows processed by a previous run
+                    processed_rows = enricher.resumed_rows
+                    p.update(
+                        task, completed=enricher.infile_position, rows=processed_rows
+                    )
+
+                    id_pos = enricher.headers[id_col]
+                    batches = metrics.timed(
+                        "read",
+                        yield_batches_of_texts(enricher, text_col, batch_size, budget),
+                    )
+                    # If necessary, pre-process the texts in the batch
+                    if clean_social:
+                        batches = preprocess_batches(batches, workers, metrics)
+
+                    annotated_batches = parser.annotate_batches(
+                        batches=batches, batch_size=batch_size, docbin=docbin
+                    )
+                    batch_start = time.perf_counter()
+                    for annotations, doc_bin in metrics.timed("parse", annotated_batches):
+                        with metrics.stage("write"):
+                            # Write each text document's ID, parsed text, and CoNLL string
+                            for row, parsed_text, conll_string in annotations:
+                                enricher.writerow(
+                                    row,  # row contains only ID column
+                                    [
+                                        parsed_text,
+                                        conll_string,
+                                    ],  # addendum contains parsed text and CoNLL string
+                                )
+
+                            # Save the batch's documents alongside their IDs
+                            if doc_bin:
+                                docbin_writer.write(
+                                    [row[id_pos] for row, _, _ in annotations], doc_bin
+                                )
+
+                            # Make the batch durable, so that at most one batch
+                            # is lost if the program is interrupted
+                            processed_rows += len(annotations)
+                            enricher.checkpoint(
+                                rows=processed_rows,
+                                docbin_offset=docbin_writer.checkpoint(),
                             )
-                            # After parsing one doc, advance the progress bar forward
-                            p.advance(task_id=task)
+                        metrics.count("docs", len(annotations))
+                        latency = time.perf_counter() - batch_start
+                        metrics.add_batch(latency)
+                        if max_memory:
+                            rss = current_rss_mb()
+                            if pool is not None:
+                                rss = max([rss, *pool.workers_rss.values()])
+                            budget.update(
+                                sum(len(text) for _, text, _ in annotations),
+                                latency,
+                                rss,
+                            )
+                        batch_start = time.perf_counter()
+                        # After parsing one batch, advance the progress bar forward
+                        p.update(
+                            task, completed=enricher.infile_position, rows=processed_rows
+                        )
+
+                    p.update(task, completed=enricher.infile_size)
 
             except KeyboardInterrupt:
                 print("\nKeyboard interrupted the program.")
-                compress_outfile(outfile)
-
+                interrupted = True
             else:
-                compress_outfile(outfile)
+                interrupted = False
+
+        report_metrics(metrics, profile, finished=not interrupted)
+        if cache:
+            print(
+                "Parse cache: {} of {} texts found ({:.1%} hit rate).".format(
+                    parse_cache.hits,
+                    parse_cache.hits + parse_cache.misses,
+                    parse_cache.hit_rate,
+                )
+            )
+        if interrupted:
+            raise typer.Exit(code=INTERRUPTED_EXIT_CODE)
+
+
+def report_metrics(metrics: Metrics, profile: bool, finished: bool):
+    metrics.save(finished=finished)
+    if profile:
+        metrics.print_summary()
+
+
+def resolve_output_format(
+    outfile: Path, output_format: OutputFormat | None
+) -> OutputFormat:
+    # Unless it's given, the format follows the out-file's suffix
+    if output_format is None:
+        if outfile.suffix == ".parquet":
+            return OutputFormat.parquet
+        return OutputFormat.csv
+    return output_format
+
+
+def check_resumable(resume: bool, output_format: OutputFormat):
+    # A Parquet file's footer is only written when it's closed, so an
+    # interrupted Parquet out-file can't be read, nor appended to
+    if resume and output_format == OutputFormat.parquet:
+        raise typer.BadParameter(
+            "Parquet out-files can't be resumed, use '--output-format csv'."
+        )
+
+
+def resumed_docbin_offset(enricher: "ParseEnricher", docbin: bool) -> int | None:
+    if not docbin or not enricher.resumed_rows:
+        return None
+    offset = enricher.resumed_state.get("docbin_offset")
+    if offset is None:
+        raise typer.BadParameter(
+            "The interrupted run has no checkpoint of its DocBin side-car file, "
+            "so it can't be resumed with '--docbin'."
+        )
+    return offset
 
 
 @app.command()
@@ -122,49 +428,499 @@ def match(
     conll_col: Annotated[
         str, typer.Option(help="CoNLL string column name")
     ] = "conll_string",
-    model: Annotated[ModelType, typer.Option(case_sensitive=False)] = ModelType.stanza,
     spacy_language: str = "en_core_web_lg",
-    lang: str = "en",
-    model_path: str = "",
+    workers: Annotated[
+        int, typer.Option(help="Number of matching processes", min=1)
+    ] = 1,
+    layout: Annotated[
+        MatchLayout,
+        typer.Option(
+            case_sensitive=False,
+            help="Out-file layout: one row per match, with columns for every pattern's nodes (wide), or one row per matched node (long)",
+        ),
+    ] = MatchLayout.wide,
+    docbin: Annotated[
+        Optional[Path],
+        typer.Option(
+            exists=True,
+            file_okay=True,
+            dir_okay=False,
+            readable=True,
+            resolve_path=True,
+            help="Side-car file written by 'parse --docbin', read instead of the CoNLL strings",
+        ),
+    ] = None,
+    compression: Annotated[
+        Compression, typer.Option(case_sensitive=False, help="Out-file compression")
+    ] = Compression.gzip,
+    compress_level: Annotated[
+        Optional[int], typer.Option(help="Compression level (default: 6 for gzip, 3 for zstd)")
+    ] = None,
+    output_format: Annotated[
+        Optional[OutputFormat],
+        typer.Option(
+            case_sensitive=False,
+            help="Out-file format: CSV, or columnar Parquet (requires pyarrow) [default: parquet if the out-file ends with '.parquet', csv otherwise]",
+        ),
+    ] = None,
+    resume: Annotated[
+        bool,
+        typer.Option(
+            "--resume", help="Continue an interrupted run, appending to its out-file"
+        ),
+    ] = False,
+    profile: Annotated[
+        bool,
+        typer.Option(
+            "--profile", help="Print the time spent in each stage at the end of the run"
+        ),
+    ] = False,
+    metrics_file: Annotated[
+        Optional[Path],
+        typer.Option(
+            dir_okay=False,
+            help="JSON file in which to save the time spent in each stage, throughput and memory",
+        ),
+    ] = None,
+    metrics_interval: Annotated[
+        float,
+        typer.Option(help="Seconds between snapshots of the metrics file", min=0),
+    ] = DEFAULT_METRICS_INTERVAL,
+    server: Annotated[
+        Optional[Path],
+        typer.Option(
+            dir_okay=False,
+            help="Unix socket of a 'keyfayqua serve' server that runs the job with its already loaded models",
+        ),
+    ] = None,
+    # Deprecated: the matches only need the vocabulary of --spacy-language
+    model: Annotated[Optional[str], typer.Option(hidden=True)] = None,
+    lang: Annotated[Optional[str], typer.Option(hidden=True)] = None,
+    model_path: Annotated[Optional[str], typer.Option(hidden=True)] = None,
 ):
-    torch.set_num_threads(1)
+    if model is not None or lang is not None or model_path is not None:
+        print(
+            "[yellow]'--model', '--lang' and '--model-path' are deprecated and ignored by match, which only loads the vocabulary of '--spacy-language'. They will be removed in the next release."
+        )
+    if server:
+        # Send the command's options, which are its only local variables yet
+        options = dict(locals())
+        del options["server"]
+        from src.cli.serve_command import submit_job
+
+        return submit_job(server, "match", options)
+
+    output_format = resolve_output_format(outfile, output_format)
+
+    from src.cli.match_command import (
+        LONG_COLUMNS,
+        MatchIndex,
+        MatcherPool,
+        MatchProgress,
+        conll_converter,
+        display_columns,
+        docbin_converter,
+        match_dependencies,
+        match_dependencies_long,
+        match_docs,
+    )
+    from src.cli.serve_command import RESIDENT_PARSERS
+    from src.parsers import ConLLParser, SemgrexMatcher, set_torch_threads
+    from src.utils.filesystem import MatchEnricher
+
+    check_resumable(resume, output_format)
+    if workers > 1 and docbin:
+        raise typer.BadParameter(
+            "The worker processes convert the CoNLL strings themselves, so '--workers' can't be combined with '--docbin'."
+        )
+    # Record the time spent in each stage, if requested
+    metrics = Metrics(profile, metrics_file, "match", metrics_interval)
+
     # STEP ONE --------------------------
-    # Set up the parsers
-    conll_parser = ConLLParser(spacy_language=spacy_language)
-    dep_parser = setup_parser(model, lang, model_path)
-    if dep_parser:
-        # STEP TWO --------------------------
-        # Parse the Semgrex patterns
-        semgrex = MatchIndex(file=matchfile)
+    # Set up the parsers, which worker processes load themselves
+    if workers == 1:
+        conll_parser = RESIDENT_PARSERS.get(
+            ("conll_parser", spacy_language),
+            lambda: ConLLParser(spacy_language=spacy_language),
+        )
+        set_torch_threads(1)
+        # The documents are already parsed, so the DependencyMatcher
+        # only needs the vocabulary of the CoNLL parser
+        dep_parser = SemgrexMatcher(conll_parser.vocab)
+
+    # STEP TWO --------------------------
+    # Parse the Semgrex patterns
+    semgrex = MatchIndex(file=matchfile)
+    if workers == 1:
         dep_parser.add_semgrex(semgrex.matches)
+    if layout == MatchLayout.long:
+        new_cols = LONG_COLUMNS
+        match_rows = match_dependencies_long
+    else:
         new_cols = list(semgrex.row_dict.keys())
-        display_columns(new_cols)
+        match_rows = match_dependencies
+    display_columns(new_cols)
 
-        # STEP THREE --------------------------
-        # Count the length of the in-file
-        infile_length = count_file_length(datafile)
+    # STEP THREE --------------------------
+    # Process the file
+    with MatchProgress as p:
+        # Progress is measured in bytes of the in-file
+        task = p.add_task(
+            description="[bold cyan]Matching...", total=datafile.stat().st_size, rows=0
+        )
+        try:
+            with MatchEnricher(
+                infile=datafile,
+                outfile=outfile,
+                id_col=id_col,
+                add_cols=new_cols,
+                compression=compression,
+                compress_level=compress_level,
+                resume=resume,
+                output_format=output_format,
+            ) as enricher:
+                # Skip the rows processed by a previous run
+                processed_rows = enricher.resumed_rows
+                p.update(task, completed=enricher.infile_position, rows=processed_rows)
 
-        # STEP FOUR --------------------------
-        # Process the file
-        with MatchProgress as p:
-            task = p.add_task(description="[bold cyan]Matching...", total=infile_length)
-            try:
-                with MatchEnricher(
-                    infile=datafile, outfile=outfile, id_col=id_col, add_cols=new_cols
-                ) as enricher:
-                    for row, doc in conll_converter(enricher, conll_col, conll_parser):
-                        for matches in match_dependencies(
-                            doc=doc, parser=dep_parser, match_index=semgrex
-                        ):
+                if workers > 1:
+                    # Each worker converts and matches chunks of CoNLL strings
+                    matched = MatcherPool(
+                        workers, spacy_language, matchfile, layout, metrics
+                    ).match(enricher, conll_col)
+                else:
+                    if docbin:
+                        docs = docbin_converter(
+                            enricher,
+                            id_col,
+                            docbin,
+                            conll_parser.vocab,
+                            skip=enricher.resumed_rows,
+                            match_index=semgrex,
+                            metrics=metrics,
+                        )
+                    else:
+                        docs = conll_converter(
+                            enricher,
+                            conll_col,
+                            conll_parser,
+                            match_index=semgrex,
+                            metrics=metrics,
+                        )
+                    # Documents that can't match any pattern are skipped
+                    matched = match_docs(docs, dep_parser, semgrex, match_rows, metrics)
+                batch_start = time.perf_counter()
+                for row, doc_matches in matched:
+                    with metrics.stage("write"):
+                        for matches in doc_matches:
                             enricher.writerow(row, matches)
-                        p.advance(task)
+                    metrics.count("docs")
+                    processed_rows += 1
+                    p.update(
+                        task, completed=enricher.infile_position, rows=processed_rows
+                    )
 
-            except KeyboardInterrupt:
-                print("\nKeyboard interrupted the program.")
-                compress_outfile(outfile)
+                    # Regularly make the matches durable
+                    if processed_rows % CHUNK_SIZE == 0:
+                        with metrics.stage("write"):
+                            enricher.checkpoint(rows=processed_rows)
+                        metrics.add_batch(time.perf_counter() - batch_start)
+                        batch_start = time.perf_counter()
 
-            else:
-                compress_outfile(outfile)
+                p.update(task, completed=enricher.infile_size)
+
+        except KeyboardInterrupt:
+            print("\nKeyboard interrupted the program.")
+            interrupted = True
+        else:
+            interrupted = False
+
+    report_metrics(metrics, profile, finished=not interrupted)
+    if interrupted:
+        raise typer.Exit(code=INTERRUPTED_EXIT_CODE)
+
+
+@app.command("parse-match")
+def parse_match(
+    datafile: Annotated[
+        Path,
+        typer.Option(
+            exists=True,
+            file_okay=True,
+            dir_okay=False,
+            writable=False,
+            readable=True,
+            resolve_path=True,
+        ),
+    ],
+    matchfile: Annotated[
+        Path,
+        typer.Option(
+            exists=True,
+            file_okay=True,
+            dir_okay=False,
+            writable=False,
+            readable=True,
+            resolve_path=True,
+            help="Name of JSON file in semgrex folder",
+        ),
+    ],
+    outfile: Annotated[Path, typer.Option(help="Path to file with dependency matches")],
+    id_col: Annotated[str, typer.Option(help="ID column name")] = "id",
+    text_col: Annotated[str, typer.Option(help="Text column name")] = "text",
+    model: Annotated[ModelType, typer.Option(case_sensitive=False)] = ModelType.spacy,
+    lang: str = "en",
+    model_path: str = "",
+    clean_social: Annotated[bool, typer.Option("--clean-social")] = False,
+    batch_size: int = CHUNK_SIZE,
+    offline: Annotated[
+        bool,
+        typer.Option(
+            "--offline",
+            help="Never connect to the internet: the models must already be downloaded",
+        ),
+    ] = False,
+    layout: Annotated[
+        MatchLayout,
+        typer.Option(
+            case_sensitive=False,
+            help="Out-file layout: one row per match, with columns for every pattern's nodes (wide), or one row per matched node (long)",
+        ),
+    ] = MatchLayout.wide,
+    conll_outfile: Annotated[
+        Optional[Path],
+        typer.Option(
+            dir_okay=False,
+            help="Path to file in which to also write the parsed texts and CoNLL strings, as parse does",
+        ),
+    ] = None,
+    compression: Annotated[
+        Compression, typer.Option(case_sensitive=False, help="Out-file compression")
+    ] = Compression.gzip,
+    compress_level: Annotated[
+        Optional[int], typer.Option(help="Compression level (default: 6 for gzip, 3 for zstd)")
+    ] = None,
+    output_format: Annotated[
+        Optional[OutputFormat],
+        typer.Option(
+            case_sensitive=False,
+            help="Out-file format: CSV, or columnar Parquet (requires pyarrow) [default: parquet if the out-file ends with '.parquet', csv otherwise]",
+        ),
+    ] = None,
+    profile: Annotated[
+        bool,
+        typer.Option(
+            "--profile", help="Print the time spent in each stage at the end of the run"
+        ),
+    ] = False,
+    metrics_file: Annotated[
+        Optional[Path],
+        typer.Option(
+            dir_okay=False,
+            help="JSON file in which to save the time spent in each stage, throughput and memory",
+        ),
+    ] = None,
+    metrics_interval: Annotated[
+        float,
+        typer.Option(help="Seconds between snapshots of the metrics file", min=0),
+    ] = DEFAULT_METRICS_INTERVAL,
+    server: Annotated[
+        Optional[Path],
+        typer.Option(
+            dir_okay=False,
+            help="Unix socket of a 'keyfayqua serve' server that runs the job with its already loaded models",
+        ),
+    ] = None,
+):
+    if server:
+        # Send the command's options, which are its only local variables yet
+        options = dict(locals())
+        del options["server"]
+        from src.cli.serve_command import submit_job
+
+        return submit_job(server, "parse-match", options)
+
+    output_format = resolve_output_format(outfile, output_format)
+
+    from src.cli.match_command import (
+        LONG_COLUMNS,
+        MATCH_ATTR_NEEDS,
+        MatchIndex,
+        display_columns,
+        match_dependencies,
+        match_dependencies_long,
+    )
+    from src.cli.parse_command import (
+        ParseProgress,
+        preprocess_batches,
+        yield_batches_of_texts,
+    )
+    from src.cli.serve_command import RESIDENT_PARSERS
+    from src.parsers import (
+        SemgrexMatcher,
+        confirm_hopsparser_model_path,
+        label_roots,
+        pattern_needs,
+        set_torch_threads,
+        setup_parser,
+    )
+    from src.utils.filesystem import MatchEnricher, TableWriter, compressed_outfile
+
+    # Record the time spent in each stage, if requested
+    metrics = Metrics(profile, metrics_file, "parse-match", metrics_interval)
+
+    # STEP ONE --------------------------
+    # Parse the Semgrex patterns
+    semgrex = MatchIndex(file=matchfile)
+    if layout == MatchLayout.long:
+        new_cols = LONG_COLUMNS
+        match_rows = match_dependencies_long
+    else:
+        new_cols = list(semgrex.row_dict.keys())
+        match_rows = match_dependencies
+    display_columns(new_cols)
+
+    # Unless the CoNLL strings are written too, only parse the token
+    # attributes that the patterns and the match columns need
+    needed = None
+    if conll_outfile is None:
+        patterns_needed = pattern_needs(semgrex.matches)
+        if patterns_needed is not None:
+            needed = patterns_needed | MATCH_ATTR_NEEDS
+
+    # STEP TWO --------------------------
+    # Set up the Parser
+    print("Setting up parser...")
+    if model == ModelType.hop:
+        # A server can't prompt the user, who waits for the job elsewhere
+        model_path = confirm_hopsparser_model_path(
+            model_path, offline, interactive=not RESIDENT_PARSERS.enabled
+        )
+    # A server keeps the parser loaded for its next jobs
+    needed_key = None if needed is None else tuple(sorted(needed))
+    parser = RESIDENT_PARSERS.get(
+        ("parser", model, lang, model_path, needed_key, offline),
+        lambda: setup_parser(model, lang, model_path, needed, offline),
+    )
+    if not parser:
+        return
+    parser.metrics = metrics
+    set_torch_threads(2)
+    # The parsed documents are matched on the parser's own vocabulary
+    dep_parser = SemgrexMatcher(parser.nlp.vocab)
+    dep_parser.add_semgrex(semgrex.matches)
+
+    # STEP THREE --------------------------
+    # Parse the texts and match the parsed documents right away
+    with ParseProgress as p:
+        # Progress is measured in bytes of the in-file
+        task = p.add_task(
+            description="[bold cyan]Parsing and matching...",
+            total=datafile.stat().st_size,
+            rows=0,
+        )
+        try:
+            with MatchEnricher(
+                infile=datafile,
+                outfile=outfile,
+                id_col=id_col,
+                add_cols=new_cols,
+                compression=compression,
+                compress_level=compress_level,
+                output_format=output_format,
+            ) as enricher, TableWriter(
+                compressed_outfile(conll_outfile, compression, output_format)
+                if conll_outfile
+                else None,
+                [id_col, "parsed_text", "conll_string"],
+                compression,
+                compress_level,
+                output_format,
+            ) as conll_writer:
+                processed_rows = 0
+                id_pos = enricher.headers[id_col]
+                batches = metrics.timed(
+                    "read", yield_batches_of_texts(enricher, text_col, batch_size)
+                )
+                # If necessary, pre-process the texts in the batch
+                if clean_social:
+                    batches = preprocess_batches(batches, metrics=metrics)
+
+                batch_start = time.perf_counter()
+                for batch in batches:
+                    for doc, row in parser.parse_docs(batch, batch_size):
+                        if conll_outfile:
+                            conll_string = parser.to_conll(doc)
+                            with metrics.stage("write"):
+                                conll_writer.writerow(
+                                    [row[id_pos], doc.text, conll_string]
+                                )
+                        # Match the document as if it was read from its
+                        # CoNLL string, skipping it if it can't match
+                        label_roots(doc)
+                        with metrics.stage("prefilter"):
+                            could_match = semgrex.could_match_doc(doc)
+                        if not could_match:
+                            continue
+                        with metrics.stage("match_rows"):
+                            doc_matches = list(
+                                match_rows(
+                                    doc=doc,
+                                    parser=dep_parser,
+                                    match_index=semgrex,
+                                    metrics=metrics,
+                                )
+                            )
+                        with metrics.stage("write"):
+                            for matches in doc_matches:
+                                enricher.writerow(row, matches)
+
+                    processed_rows += len(batch)
+                    metrics.count("docs", len(batch))
+                    metrics.add_batch(time.perf_counter() - batch_start)
+                    batch_start = time.perf_counter()
+                    p.update(
+                        task, completed=enricher.infile_position, rows=processed_rows
+                    )
+
+                p.update(task, completed=enricher.infile_size)
+
+        except KeyboardInterrupt:
+            print("\nKeyboard interrupted the program.")
+            interrupted = True
+        else:
+            interrupted = False
+
+    report_metrics(metrics, profile, finished=not interrupted)
+    if interrupted:
+        raise typer.Exit(code=INTERRUPTED_EXIT_CODE)
+
+
+@app.command()
+def serve(
+    socket: Annotated[
+        Path,
+        typer.Option(
+            dir_okay=False, help="Path of the Unix socket on which to wait for jobs"
+        ),
+    ],
+    max_parsers: Annotated[
+        int,
+        typer.Option(
+            help="Number of parsers kept loaded, beyond which the least recently used is dropped",
+            min=1,
+        ),
+    ] = DEFAULT_MAX_PARSERS,
+):
+    from src.cli.serve_command import serve as serve_jobs
+
+    # Jobs sent with '--server' run these commands, with the parsers
+    # loaded by the previous jobs
+    serve_jobs(
+        socket,
+        {"parse": parse, "match": match, "parse-match": parse_match},
+        max_parsers,
+    )
 
 
 @app.command("test-conll")
@@ -185,6 +941,8 @@ def test_conll(
         str, typer.Option(help="CoNLL string column name")
     ] = "conll_string",
 ):
+    from src.cli.test_conll import parse_conll_string
+
     parse_conll_string(datafile=datafile, conll_string_col=conll_col)
 
 
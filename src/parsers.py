@@ -1,27 +1,129 @@
-print("importing NLP models...")
+import hashlib
+import json
+import os
 import subprocess
+import sys
+from importlib.metadata import PackageNotFoundError, version
 from pathlib import Path
 from typing import Generator, Iterable, Tuple
 
+import numpy
 import spacy
-import spacy_stanza
-import stanza
 import typer
-from hopsparser import spacy_component
+from spacy.attrs import LEMMA, MORPH, POS, TAG
 from spacy.matcher import DependencyMatcher
+from spacy.tokens import DocBin
 from spacy.tokens.doc import Doc
-from spacy_conll import init_parser
-from spacy_conll.parser import ConllParser as SpacyConllParse
+from spacy.vocab import Vocab
 
 from src.constants import (
     DEFAULT_HOPSPARSER_MODEL_NAME,
     DEFAULT_HOPSPARSER_MODEL_URI,
     ModelType,
 )
-from src.exceptions import SpacyDownloadException, StanzaDownloadException
+from src.exceptions import (
+    SpacyDownloadException,
+    StanzaDownloadException,
+    StanzaModelsMissingException,
+)
+from src.utils.conll import CONLL_WRITER_VERSION, conll_to_doc, doc_to_conll
+from src.utils.metrics import Metrics
+
+# Token attributes whose pipeline components can be left out of parse, as
+# named in Semgrex patterns. Dependencies are always parsed.
+PRUNABLE_ATTRIBUTES = ["LEMMA", "POS", "TAG", "MORPH", "ENT_TYPE"]
+
+# Pattern attributes that only need the tokenizer, or the dependency parser
+UNPRUNED_ATTRIBUTES = {
+    "ORTH",
+    "TEXT",
+    "NORM",
+    "LOWER",
+    "LENGTH",
+    "SHAPE",
+    "PREFIX",
+    "SUFFIX",
+    "SPACY",
+    "DEP",
+    "SENT_START",
+}
+
+# SpaCy pipeline components and the attributes that need them. Rule-based
+# lemmatizers read the POS tags, so the lemmas also need the taggers.
+# Other components (tok2vec, transformer, parser...) are always kept.
+COMPONENT_ATTRIBUTES = {
+    "tagger": {"TAG", "POS", "LEMMA"},
+    "morphologizer": {"POS", "MORPH", "LEMMA"},
+    "attribute_ruler": {"TAG", "POS", "LEMMA"},
+    "lemmatizer": {"LEMMA"},
+    "trainable_lemmatizer": {"LEMMA"},
+    "ner": {"ENT_TYPE"},
+    "entity_ruler": {"ENT_TYPE"},
+}
+
+# CoNLL-U fields of the token attributes, as named by the CoNLL formatter
+CONLL_FIELDS = {"LEMMA": "LEMMA", "POS": "UPOS", "TAG": "XPOS"}
+
+# SpaCy attribute IDs of the token attributes, to clear them in bulk
+ATTRIBUTE_IDS = {"LEMMA": LEMMA, "POS": POS, "TAG": TAG, "MORPH": MORPH}
+
+
+def parse_needs(needs: str) -> set[str]:
+    """
+    Read a comma-separated list of the token attributes that have to be
+    parsed, like 'POS,DEP,LEMMA'.
+    """
+    attributes = {a.strip().upper() for a in needs.split(",") if a.strip()}
+    unknown = attributes - set(PRUNABLE_ATTRIBUTES) - {"DEP"}
+    if unknown:
+        raise typer.BadParameter(
+            "Unknown attributes: {}. Choose among {}.".format(
+                ", ".join(sorted(unknown)), ", ".join(PRUNABLE_ATTRIBUTES + ["DEP"])
+            )
+        )
+    return attributes & set(PRUNABLE_ATTRIBUTES)
+
+
+def pattern_needs(patterns: dict) -> set[str] | None:
+    """
+    Return the token attributes that Semgrex patterns match on, or None if
+    they use attributes, like custom extensions, whose needs are unknown.
+    """
+    attributes = set()
+    for pattern in patterns.values():
+        for node in pattern:
+            for attribute in node.get("RIGHT_ATTRS", {}):
+                attribute = attribute.upper()
+                if attribute.startswith("ENT_"):
+                    attributes.add("ENT_TYPE")
+                elif attribute in PRUNABLE_ATTRIBUTES:
+                    attributes.add(attribute)
+                elif not (
+                    attribute in UNPRUNED_ATTRIBUTES
+                    or attribute.startswith("IS_")
+                    or attribute.startswith("LIKE_")
+                ):
+                    return None
+    return attributes
+
+
+def label_roots(doc: Doc):
+    """
+    Label roots like the CoNLL reader does, so that patterns match the same
+    way on parsed documents and on documents read from CoNLL strings.
+    """
+    for token in doc:
+        if token.dep_ == "root":
+            token.dep_ = "ROOT"
 
 
-def setup_parser(model_type: ModelType, lang: str, model_path: str):
+def setup_parser(
+    model_type: ModelType,
+    lang: str,
+    model_path: str,
+    needs: set[str] | None = None,
+    offline: bool = False,
+):
     # List the models that are supported SpaCy parsers
     spacy_parsers = [ModelType.stanza, ModelType.hop, ModelType.spacy]
 
@@ -30,9 +132,9 @@ def setup_parser(model_type: ModelType, lang: str, model_path: str):
     if model_type in spacy_parsers:
         # If using spacy-hopsparser, get the model path
         if model_type == "hopsparser":
-            model_path = confirm_hopsparser_model_path(model_path)
+            model_path = confirm_hopsparser_model_path(model_path, offline)
         # Return an instance of the SpacyParser
-        return SpacyParser(model_type, lang, model_path)
+        return SpacyParser(model_type, lang, model_path, needs, offline)
 
     # Otherwise, return the default parser, which is SpaCy English
     else:
@@ -44,13 +146,25 @@ def setup_parser(model_type: ModelType, lang: str, model_path: str):
             "\nDo you want to use SpaCy's English parser?", abort=True
         )
         if use_default:
-            return SpacyParser(ModelType.spacy, "en")
+            return SpacyParser(ModelType.spacy, "en", needs=needs, offline=offline)
 
 
-def confirm_hopsparser_model_path(model_path: str):
+def confirm_hopsparser_model_path(
+    model_path: str, offline: bool = False, interactive: bool = True
+):
     # If the user provided a model path in the command, use that
     if model_path != "":
         return model_path
+    # The model can't be downloaded offline
+    elif offline:
+        raise typer.BadParameter(
+            "Give the path of the downloaded Hopsparser model with '--model-path' when running offline."
+        )
+    # Nor can the user be asked about it
+    elif not interactive:
+        raise typer.BadParameter(
+            "Give the path of the downloaded Hopsparser model with '--model-path' when sending a job to a server."
+        )
     # Otherwise, ask them about the Hopsparser model they want to use
     else:
         need_to_download = typer.confirm(
@@ -88,23 +202,190 @@ def confirm_hopsparser_model_path(model_path: str):
             )
 
 
+def stanza_models_present(lang: str, processors: str, model_dir: str | None = None) -> bool:
+    """
+    Tell whether the default models of the given Stanza processors, and the
+    models they depend on (pretrained embeddings, character language
+    models), are already in Stanza's resources directory, according to the
+    resources.json manifest saved there by a previous download.
+    """
+    if model_dir is None:
+        from stanza.resources.common import DEFAULT_MODEL_DIR
+
+        model_dir = DEFAULT_MODEL_DIR
+    manifest = Path(model_dir).joinpath("resources.json")
+    if not manifest.exists():
+        return False
+    with open(manifest) as f:
+        resources = json.load(f)
+
+    lang_resources = resources.get(lang, {})
+    if "alias" in lang_resources:
+        lang = lang_resources["alias"]
+        lang_resources = resources.get(lang, {})
+    default_processors = lang_resources.get("default_processors", {})
+
+    wanted = processors.split(",")
+    # Stanza adds the multi-word token expander of the languages that have one
+    if "tokenize" in wanted and "mwt" in default_processors:
+        wanted.append("mwt")
+    for processor in wanted:
+        package = default_processors.get(processor)
+        if package is None:
+            return False
+        models = [(processor, package)] + [
+            (dependency["model"], dependency["package"])
+            for dependency in lang_resources.get(processor, {})
+            .get(package, {})
+            .get("dependencies", [])
+        ]
+        for model, model_package in models:
+            if not Path(model_dir, lang, model, model_package + ".pt").exists():
+                return False
+    return True
+
+
+def stanza_processors(needs: set[str]) -> str:
+    # Stanza's dependency parser needs the POS tags and lemmas
+    processors = "tokenize,pos,lemma,depparse"
+    if "ENT_TYPE" in needs:
+        processors += ",ner"
+    return processors
+
+
+def ensure_stanza_models(lang: str, processors: str, offline: bool = False):
+    """
+    Download the models of the given Stanza processors, and the manifest of
+    the available models, unless they're already on disk.
+    """
+    if stanza_models_present(lang, processors):
+        return
+    if offline:
+        raise StanzaModelsMissingException(lang, processors)
+    import stanza
+
+    try:
+        stanza.download(lang, processors=processors)
+    except Exception as e:
+        raise StanzaDownloadException(e, lang)
+
+
+def set_torch_threads(threads: int):
+    """
+    Set the number of threads Torch uses, if a model has already imported it.
+    """
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(threads)
+
+
+def stanza_resources_version(model_dir: str | None = None) -> str | None:
+    """
+    Hash the resources.json manifest of Stanza's resources directory, which
+    lists the checksums of the downloaded models, so that it changes when
+    other models are downloaded.
+    """
+    if model_dir is None:
+        from stanza.resources.common import DEFAULT_MODEL_DIR
+
+        model_dir = DEFAULT_MODEL_DIR
+    manifest = Path(model_dir).joinpath("resources.json")
+    if not manifest.exists():
+        return None
+    return hashlib.sha256(manifest.read_bytes()).hexdigest()
+
+
+def parser_fingerprint(
+    model_type: ModelType,
+    lang: str,
+    model_path: str = "",
+    needs: set[str] | None = None,
+) -> str:
+    """
+    Describe a parser's configuration and the versions of the packages and
+    models it depends on, so that cached annotations are only reused for
+    the same parser.
+    """
+
+    def package_version(name: str) -> str | None:
+        try:
+            return version(name)
+        except PackageNotFoundError:
+            return None
+
+    if model_type == ModelType.stanza:
+        model_version = "{}+{}".format(
+            package_version("stanza"), stanza_resources_version()
+        )
+    elif Path(lang).is_dir():
+        model_version = spacy.util.get_model_meta(lang).get("version")
+    else:
+        model_version = spacy.util.get_package_version(lang)
+
+    return json.dumps(
+        {
+            "model_type": ModelType(model_type).value,
+            "lang": lang,
+            "model_version": model_version,
+            "model_path": str(Path(model_path).resolve()) if model_path else "",
+            "needs": sorted(needs) if needs is not None else None,
+            "conll_writer": CONLL_WRITER_VERSION,
+            "packages": {
+                name: package_version(name)
+                for name in ["spacy", "spacy-conll", "spacy-stanza", "hopsparser"]
+            },
+        },
+        sort_keys=True,
+    )
+
+
 class SpacyParser:
-    def __init__(self, model_type: ModelType, lang: str, model_path: str = "") -> None:
+    def __init__(
+        self,
+        model_type: ModelType,
+        lang: str,
+        model_path: str = "",
+        needs: set[str] | None = None,
+        offline: bool = False,
+        download: bool = True,
+    ) -> None:
+        # Leave out the components of the attributes that aren't needed,
+        # and clear those attributes in case another component set them
+        self.needs = set(PRUNABLE_ATTRIBUTES) if needs is None else set(needs)
+        self.pruned = [a for a in PRUNABLE_ATTRIBUTES if a not in self.needs]
+        exclude = [
+            name
+            for name, attributes in COMPONENT_ATTRIBUTES.items()
+            if not attributes & self.needs
+        ]
+
+        # Hugging Face's libraries, which load Hopsparser's transformer
+        # models, read these variables when they're imported
+        if offline:
+            os.environ["HF_HUB_OFFLINE"] = "1"
+            os.environ["TRANSFORMERS_OFFLINE"] = "1"
+
         # Set up the SpaCy pipeline
 
+        # Each model/plug-in's packages (and Torch) are slow to import,
+        # so only import those of the selected model
+
         # Depending on the model/plug-in, setup the pipeline
         if model_type == "stanza":
-            try:
-                stanza.download(lang, processors="tokenize,pos,lemma,depparse,ner")
-            except Exception as e:
-                raise StanzaDownloadException(e, lang)
+            import spacy_stanza
+            from stanza.resources.common import DownloadMethod
+
+            processors = stanza_processors(self.needs)
+            ensure_stanza_models(lang, processors, offline or not download)
             self.nlp = spacy_stanza.load_pipeline(
-                lang,
-                processors="tokenize,pos,lemma,depparse,ner",
+                lang, processors=processors, download_method=DownloadMethod.NONE
             )
         elif model_type == "hopsparser":
+            # Registers the hopsparser pipe
+            from hopsparser import spacy_component  # noqa: F401
+
             try:
-                self.nlp = spacy.load(lang)
+                self.nlp = spacy.load(lang, exclude=exclude)
             except OSError as e:
                 raise SpacyDownloadException(e, lang)
             self.nlp.add_pipe(
@@ -112,18 +393,23 @@ class SpacyParser:
             )
         elif model_type == "spacy":
             try:
-                self.nlp = spacy.load(lang)
+                self.nlp = spacy.load(lang, exclude=exclude)
             except OSError as e:
                 raise SpacyDownloadException(e, lang)
         else:
             self.nlp = spacy.load("en")
 
-        # Add the CoNLL formatter
-        self.nlp.add_pipe("conll_formatter", last=True)
+        # The cleared attributes are written as '_' in the CoNLL strings
+        self.conversion_maps = {
+            CONLL_FIELDS[a]: {"": "_"} for a in self.pruned if a in CONLL_FIELDS
+        }
 
         # Attach the DependencyMater
         self.matcher = DependencyMatcher(self.nlp.vocab)
 
+        # Disabled unless the command is profiled
+        self.metrics = Metrics()
+
     def annotate(
         self, batch: Iterable[Tuple[str, list]], batch_size: int
     ) -> Generator[Tuple[list[str], str, str], None, None]:
@@ -131,8 +417,83 @@ class SpacyParser:
         Feed batches of tuples (text, CSV row) to a SpaCy pipeline and return 3
         components disentangled: the CSV row, the parsed text, the CoNLL string.
         """
-        for doc, context in self.nlp.pipe(batch, as_tuples=True, batch_size=batch_size):
-            yield context, doc.text, doc._.conll_str
+        for doc, context in self.parse_docs(batch, batch_size):
+            yield context, doc.text, self.to_conll(doc)
+
+    def annotate_batch(
+        self, batch: Iterable[Tuple[str, list]], batch_size: int, docbin: bool = False
+    ) -> Tuple[list[Tuple[list[str], str, str]], bytes | None]:
+        """
+        Annotate a whole batch of tuples (text, CSV row) and return the list of
+        (CSV row, parsed text, CoNLL string) tuples. If requested, also return
+        the batch's parsed documents serialized as a DocBin.
+        """
+        annotations = []
+        doc_bin = DocBin() if docbin else None
+        for doc, context in self.parse_docs(batch, batch_size):
+            annotations.append((context, doc.text, self.to_conll(doc)))
+            if doc_bin is not None:
+                label_roots(doc)
+                doc_bin.add(doc)
+        return annotations, doc_bin.to_bytes() if doc_bin is not None else None
+
+    def parse_docs(
+        self, batch: Iterable[Tuple[str, list]], batch_size: int
+    ) -> Generator[Tuple[Doc, list], None, None]:
+        """
+        Parse a batch of tuples (text, CSV row) and yield each parsed document
+        along with its row. The documents' attributes that weren't needed are
+        cleared.
+        """
+        docs = self.nlp.pipe(batch, as_tuples=True, batch_size=batch_size)
+        for doc, context in self.metrics.timed("nlp.pipe", docs):
+            if self.pruned:
+                self.clear_pruned(doc)
+            self.metrics.count("tokens", len(doc))
+            yield doc, context
+
+    def to_conll(self, doc: Doc) -> str:
+        """Serialize a parsed document as a CoNLL-U string."""
+        with self.metrics.stage("doc_to_conll"):
+            return doc_to_conll(doc, self.conversion_maps)
+
+    def clear_pruned(self, doc: Doc):
+        """
+        Clear the attributes that weren't needed, which components kept for
+        other attributes may still have set.
+        """
+        attr_ids = [ATTRIBUTE_IDS[a] for a in self.pruned if a in ATTRIBUTE_IDS]
+        if attr_ids:
+            doc.from_array(
+                attr_ids, numpy.zeros((len(doc), len(attr_ids)), dtype="uint64")
+            )
+        if "ENT_TYPE" in self.pruned:
+            doc.set_ents([], default="missing")
+
+    def annotate_batches(
+        self,
+        batches: Iterable[Iterable[Tuple[str, list]]],
+        batch_size: int,
+        docbin: bool = False,
+    ) -> Generator[Tuple[list[Tuple[list[str], str, str]], bytes | None], None, None]:
+        """
+        Annotate successive batches of tuples (text, CSV row) in this process.
+        """
+        for batch in batches:
+            yield self.annotate_batch(batch=batch, batch_size=batch_size, docbin=docbin)
+
+    def add_semgrex(self, patterns: dict):
+        self.patterns = patterns
+        for pattern_name, pattern in patterns.items():
+            self.matcher.add(pattern_name, [pattern])
+
+
+class SemgrexMatcher:
+    def __init__(self, vocab: Vocab) -> None:
+        # Matching only needs the vocabulary of the parsed documents,
+        # not a dependency parser's pipeline
+        self.vocab = vocab
+        self.matcher = DependencyMatcher(vocab)
 
     def add_semgrex(self, patterns: dict):
         self.patterns = patterns
@@ -145,10 +506,31 @@ class BaseUDPipeParser:
         pass
 
 
+def model_components(spacy_language: str) -> list[str]:
+    """
+    Names of the components of a SpaCy model, read from its meta.json
+    without loading the model.
+    """
+    if spacy_language.startswith("blank:"):
+        return []
+    if spacy.util.is_package(spacy_language):
+        path = spacy.util.get_package_path(spacy_language)
+    else:
+        path = Path(spacy_language)
+    meta_path = path.joinpath("meta.json")
+    # Let spacy.load raise its own error about a missing model
+    if not meta_path.exists():
+        return []
+    meta = spacy.util.load_meta(meta_path)
+    return meta.get("components", meta.get("pipeline", []))
+
+
 class ConLLParser:
     def __init__(self, spacy_language: str) -> None:
-        # Load language
-        self.nlp = SpacyConllParse(init_parser(spacy_language, "spacy"))
+        # Only the language's vocabulary is needed to rebuild documents
+        # from CoNLL strings, so leave out every component of the model
+        self.nlp = spacy.load(spacy_language, exclude=model_components(spacy_language))
+        self.vocab = self.nlp.vocab
 
     def __call__(self, text: str) -> Doc:
-        return self.nlp.parse_conll_text_as_spacy(text=text)
+        return conll_to_doc(self.vocab, text)
@@ -0,0 +1,128 @@
+import hashlib
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable, Tuple
+
+# Default size cap of the cache, in megabytes
+DEFAULT_CACHE_SIZE = 1024
+
+
+class ParseCache:
+    """
+    On-disk SQLite cache of parsed texts, addressed by a hash of the text
+    and of the parser's fingerprint (model type, language, model path and
+    versions). Each entry stores the parsed text, the CoNLL string and,
+    optionally, the document serialized as a DocBin. When the stored entries
+    exceed the size cap, the least recently used ones are evicted.
+    """
+
+    def __init__(
+        self, path: Path, fingerprint: str, max_size: int = DEFAULT_CACHE_SIZE
+    ) -> None:
+        self.path = path
+        self.fingerprint = fingerprint
+        self.max_bytes = max_size * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                parsed_text TEXT NOT NULL,
+                conll_string TEXT NOT NULL,
+                docbin BLOB,
+                size INTEGER NOT NULL,
+                last_used INTEGER NOT NULL
+            )"""
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)"
+        )
+        self.connection.commit()
+        (total,) = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        self.total_bytes = total
+        return self
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(
+            "{}\0{}".format(self.fingerprint, text).encode("utf-8")
+        ).hexdigest()
+
+    def get_many(
+        self, keys: Iterable[str], docbin: bool = False
+    ) -> dict[str, Tuple[str, str, bytes | None]]:
+        """
+        Return the entries found for the given keys, as a dictionary of
+        (parsed text, CoNLL string, DocBin bytes) tuples. When the documents
+        are requested, entries saved without them don't count as found.
+        """
+        keys = list(set(keys))
+        found = {}
+        # Stay under SQLite's limit on the number of query parameters
+        for i in range(0, len(keys), 500):
+            chunk = keys[i : i + 500]
+            query = "SELECT key, parsed_text, conll_string, docbin FROM entries WHERE key IN ({})".format(
+                ",".join("?" * len(chunk))
+            )
+            for key, parsed_text, conll_string, doc in self.connection.execute(
+                query, chunk
+            ):
+                if docbin and doc is None:
+                    continue
+                found[key] = (parsed_text, conll_string, doc)
+        if found:
+            now = time.time_ns()
+            self.connection.executemany(
+                "UPDATE entries SET last_used = ? WHERE key = ?",
+                [(now, key) for key in found],
+            )
+        return found
+
+    def put_many(self, entries: Iterable[Tuple[str, str, str, bytes | None]]):
+        """
+        Save (key, parsed text, CoNLL string, DocBin bytes) entries and
+        evict the least recently used entries if the cache is too large.
+        """
+        now = time.time_ns()
+        rows = []
+        for key, parsed_text, conll_string, doc in entries:
+            size = len(parsed_text.encode()) + len(conll_string.encode())
+            size += len(doc) if doc else 0
+            rows.append((key, parsed_text, conll_string, doc, size, now))
+        for key, *_ in rows:
+            (previous,) = self.connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            self.total_bytes -= previous
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)", rows
+        )
+        self.total_bytes += sum(row[4] for row in rows)
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+        self.connection.commit()
+
+    def _evict(self):
+        evicted = []
+        for key, size in self.connection.execute(
+            "SELECT key, size FROM entries ORDER BY last_used"
+        ):
+            if self.total_bytes <= self.max_bytes:
+                break
+            evicted.append((key,))
+            self.total_bytes -= size
+        self.connection.executemany("DELETE FROM entries WHERE key = ?", evicted)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.connection.commit()
+        self.connection.close()
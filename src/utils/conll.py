@@ -0,0 +1,216 @@
+import re
+
+import numpy
+from spacy.attrs import (
+    DEP,
+    ENT_IOB,
+    ENT_TYPE,
+    HEAD,
+    LEMMA,
+    MORPH,
+    ORTH,
+    POS,
+    SENT_START,
+    SPACY,
+    TAG,
+)
+from spacy.tokens.doc import Doc
+from spacy.training.iob_utils import biluo_to_iob, iob_to_biluo
+from spacy.vocab import Vocab
+
+# Entity tags in the MISC field, as read by spacy_conll
+NER_TAG_RE = re.compile(r"^((?:name|NE)=)?([BILU])-([A-Z_]+)|O$")
+
+
+def conll_to_doc(vocab: Vocab, text: str) -> Doc:
+    """
+    Convert a CoNLL-U string into a SpaCy Doc with a single call to the Doc
+    constructor, whatever the number of sentences in the string.
+
+    The Doc has the same words, spaces, tags, lemmas, dependencies, entities and
+    sentence boundaries as the one returned by spacy_conll's
+    parse_conll_text_as_spacy, and invalid strings raise the same errors.
+    The CoNLL custom extensions (conll_str, conll_misc_field, etc.) are not set.
+    Unlike spacy_conll, an unspecified UPOS ('_', as written by 'parse --needs'
+    when the POS tags aren't needed) is read as no POS instead of raising.
+    """
+    words, spaces, tags, poses, morphs, lemmas = [], [], [], [], [], []
+    heads, deps, ents, sent_starts = [], [], [], []
+
+    for chunk in text.split("\n\n"):
+        lines = [l for l in chunk.splitlines() if l and not l.startswith("#")]
+        if not lines:
+            raise_unexpected_format()
+
+        # Adjacent sentences are separated by a space, as with Doc.from_docs
+        if words and not spaces[-1] and not words[-1].isspace():
+            spaces[-1] = True
+
+        # Sentence-level token indices are offset by the tokens already read
+        offset = len(words)
+        sent_starts.append(offset)
+        chunk_iob = []
+        for line in lines:
+            parts = line.split("\t")
+
+            if any(not p for p in parts):
+                raise ValueError(
+                    "According to the CoNLL-U Format, fields cannot be empty. See"
+                    " https://universaldependencies.org/format.html"
+                )
+
+            id_, word, lemma, pos, tag, morph, head, dep, deps_graph, misc = parts
+
+            if any(" " in f for f in (id_, pos, tag, morph, head, dep, deps_graph)):
+                raise ValueError(
+                    "According to the CoNLL-U Format, only FORM, LEMMA, and MISC fields can contain"
+                    " spaces. See https://universaldependencies.org/format.html"
+                )
+
+            if "." in id_ or "-" in id_:
+                raise NotImplementedError(
+                    "Multi-word tokens and empty nodes are not supported in spacy_conll"
+                )
+
+            words.append(word)
+            spaces.append("SpaceAfter=No" not in misc)
+            lemmas.append(lemma)
+            poses.append("" if pos == "_" else pos)
+            tags.append(poses[-1] if tag == "_" else tag)
+            morphs.append(morph if morph != "_" else "")
+            heads.append(
+                int(head) - 1 + offset
+                if head not in ("0", "_")
+                else int(id_) - 1 + offset
+            )
+            deps.append("ROOT" if dep == "root" else dep)
+            chunk_iob.append(misc_to_iob(misc) if misc != "_" else "O")
+
+        # Entities are validated and normalized sentence by sentence
+        if any(iob != "O" for iob in chunk_iob):
+            chunk_iob = biluo_to_iob(iob_to_biluo(chunk_iob))
+        ents.extend(chunk_iob)
+
+    doc = Doc(
+        vocab,
+        words=words,
+        spaces=spaces,
+        tags=tags,
+        pos=poses,
+        morphs=morphs,
+        lemmas=lemmas,
+        heads=heads,
+        deps=deps,
+        ents=ents,
+    )
+
+    # The deprel relations must make each CoNLL chunk exactly one sentence
+    expected = numpy.zeros(len(doc), dtype=bool)
+    expected[sent_starts] = True
+    if not numpy.array_equal(doc.to_array(SENT_START) == 1, expected):
+        raise_unexpected_format()
+
+    return doc
+
+
+# Version of the CoNLL strings written by doc_to_conll, so that the parse
+# cache doesn't reuse strings written differently
+CONLL_WRITER_VERSION = 2
+
+# CoNLL-U fields that doc_to_conll can convert with a conversion map
+CONLL_STRING_FIELDS = ["FORM", "LEMMA", "UPOS", "XPOS", "FEATS", "DEPREL"]
+
+# Token attributes of the string fields, read in bulk
+CONLL_STRING_ATTRS = [ORTH, LEMMA, POS, TAG, MORPH, DEP]
+
+
+def doc_to_conll(
+    doc: Doc, conversion_maps: dict[str, dict[str, str]] | None = None
+) -> str:
+    """
+    Convert a SpaCy Doc into the same CoNLL-U string as spacy_conll's
+    ConllFormatter, from the token attributes read in bulk rather than
+    token by token. As with the formatter's `conversion_maps`, the values
+    of the string fields (FORM, LEMMA, UPOS, XPOS, FEATS and DEPREL) can be
+    replaced, by field name. The DEPS field is always '_'.
+
+    Unlike the formatter, the entities are written in the MISC field
+    (NE=B-ORG, NE=I-ORG), where conll_to_doc reads them, so that documents
+    read back from their CoNLL strings have the same entities.
+    """
+    if not len(doc):
+        return ""
+    conversion_maps = conversion_maps or {}
+    field_maps = [conversion_maps.get(field) for field in CONLL_STRING_FIELDS]
+
+    # Each distinct hash is looked up in the string store only once
+    strings = doc.vocab.strings
+    hashes = doc.to_array(CONLL_STRING_ATTRS).T.tolist()
+    columns = []
+    for i, (values, field_map) in enumerate(zip(hashes, field_maps)):
+        lookup = {h: strings[h] for h in set(values)}
+        if CONLL_STRING_FIELDS[i] == "FEATS":
+            # Tokens without morphological features have an empty FEATS
+            lookup = {h: v if v else "_" for h, v in lookup.items()}
+        elif CONLL_STRING_FIELDS[i] == "DEPREL":
+            # Roots are told apart before their relation is converted
+            roots = {h for h, v in lookup.items() if v.lower().strip() == "root"}
+        if field_map:
+            lookup = {h: field_map.get(v, v) for h, v in lookup.items()}
+        columns.append([lookup[h] for h in values])
+    forms, lemmas, poses, tags, morphs, deps = columns
+    is_root = [h in roots for h in hashes[-1]]
+    # Heads are stored as offsets from their token
+    heads = doc.to_array([HEAD]).view(numpy.int64).ravel().tolist()
+    miscs = []
+    ent_labels = {}
+    for space, iob, label in doc.to_array([SPACY, ENT_IOB, ENT_TYPE]).tolist():
+        # ENT_IOB is 3 for the first token of an entity and 1 for the others
+        if iob in (1, 3) and label:
+            if label not in ent_labels:
+                ent_labels[label] = strings[label]
+            ent = "NE={}-{}".format("B" if iob == 3 else "I", ent_labels[label])
+            miscs.append(ent if space else ent + "|SpaceAfter=No")
+        else:
+            miscs.append("_" if space else "SpaceAfter=No")
+
+    sentences = []
+    for sent in doc.sents:
+        start = sent.start
+        lines = []
+        for i in range(start, sent.end):
+            lines.append(
+                "{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t_\t{}\n".format(
+                    i - start + 1,
+                    forms[i],
+                    lemmas[i],
+                    poses[i],
+                    tags[i],
+                    morphs[i],
+                    0 if is_root[i] else i + heads[i] - start + 1,
+                    deps[i],
+                    miscs[i],
+                )
+            )
+        sentences.append("".join(lines))
+    return "\n".join(sentences)
+
+
+def misc_to_iob(misc: str) -> str:
+    for misc_part in misc.split("|"):
+        tag_match = NER_TAG_RE.match(misc_part)
+        if tag_match:
+            prefix = tag_match.group(2)
+            suffix = tag_match.group(3)
+            if prefix and suffix:
+                return prefix + "-" + suffix
+            break
+    return "O"
+
+
+def raise_unexpected_format():
+    raise ValueError(
+        "Your data is in an unexpected format. Make sure that it follows the CoNLL-U format"
+        " requirements. See https://universaldependencies.org/format.html. Particularly make"
+        " sure that the DEPREL field is filled in."
+    )
@@ -1,81 +1,646 @@
+import csv
 import gzip
+import io
+import json
 import os
-import shutil
-from pathlib import Path, PosixPath
+import zlib
+from itertools import islice
+from pathlib import Path
+from typing import Generator
 
 import casanova
-from rich.progress import Progress, SpinnerColumn, TextColumn, TimeElapsedColumn
-
-
-def compress_outfile(outfile):
-    if isinstance(outfile, PosixPath):
-        outfile = str(outfile)
-    with open(outfile, "rb") as f_in:
-        compressed_outfile = outfile + ".gz"
-        print(f"\nCompressing output to '{compressed_outfile}'. Please wait.\n")
-        try:
-            with gzip.open(compressed_outfile, "wb") as f_out:
-                shutil.copyfileobj(f_in, f_out)
-        except Exception as e:
-            raise e
+import srsly
+from casanova.headers import Headers
+from spacy.tokens import DocBin
+from spacy.tokens.doc import Doc
+from spacy.vocab import Vocab
+
+from src.constants import CHUNK_SIZE, Compression, OutputFormat
+from src.exceptions import ParquetImportException, ZstdImportException
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+PARQUET_MAGIC = b"PAR1"
+# Match out-file columns, by the last part of their name, stored as integers
+# and, with few distinct values, dictionary-encoded in Parquet
+INTEGER_COLUMNS = {"id", "match"}
+DICTIONARY_COLUMNS = {"lemma", "pos", "deprel", "entity", "pattern", "node"}
+
+# Errors raised when reading the end of an out-file that was cut short
+TRUNCATED_FILE_ERRORS = (EOFError, OSError, zlib.error, csv.Error) + (
+    (zstandard.ZstdError,) if zstandard else ()
+)
+
+
+class InfileStream(io.TextIOWrapper):
+    """
+    Text stream over a plain or compressed file, which tells how many bytes
+    of the file itself have been read, to measure progress without counting
+    the file's rows beforehand.
+    """
+
+    def __init__(self, raw: io.BufferedReader, buffer: io.IOBase) -> None:
+        super().__init__(buffer)
+        self.raw_file = raw
+
+    def position(self) -> int:
+        return self.raw_file.tell()
+
+    def close(self):
+        super().close()
+        self.raw_file.close()
+
+
+def open_infile(infile) -> InfileStream:
+    """
+    Open a plain, Gzip or Zstandard compressed CSV file in text mode.
+    """
+    raw = open(infile, "rb")
+    magic = raw.peek(4)[:4]
+    if magic.startswith(GZIP_MAGIC):
+        return InfileStream(raw, gzip.GzipFile(fileobj=raw, mode="rb"))
+    if magic.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raw.close()
+            raise ZstdImportException()
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            raw, read_across_frames=True, closefd=False
+        )
+        return InfileStream(raw, reader)
+    return InfileStream(raw, raw)
+
+
+def compressed_outfile(
+    outfile, compression: Compression, output_format: OutputFormat = OutputFormat.csv
+) -> Path:
+    # Parquet files compress their columns themselves
+    if output_format == OutputFormat.parquet:
+        suffix = ".parquet"
+    else:
+        suffix = {Compression.gzip: ".gz", Compression.zstd: ".zst"}.get(compression)
+    if suffix is None or str(outfile).endswith(suffix):
+        return Path(outfile)
+    return Path(str(outfile) + suffix)
+
+
+class OutputStream:
+    """
+    Text stream that encodes and compresses what is written to it on the fly.
+    Every checkpoint ends the current Gzip member or Zstandard frame and syncs
+    the file to disk, so that everything written until then can be read back
+    even if the program is killed.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        compression: Compression = Compression.gzip,
+        level: int | None = None,
+        offset: int | None = None,
+    ) -> None:
+        self.path = path
+        self.compression = compression
+        self.level = level
+        self.offset = offset
+        if compression == Compression.zstd and zstandard is None:
+            raise ZstdImportException()
+
+    def __enter__(self):
+        if self.offset is None:
+            self.raw = open(self.path, "wb")
         else:
-            os.remove(outfile)
+            # Resume writing where the last checkpoint ended
+            self.raw = open(self.path, "r+b")
+            self.raw.truncate(self.offset)
+            self.raw.seek(self.offset)
+        self.stream = self._open_stream()
+        return self
+
+    def _open_stream(self):
+        if self.compression == Compression.gzip:
+            return gzip.GzipFile(
+                fileobj=self.raw,
+                mode="wb",
+                compresslevel=self.level if self.level is not None else 6,
+            )
+        elif self.compression == Compression.zstd:
+            compressor = zstandard.ZstdCompressor(
+                level=self.level if self.level is not None else 3
+            )
+            return compressor.stream_writer(self.raw, closefd=False)
+        else:
+            return self.raw
+
+    def _close_stream(self):
+        if self.compression == Compression.gzip:
+            self.stream.close()
+        elif self.compression == Compression.zstd:
+            self.stream.flush(zstandard.FLUSH_FRAME)
+            self.stream.close()
+
+    def write(self, text: str) -> int:
+        self.stream.write(text.encode("utf-8"))
+        return len(text)
+
+    def checkpoint(self) -> int:
+        """
+        Make everything written so far durable and return the file's size.
+        """
+        self._close_stream()
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+        # The next stream's header is written as soon as it is opened
+        offset = self.raw.tell()
+        self.stream = self._open_stream()
+        return offset
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._close_stream()
+        self.raw.close()
+
+
+def docbin_outfile(outfile) -> Path:
+    return Path(str(outfile) + ".docbin")
+
+
+class DocBinWriter:
+    """
+    Side-car file in which each batch of parsed documents is appended as a
+    msgpack record holding the IDs of the batch's rows and a serialized DocBin.
+    Without a path, writing does nothing.
+    """
+
+    def __init__(self, path: Path | None, offset: int | None = None) -> None:
+        self.path = path
+        self.offset = offset
+        self.file = None
+
+    def __enter__(self):
+        if self.path and self.offset is None:
+            self.file = open(self.path, "wb")
+        elif self.path:
+            self.file = open(self.path, "r+b")
+            self.file.truncate(self.offset)
+            self.file.seek(self.offset)
+        return self
+
+    def write(self, ids: list[str], docbin: bytes):
+        if self.file:
+            self.file.write(srsly.msgpack_dumps({"ids": ids, "docbin": docbin}))
+
+    def checkpoint(self) -> int | None:
+        if self.file:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            return self.file.tell()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.file:
+            self.file.close()
+
+
+def read_docbin(path: Path, vocab: Vocab) -> Generator[tuple[str, Doc], None, None]:
+    """
+    Yield the (row ID, Doc) pairs stored in a side-car file written by DocBinWriter.
+    """
+    with open(path, "rb") as f:
+        for record in srsly.msgpack.Unpacker(f, raw=False, max_buffer_size=0):
+            docs = DocBin().from_bytes(record["docbin"]).get_docs(vocab)
+            yield from zip(record["ids"], docs)
+
+
+def import_pyarrow():
+    """
+    Import PyArrow, which is optional and slow to import, only when a
+    Parquet file is read or written.
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ParquetImportException()
+    return pyarrow, pyarrow.parquet
+
+
+def is_parquet(path: Path) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(PARQUET_MAGIC)) == PARQUET_MAGIC
+
+
+class ParquetReader:
+    """
+    Reader of the rows of a Parquet file, one row group at a time, with the
+    parts of casanova's reader interface that the commands use. Values are
+    read as the strings a CSV file would hold, and empty values as ''.
+    """
+
+    def __init__(self, path: Path) -> None:
+        _, pq = import_pyarrow()
+        self.path = path
+        self.file = pq.ParquetFile(path)
+        self.fieldnames = self.file.schema_arrow.names
+        self.headers = Headers(self.fieldnames)
+        self.total = self.file.metadata.num_rows
+        self._position = 0
+        # Like casanova's readers, the reader is read once: rows skipped
+        # through one iteration aren't read again by the next ones
+        self._rows = self._read_rows()
+
+    def __iter__(self):
+        return self._rows
+
+    def _read_rows(self):
+        for i in range(self.file.num_row_groups):
+            columns = [
+                ["" if v is None else str(v) for v in column.to_pylist()]
+                for column in self.file.read_row_group(i).columns
+            ]
+            row_group = self.file.metadata.row_group(i)
+            self._position += sum(
+                row_group.column(j).total_compressed_size
+                for j in range(row_group.num_columns)
+            )
+            yield from (list(row) for row in zip(*columns))
+
+    def cells(self, column: str, with_rows: bool = False):
+        pos = self.headers[column]
+        for row in self:
+            yield (row, row[pos]) if with_rows else row[pos]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def position(self) -> int:
+        """Approximate number of bytes of the file read so far."""
+        return min(self._position, os.path.getsize(self.path))
+
+    def close(self):
+        self.file.close()
 
 
-def count_file_length(datafile) -> int:
-    with Progress(
-        TextColumn("[progress.description]{task.description}"),
-        SpinnerColumn(),
-        TimeElapsedColumn(),
-    ) as p:
-        p.add_task(description="[bold]Measuring file length")
-        infile_length = casanova.reader.count(datafile)
-        return infile_length
+class ParquetOutput:
+    """
+    Parquet out-file whose rows are buffered and written in row groups.
+    Token index columns are stored as integers, and the columns listed in
+    `dictionary_columns`, whose few values repeat, are dictionary-encoded.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        fieldnames: list[str],
+        compression: Compression = Compression.gzip,
+        level: int | None = None,
+        integer_columns: set[str] | None = None,
+        dictionary_columns: set[str] | None = None,
+        row_group_size: int = CHUNK_SIZE,
+    ) -> None:
+        self.pa, self.pq = import_pyarrow()
+        self.path = path
+        self.fieldnames = fieldnames
+        self.compression = compression
+        self.level = level
+        self.integer_columns = integer_columns or set()
+        self.dictionary_columns = dictionary_columns or set()
+        self.row_group_size = row_group_size
+        self.rows = []
+
+    def __enter__(self):
+        pa = self.pa
+        fields = []
+        for name in self.fieldnames:
+            if name in self.integer_columns:
+                fields.append(pa.field(name, pa.int64()))
+            elif name in self.dictionary_columns:
+                fields.append(pa.field(name, pa.dictionary(pa.int32(), pa.string())))
+            else:
+                fields.append(pa.field(name, pa.string()))
+        self.schema = pa.schema(fields)
+        self.writer = self.pq.ParquetWriter(
+            self.path,
+            self.schema,
+            compression=self.compression.value,
+            # Uncompressed columns can't have a compression level
+            compression_level=None
+            if self.compression == Compression.none
+            else self.level,
+            use_dictionary=[
+                name for name in self.fieldnames if name in self.dictionary_columns
+            ],
+        )
+        return self
+
+    def writerow(self, row: list):
+        self.rows.append(row)
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def writerows(self, rows: list[list]):
+        for row in rows:
+            self.writerow(row)
+
+    def flush(self):
+        if not self.rows:
+            return
+        # Empty strings, as written in CSV files, are missing values
+        columns = [
+            [None if v == "" else v for v in column] for column in zip(*self.rows)
+        ]
+        self.writer.write_table(
+            self.pa.Table.from_arrays(
+                [
+                    self.pa.array(column, type=field.type)
+                    for column, field in zip(columns, self.schema)
+                ],
+                schema=self.schema,
+            )
+        )
+        self.rows = []
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # Closing the writer writes the file's footer, which makes it readable
+        self.flush()
+        self.writer.close()
+
+
+class TableWriter:
+    """
+    Out-file, in CSV or Parquet, to which rows are written apart from an
+    enricher's out-file. Without a path, writing does nothing.
+    """
+
+    def __init__(
+        self,
+        path: Path | None,
+        fieldnames: list[str],
+        compression: Compression = Compression.gzip,
+        level: int | None = None,
+        output_format: OutputFormat = OutputFormat.csv,
+    ) -> None:
+        self.path = path
+        self.fieldnames = fieldnames
+        self.compression = compression
+        self.level = level
+        self.output_format = output_format
+        self.file = None
+
+    def __enter__(self):
+        if self.path and self.output_format == OutputFormat.parquet:
+            self.file = ParquetOutput(
+                self.path, self.fieldnames, self.compression, self.level
+            ).__enter__()
+            self.writer = self.file
+        elif self.path:
+            self.file = OutputStream(self.path, self.compression, self.level).__enter__()
+            self.writer = casanova.writer(self.file, fieldnames=self.fieldnames)
+        return self
+
+    def writerow(self, row: list):
+        if self.file:
+            self.writer.writerow(row)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.file:
+            self.file.__exit__(exc_type, exc_val, exc_tb)
+
+
+class Checkpoint:
+    """
+    Side-car file recording how many rows of the in-file were processed
+    when the out-file was last made durable, and the out-file's size then.
+    """
+
+    def __init__(self, outfile: Path) -> None:
+        self.path = Path(str(outfile) + ".checkpoint")
+
+    def load(self) -> dict | None:
+        if self.path.exists():
+            with open(self.path) as f:
+                return json.load(f)
+
+    def save(self, **state):
+        # Replace the file atomically so that a crash never leaves it half-written
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        self.path.unlink(missing_ok=True)
 
 
 class EnricherBase:
-    def __init__(self, infile: Path, outfile: Path, id_col: str) -> None:
+    def __init__(
+        self,
+        infile: Path,
+        outfile: Path,
+        id_col: str,
+        compression: Compression = Compression.gzip,
+        compress_level: int | None = None,
+        resume: bool = False,
+        output_format: OutputFormat = OutputFormat.csv,
+    ) -> None:
         self.infile = infile
-        self.outfile = outfile
+        self.outfile = compressed_outfile(outfile, compression, output_format)
         self.id_col = id_col
+        self.compression = compression
+        self.compress_level = compress_level
+        self.resume = resume
+        self.output_format = output_format
         self.add_cols = []
+        # Columns stored as integers, and dictionary-encoded, in Parquet out-files
+        self.integer_columns = set()
+        self.dictionary_columns = set()
 
     def __enter__(self):
-        self.open_outfile = open(self.outfile, "w")
-        self.open_infile = open(self.infile, "r")
-        # Try creating a Casanova enricher with a CSV file
-        try:
+        parquet_infile = is_parquet(self.infile)
+        if parquet_infile:
+            self.open_infile = ParquetReader(self.infile)
+        else:
+            self.open_infile = open_infile(self.infile)
+        self.checkpoint_file = Checkpoint(self.outfile)
+        # Number of in-file rows processed by a previous run
+        self.resumed_rows = 0
+        # State saved by the previous run's last checkpoint
+        self.resumed_state = {}
+
+        state = None
+        previous_outfile = None
+        if self.resume and self.outfile.exists():
+            state = self.checkpoint_file.load()
+            if state is None:
+                # Without a checkpoint, the out-file's rows have to be copied
+                previous_outfile = self.outfile.with_name(self.outfile.name + ".old")
+                os.replace(self.outfile, previous_outfile)
+
+        fieldnames = [self.id_col] + self.add_cols
+        if self.output_format == OutputFormat.parquet:
+            self.open_outfile = ParquetOutput(
+                self.outfile,
+                fieldnames,
+                self.compression,
+                self.compress_level,
+                integer_columns=self.integer_columns,
+                dictionary_columns=self.dictionary_columns,
+            ).__enter__()
+        else:
+            self.open_outfile = OutputStream(
+                self.outfile,
+                self.compression,
+                self.compress_level,
+                offset=state["offset"] if state else None,
+            ).__enter__()
+
+        if not parquet_infile and self.output_format == OutputFormat.csv:
             self.enricher = casanova.enricher(
                 self.open_infile,
                 self.open_outfile,
                 select=[self.id_col],
                 add=self.add_cols,
+                write_header=state is None,
             )
-            self.enricher.headers
-        # Try creating a Casanova enricher with a Gzip file
-        except:
-            self.open_infile.close()
-            self.open_infile = gzip.open(self.infile, "rt")
-            self.enricher = casanova.enricher(
-                self.open_infile,
-                self.open_outfile,
-                select=[self.id_col],
-                add=self.add_cols,
+            self.writer = self.enricher.writer
+            self._id_pos = None
+        else:
+            # Without casanova's enricher, which needs CSV files on both sides,
+            # the rows' IDs are selected here
+            if parquet_infile:
+                self.enricher = self.open_infile
+            else:
+                self.enricher = casanova.reader(self.open_infile)
+            if self.output_format == OutputFormat.parquet:
+                self.writer = self.open_outfile
+            else:
+                self.writer = casanova.writer(
+                    self.open_outfile, fieldnames=fieldnames, write_header=state is None
+                )
+            self._id_pos = self.enricher.headers[self.id_col]
+
+        if state:
+            self.resumed_state = state
+            self.resumed_rows = state["rows"]
+            for _ in islice(self.enricher, self.resumed_rows):
+                pass
+        else:
+            # Don't leave the checkpoint of an older run for this out-file
+            self.checkpoint_file.remove()
+            if previous_outfile:
+                last_id = self._copy_previous_outfile(previous_outfile)
+                if last_id is not None:
+                    self._skip_to_id(last_id)
+                self.checkpoint(self.resumed_rows)
+                os.remove(previous_outfile)
+        return self
+
+    def _copy_previous_outfile(self, previous_outfile: Path) -> str | None:
+        """
+        Copy the complete rows of an out-file without checkpoint and return
+        the ID of the last document whose rows were copied. The rows of the
+        out-file's last document may be incomplete, so they are dropped
+        and that document will be processed again.
+        """
+        last_id, last_rows, copied_id = None, [], None
+        with open_infile(previous_outfile) as f:
+            reader = casanova.reader(f)
+            try:
+                for row in reader:
+                    if row[0] != last_id:
+                        self.writer.writerows(last_rows)
+                        copied_id = last_id
+                        last_id, last_rows = row[0], []
+                    last_rows.append(row)
+            except TRUNCATED_FILE_ERRORS:
+                pass
+        return copied_id
+
+    def _skip_to_id(self, last_id: str):
+        id_pos = self.enricher.headers[self.id_col]
+        for row in self.enricher:
+            self.resumed_rows += 1
+            if row[id_pos] == last_id:
+                return
+        raise ValueError(
+            "Cannot resume: the ID '{}' of the out-file's last row is not in the in-file.".format(
+                last_id
             )
-        return self.enricher
+        )
+
+    @property
+    def headers(self):
+        return self.enricher.headers
+
+    @property
+    def infile_size(self) -> int:
+        return os.path.getsize(self.infile)
+
+    @property
+    def infile_position(self) -> int:
+        """
+        Number of bytes of the in-file read so far. Reading is buffered,
+        so it runs slightly ahead of the rows processed.
+        """
+        return self.open_infile.position()
+
+    def __iter__(self):
+        return iter(self.enricher)
+
+    def cells(self, column: str, with_rows: bool = False):
+        return self.enricher.cells(column, with_rows=with_rows)
+
+    def writerow(self, row: list, add: list | None = None):
+        if self._id_pos is None:
+            self.enricher.writerow(row, add)
+        else:
+            self.writer.writerow([row[self._id_pos]] + (add or []))
+
+    def checkpoint(self, rows: int, **state):
+        """
+        Make the rows written so far durable and record that the first
+        `rows` rows of the in-file, counted from the start, were processed.
+        Parquet out-files are only readable once closed, so they have no
+        checkpoints.
+        """
+        if self.output_format == OutputFormat.parquet:
+            return
+        offset = self.open_outfile.checkpoint()
+        self.checkpoint_file.save(rows=rows, offset=offset, **state)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self.open_infile:
             self.open_infile.close()
         if self.open_outfile:
-            self.open_outfile.close()
+            # Closing the stream completes the compressed file,
+            # even when the program was interrupted
+            self.open_outfile.__exit__(exc_type, exc_val, exc_tb)
+        # A complete run doesn't need to be resumed
+        if exc_type is None:
+            self.checkpoint_file.remove()
 
 
 class ParseEnricher(EnricherBase):
-    def __init__(self, infile: Path, outfile: Path, id_col: str) -> None:
-        self.infile = infile
-        self.outfile = outfile
-        self.id_col = id_col
+    def __init__(
+        self,
+        infile: Path,
+        outfile: Path,
+        id_col: str,
+        compression: Compression = Compression.gzip,
+        compress_level: int | None = None,
+        resume: bool = False,
+        output_format: OutputFormat = OutputFormat.csv,
+    ) -> None:
+        super().__init__(
+            infile, outfile, id_col, compression, compress_level, resume, output_format
+        )
         self.add_cols = ["parsed_text", "conll_string"]
 
     def __enter__(self):
@@ -87,12 +652,26 @@ class ParseEnricher(EnricherBase):
 
 class MatchEnricher(EnricherBase):
     def __init__(
-        self, infile: Path, outfile: Path, id_col: str, add_cols: list
+        self,
+        infile: Path,
+        outfile: Path,
+        id_col: str,
+        add_cols: list,
+        compression: Compression = Compression.gzip,
+        compress_level: int | None = None,
+        resume: bool = False,
+        output_format: OutputFormat = OutputFormat.csv,
     ) -> None:
-        self.infile = infile
-        self.outfile = outfile
-        self.id_col = id_col
+        super().__init__(
+            infile, outfile, id_col, compression, compress_level, resume, output_format
+        )
         self.add_cols = add_cols
+        self.integer_columns = {
+            col for col in add_cols if col.rsplit("_", 1)[-1] in INTEGER_COLUMNS
+        }
+        self.dictionary_columns = {
+            col for col in add_cols if col.rsplit("_", 1)[-1] in DICTIONARY_COLUMNS
+        }
 
     def __enter__(self):
         return super().__enter__()
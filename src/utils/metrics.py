@@ -0,0 +1,242 @@
+import json
+import os
+import resource
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Iterator, TypeVar
+
+from rich.console import Console
+from rich.table import Table
+
+# Default number of seconds between snapshots of the metrics file
+DEFAULT_METRICS_INTERVAL = 60
+
+T = TypeVar("T")
+
+
+def current_rss_mb() -> float:
+    """Resident memory of the current process, in megabytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except (OSError, ValueError):
+        # Without /proc, fall back on the peak resident memory
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Stage:
+    """
+    Context manager adding the wall-clock and CPU time spent in its block to
+    a stage of a Metrics. The time spent in stages nested in the block is
+    only counted in the nested stages.
+    """
+
+    __slots__ = ("metrics", "name", "wall", "cpu")
+
+    def __init__(self, metrics: "Metrics", name: str) -> None:
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.metrics._nested.append([0.0, 0.0])
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        nested = self.metrics._nested
+        nested_wall, nested_cpu = nested.pop()
+        if nested:
+            nested[-1][0] += wall
+            nested[-1][1] += cpu
+        self.metrics.add_time(self.name, wall - nested_wall, cpu - nested_cpu)
+
+
+class NoStage:
+    """Context manager of a disabled Metrics, which does nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+NO_STAGE = NoStage()
+
+
+class Metrics:
+    """
+    Cumulative wall-clock and CPU time per stage of a command, counters of
+    the documents and tokens processed, latencies of the batches and peak
+    memory. When enabled with a path, the metrics are saved there as JSON
+    at regular intervals and at the end of the run. A disabled Metrics
+    records nothing, so that it can be passed around unconditionally.
+
+    Stages run in worker processes can be sent back with `drain` and added
+    to the main process's metrics with `merge`; their times then add up
+    across workers.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        path: Path | None = None,
+        command: str = "",
+        interval: float = DEFAULT_METRICS_INTERVAL,
+    ) -> None:
+        self.enabled = enabled or path is not None
+        self.path = path
+        self.command = command
+        self.interval = interval
+        self.stages: dict[str, list] = {}
+        self.counters: dict[str, int] = {}
+        self.batch_latencies: list[float] = []
+        self.started = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self._last_snapshot = self._start
+        self._nested: list[list[float]] = []
+
+    def stage(self, name: str) -> Stage | NoStage:
+        if not self.enabled:
+            return NO_STAGE
+        return Stage(self, name)
+
+    def timed(self, name: str, iterable: Iterable[T]) -> Iterator[T]:
+        """
+        Iterate over an iterable, adding the time spent getting each of its
+        items to a stage.
+        """
+        if not self.enabled:
+            return iter(iterable)
+        return self._timed(name, iterable)
+
+    def _timed(self, name: str, iterable: Iterable[T]) -> Iterator[T]:
+        iterator = iter(iterable)
+        stage = Stage(self, name)
+        while True:
+            with stage:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def add_time(self, name: str, wall: float, cpu: float, calls: int = 1):
+        times = self.stages.get(name)
+        if times is None:
+            self.stages[name] = [wall, cpu, calls]
+        else:
+            times[0] += wall
+            times[1] += cpu
+            times[2] += calls
+
+    def count(self, name: str, value: int = 1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_batch(self, latency: float):
+        """Record the latency of a batch and save a snapshot if one is due."""
+        if not self.enabled:
+            return
+        self.batch_latencies.append(latency)
+        now = time.perf_counter()
+        if self.path is not None and now - self._last_snapshot >= self.interval:
+            self._last_snapshot = now
+            self.save()
+
+    def drain(self) -> tuple[dict, dict]:
+        """Return the stages and counters recorded so far, and reset them."""
+        stages, counters = self.stages, self.counters
+        self.stages, self.counters = {}, {}
+        return stages, counters
+
+    def merge(self, stages: dict, counters: dict):
+        for name, (wall, cpu, calls) in stages.items():
+            self.add_time(name, wall, cpu, calls)
+        for name, value in counters.items():
+            self.count(name, value)
+
+    def to_dict(self, finished: bool = False) -> dict:
+        elapsed = time.perf_counter() - self._start
+
+        def rate(counter: str) -> float | None:
+            value = self.counters.get(counter)
+            return value / elapsed if value is not None and elapsed else None
+
+        latencies = sorted(self.batch_latencies)
+
+        def percentile(p: float) -> float | None:
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        # Linux reports the maximum resident set size in kilobytes
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        workers_peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+        return {
+            "command": self.command,
+            "started": self.started.isoformat(timespec="seconds"),
+            "elapsed": elapsed,
+            "finished": finished,
+            "counters": dict(self.counters),
+            "docs_per_second": rate("docs"),
+            "tokens_per_second": rate("tokens"),
+            "stages": {
+                name: {"wall": wall, "cpu": cpu, "calls": calls}
+                for name, (wall, cpu, calls) in sorted(
+                    self.stages.items(), key=lambda item: -item[1][0]
+                )
+            },
+            "batches": {
+                "count": len(latencies),
+                "mean": sum(latencies) / len(latencies) if latencies else None,
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": latencies[-1] if latencies else None,
+            },
+            "peak_rss_mb": peak_rss,
+            "workers_peak_rss_mb": workers_peak_rss,
+        }
+
+    def save(self, finished: bool = False):
+        """Atomically write the metrics to their JSON file."""
+        if self.path is None:
+            return
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.to_dict(finished), f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def print_summary(self):
+        metrics = self.to_dict()
+        table = Table(title="Time per stage")
+        table.add_column("Stage")
+        table.add_column("Wall (s)", justify="right")
+        table.add_column("CPU (s)", justify="right")
+        table.add_column("Calls", justify="right")
+        for name, times in metrics["stages"].items():
+            table.add_row(
+                name,
+                "{:.2f}".format(times["wall"]),
+                "{:.2f}".format(times["cpu"]),
+                str(times["calls"]),
+            )
+        console = Console()
+        console.print(table)
+        for counter in ["docs", "tokens"]:
+            if metrics["{}_per_second".format(counter)] is not None:
+                console.print(
+                    "{} {} ({:.1f}/sec)".format(
+                        metrics["counters"][counter],
+                        counter,
+                        metrics["{}_per_second".format(counter)],
+                    )
+                )
+        console.print("Peak memory: {:.1f} MB".format(metrics["peak_rss_mb"]))
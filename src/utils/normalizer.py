@@ -2,6 +2,8 @@
 # https://github.com/VinAIResearch/BERTweet/blob/master/TweetNormalizer.py
 
 import re
+from functools import lru_cache
+from typing import Iterable
 
 import emoji
 from nltk.tokenize import TweetTokenizer
@@ -9,6 +11,16 @@ from ural.patterns import URL_IN_TEXT_RE
 
 tokenizer = TweetTokenizer()
 
+TEXT_SELECTOR = "\ufe0e"
+EMOJI_SELECTOR = "\ufe0f"
+ZWJ = "\u200d"
+
+# Titles or pre-colon spans at the start of a text
+TITLE_RE = re.compile(r"(^\s*\S+(\s+\S+)?\s*):")
+# User citations (i.e. "via @theregister"), or else user handles and hashtags
+HANDLE_RE = re.compile(r"(?!https)via(\s{0,}@\w*)|[@#]")
+WHITESPACE_RE = re.compile(r"\s+")
+
 
 def normalizeToken(token):
     if token.startswith("#"):
@@ -24,26 +36,116 @@ def normalizeToken(token):
             return token
 
 
-def normalizer(text):
+def emoji_char_class(chars: Iterable[str]) -> str:
+    """
+    Regex character class of the given characters, written as ranges
+    because classes of many non-BMP characters are slow to match.
+    """
+    ranges = []
+    for code_point in sorted(set(map(ord, chars))):
+        if ranges and code_point == ranges[-1][1] + 1:
+            ranges[-1][1] = code_point
+        else:
+            ranges.append([code_point, code_point])
+    return "[{}]".format(
+        "".join(
+            re.escape(chr(start))
+            if start == end
+            else "{}-{}".format(re.escape(chr(start)), re.escape(chr(end)))
+            for start, end in ranges
+        )
+    )
+
+
+@lru_cache(maxsize=None)
+def emoji_regex() -> re.Pattern:
+    """
+    Compile a regex that removes the same emojis as emoji.replace_emoji.
+
+    The emojis are arranged in a trie, so that the regex tries the longest
+    emoji first without testing every emoji at each position. The trie's
+    first level is split into groups of nearby first characters, each
+    guarded by a lookahead, so that a position is only tested against the
+    emojis whose first character is close to its own.
+    Like emoji.replace_emoji, it also removes every variation selector.
+    """
+    trie = {}
+    for emj in emoji.EMOJI_DATA:
+        node = trie
+        for char in emj:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def branches(node: dict) -> list[str]:
+        alternatives, leaves = [], []
+        for char, child in sorted(node.items()):
+            if not char:
+                continue
+            if list(child) == [""]:
+                leaves.append(char)
+            else:
+                alternatives.append(re.escape(char) + pattern(child))
+        if leaves:
+            alternatives.append(emoji_char_class(leaves))
+        return alternatives
+
+    def pattern(node: dict) -> str:
+        return "(?:{}){}".format("|".join(branches(node)), "?" if "" in node else "")
+
+    groups = {}
+    for char in trie:
+        groups.setdefault(ord(char) >> 5, []).append(char)
+    alternatives = [
+        "(?={})(?:{})".format(
+            emoji_char_class(chars),
+            "|".join(branches({char: trie[char] for char in chars})),
+        )
+        for _, chars in sorted(groups.items())
+    ]
+    alternatives.append("[{}{}]".format(TEXT_SELECTOR, EMOJI_SELECTOR))
+    # Most positions don't start an emoji, so rule them out at once. Digits
+    # or regional indicators are only emojis as part of keycaps or flags,
+    # so for them look at the next character too
+    singles = [char for char in trie if "" in trie[char]]
+    prefixes = [char for char in trie if "" not in trie[char]]
+    second_chars = {char for prefix in prefixes for char in trie[prefix]}
+    start = "{}|{}{}".format(
+        emoji_char_class(singles + [TEXT_SELECTOR, EMOJI_SELECTOR]),
+        emoji_char_class(prefixes),
+        emoji_char_class(second_chars),
+    )
+    return re.compile("(?={})(?:{})".format(start, "|".join(alternatives)))
+
+
+def remove_emojis(text: str) -> str:
+    # Zero-width joiners between emojis that don't form a known sequence
+    # are handled in a peculiar way by emoji.replace_emoji, so leave
+    # these rare texts to it
+    if ZWJ in text:
+        return emoji.replace_emoji(text, replace="")
+    return emoji_regex().sub("", text)
+
+
+def normalizer(text: str) -> str:
     # Remove emojis
-    text = emoji.replace_emoji(text, replace="")
+    text = remove_emojis(text)
 
     # Separate titles / pre-colon spans from sentences
-    text = re.sub(r"(^\s*\S+(\s+\S+)?\s*):", "\\1.", text)
+    text = TITLE_RE.sub("\\1.", text)
 
     # Remove URLs
     text = URL_IN_TEXT_RE.sub(repl="", string=text)
 
-    # Remove user citatation (i.e. "via @theregister")
-    text = re.sub(r"(?!https)via(\s{0,}@\w*)", "", text)
-
-    # Remove user handles and hashtags
-    text = re.sub(r"[@#]", "", text)
+    # Remove user citatation (i.e. "via @theregister"), then user handles
+    # and hashtags, in a single pass
+    text = HANDLE_RE.sub("", text)
 
-    # Remove trailing white space
-    text = text.strip()
+    # Remove double spaces, then trailing white space
+    return WHITESPACE_RE.sub(" ", text).strip()
 
-    # Remove double spaces
-    text = re.sub(r"\s+", " ", text)
 
-    return text
+def normalize_batch(texts: Iterable[str]) -> list[str]:
+    """
+    Normalize a batch of texts, for instance in a worker process.
+    """
+    return [normalizer(text) for text in texts]
@@ -0,0 +1,90 @@
+import unittest
+
+from src.cli.parse_command import (
+    DEFAULT_BATCH_CHARS,
+    MIN_BATCH_CHARS,
+    BatchBudget,
+    LengthSortedParser,
+    chunks_of_texts,
+)
+from test.length_sorting import WordsParser
+
+
+def texts_of(batches) -> list[list[str]]:
+    return [[text for text, _ in batch] for batch in batches]
+
+
+class BatchBudgetTest(unittest.TestCase):
+    def test_batches_bounded_by_characters(self):
+        texts = ["aaaa", "bb", "cccccccc", "d", "e", "f", "g"]
+        items = [(text, [str(i)]) for i, text in enumerate(texts)]
+        batches = list(chunks_of_texts(items, 3, BatchBudget(max_chars=6)))
+        # A text longer than the budget makes a batch of its own
+        assert texts_of(batches) == [["aaaa", "bb"], ["cccccccc"], ["d", "e", "f"], ["g"]]
+        assert [row for batch in batches for _, row in batch] == [r for _, r in items]
+        # Without characters, only the number of rows bounds the batches
+        assert texts_of(chunks_of_texts(items, 3, BatchBudget())) == [
+            texts[:3],
+            texts[3:6],
+            texts[6:],
+        ]
+
+    def test_budget_without_memory_target(self):
+        budget = BatchBudget(max_chars=100)
+        budget.update(100, 1.0, rss=1e6)
+        assert budget.max_chars == 100
+
+    def test_budget_shrinks_over_memory_target(self):
+        budget = BatchBudget(max_memory=1000)
+        assert budget.max_chars == DEFAULT_BATCH_CHARS
+        budget.update(DEFAULT_BATCH_CHARS, 1.0, rss=1200)
+        assert budget.max_chars == DEFAULT_BATCH_CHARS // 2
+        for _ in range(20):
+            budget.update(budget.max_chars, 1.0, rss=1200)
+        assert budget.max_chars == MIN_BATCH_CHARS
+
+    def test_budget_grows_under_memory_target(self):
+        budget = BatchBudget(max_chars=2_000_000, max_memory=1000)
+        budget.update(1_000_000, 1.0, rss=500)
+        assert budget.max_chars == 1_250_000
+        # Batches that don't fill the budget don't make it grow
+        budget.update(100_000, 0.1, rss=500)
+        assert budget.max_chars == 1_250_000
+        # Nor do batches close to the memory target
+        budget.update(1_250_000, 1.0, rss=900)
+        assert budget.max_chars == 1_250_000
+        budget.update(1_250_000, 1.0, rss=500)
+        assert budget.max_chars == 1_562_500
+        # Nor slower batches
+        budget.update(1_562_500, 2.0, rss=500)
+        assert budget.max_chars == 1_562_500
+        # The budget doesn't grow beyond its maximum number of characters
+        budget.update(1_562_500, 1.0, rss=500)
+        assert budget.max_chars == 1_953_125
+        budget.update(1_953_125, 1.0, rss=500)
+        assert budget.max_chars == 2_000_000
+
+    def test_length_sorted_batches(self):
+        texts = ["a b c d", "a", "a b c d e f", "a b", "a b c", "a b c d e"]
+        rows = [(text, [str(i)]) for i, text in enumerate(texts)]
+        parser = WordsParser()
+        annotated = list(
+            LengthSortedParser(
+                parser, window=6, budget=BatchBudget(max_chars=8)
+            ).annotate_batches([rows[:3], rows[3:]], batch_size=3)
+        )
+        assert parser.batches == [
+            ["a", "a b"],
+            ["a b c"],
+            ["a b c d"],
+            ["a b c d e"],
+            ["a b c d e f"],
+        ]
+        assert [[text for _, _, text in a] for a, _ in annotated] == [
+            texts[:3],
+            texts[3:],
+        ]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+"""
+Compare the throughput of the built-in CoNLL reader with spacy_conll's
+parse_conll_text_as_spacy, on CoNLL strings taken from the demo and test data.
+
+    python -m test.benchmarks.conll_reader --docs 5000
+"""
+import gzip
+import time
+from itertools import cycle, islice
+from pathlib import Path
+
+import casanova
+import spacy
+import typer
+from spacy_conll import init_parser
+from spacy_conll.parser import ConllParser
+
+from src.utils.conll import conll_to_doc
+
+DATAFILES = [
+    *Path("demo").glob("*_parsed.csv"),
+    *Path("test", "data").glob("*/*.conll.csv.gz"),
+]
+
+
+def load_conll_strings(n: int) -> list[str]:
+    conll_strings = []
+    for datafile in DATAFILES:
+        if datafile.suffix == ".gz":
+            f = gzip.open(datafile, "rt")
+        else:
+            f = open(datafile)
+        with f, casanova.reader(f) as reader:
+            conll_strings.extend(reader.cells("conll_string"))
+    return list(islice(cycle(conll_strings), n))
+
+
+def docs_per_second(convert, conll_strings: list[str]) -> float:
+    start = time.perf_counter()
+    for conll_str in conll_strings:
+        convert(conll_str)
+    return len(conll_strings) / (time.perf_counter() - start)
+
+
+def main(docs: int = 2000, spacy_language: str = "en_core_web_lg"):
+    conll_strings = load_conll_strings(docs)
+
+    legacy_parser = ConllParser(init_parser(spacy_language, "spacy"))
+    vocab = legacy_parser.nlp.vocab
+
+    legacy = docs_per_second(legacy_parser.parse_conll_text_as_spacy, conll_strings)
+    fast = docs_per_second(lambda s: conll_to_doc(vocab, s), conll_strings)
+
+    print(f"spacy_conll : {legacy:10.1f} docs/sec")
+    print(f"conll_to_doc: {fast:10.1f} docs/sec ({fast / legacy:.1f}x)")
+
+
+if __name__ == "__main__":
+    typer.run(main)
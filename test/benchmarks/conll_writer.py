@@ -0,0 +1,43 @@
+"""
+Compare the throughput of the built-in CoNLL writer with spacy_conll's
+conll_formatter pipe, on documents rebuilt from the CoNLL strings of the demo
+and test data.
+
+    python -m test.benchmarks.conll_writer --docs 5000
+"""
+import time
+from itertools import cycle, islice
+
+import spacy
+import spacy_conll  # noqa: F401
+import typer
+
+from src.utils.conll import doc_to_conll
+from test.conll_writer import load_conll_strings, parsed_doc
+
+
+def docs_per_second(convert, docs: list) -> tuple[float, list[str]]:
+    start = time.perf_counter()
+    conll_strings = [convert(doc) for doc in docs]
+    return len(docs) / (time.perf_counter() - start), conll_strings
+
+
+def main(docs: int = 5000):
+    nlp = spacy.blank("en")
+    formatter = nlp.add_pipe("conll_formatter", config={"disable_pandas": True})
+    conll_strings = load_conll_strings()
+    parsed = [
+        parsed_doc(nlp.vocab, conll_str)
+        for conll_str in islice(cycle(conll_strings), docs)
+    ]
+
+    legacy, expected = docs_per_second(lambda doc: formatter(doc)._.conll_str, parsed)
+    fast, written = docs_per_second(doc_to_conll, parsed)
+    assert written == expected, "CoNLL strings differ"
+
+    print(f"conll_formatter: {legacy:10.1f} docs/sec")
+    print(f"doc_to_conll   : {fast:10.1f} docs/sec ({fast / legacy:.1f}x)")
+
+
+if __name__ == "__main__":
+    typer.run(main)
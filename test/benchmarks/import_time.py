@@ -0,0 +1,49 @@
+"""
+Measure, with 'python -X importtime', how long the CLI's modules take to
+import and which heavy packages they load.
+
+    python -m test.benchmarks.import_time --budget 1.0
+"""
+import subprocess
+import sys
+
+import typer
+
+# Packages that should only be imported once a command needs them
+HEAVY_MODULES = ["torch", "stanza", "spacy_stanza", "hopsparser", "spacy_conll", "spacy"]
+
+
+def import_time(module: str) -> tuple[float, list[str]]:
+    """
+    Import a module in a fresh interpreter and return its cumulative import
+    time, in seconds, and the heavy packages it imported.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    seconds, imported = 0.0, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        name = name.strip()
+        if name == module:
+            seconds = int(cumulative) / 1e6
+        if name in HEAVY_MODULES:
+            imported.add(name)
+    return seconds, sorted(imported)
+
+
+def main(module: str = "src.main", budget: float = 1.0):
+    seconds, imported = import_time(module)
+    print(f"{module}: {seconds:.3f} sec (budget: {budget:.3f} sec)")
+    print("Heavy packages imported: {}".format(", ".join(imported) or "none"))
+    if seconds > budget or imported:
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,94 @@
+"""
+Compare the throughput of parse's SpacyParser on texts in file order and on
+texts sorted by length within windows of rows (--sort-window), on a synthetic
+corpus made of the demo's texts. Also report how many padded characters the
+model's internal batches would hold, relative to the texts' own characters.
+
+The defaults benchmark the Hopsparser (FlauBERT) backend, whose model has to
+be downloaded beforehand.
+
+    python -m test.benchmarks.length_sorting --rows 5000 --window 5000 \\
+        --model hopsparser --lang fr_core_news_sm \\
+        --model-path hopsparser_model/UD_all_spoken_French-flaubert
+"""
+import tempfile
+import time
+from pathlib import Path
+
+import casanova
+import typer
+
+from src.cli.parse_command import LengthSortedParser, yield_batches_of_texts
+from src.constants import DEFAULT_HOPSPARSER_MODEL_NAME, ModelType
+from src.parsers import SpacyParser
+from test.benchmarks.suite import write_corpus
+
+
+class RecordingParser:
+    """Wrapper around a parser that records the texts of the batches it parses."""
+
+    def __init__(self, parser: SpacyParser) -> None:
+        self.parser = parser
+        self.batches = []
+
+    def annotate_batches(self, batches, batch_size, docbin=False):
+        def recorded():
+            for batch in batches:
+                batch = list(batch)
+                self.batches.append([text for text, _ in batch])
+                yield batch
+
+        yield from self.parser.annotate_batches(recorded(), batch_size, docbin)
+
+
+def padding_ratio(batches: list[list[str]], model_batch_size: int) -> float:
+    """
+    Ratio of the characters of the model's internal batches, padded to the
+    longest text of each batch, to the characters of the texts.
+    """
+    padded, total = 0, 0
+    for batch in batches:
+        for i in range(0, len(batch), model_batch_size):
+            lengths = [len(text) for text in batch[i : i + model_batch_size]]
+            padded += max(lengths) * len(lengths)
+            total += sum(lengths)
+    return padded / total if total else 1.0
+
+
+def main(
+    rows: int = 5000,
+    batch_size: int = 1000,
+    window: int = 5000,
+    model: ModelType = ModelType.hop,
+    lang: str = "fr_core_news_sm",
+    model_path: str = str(Path("hopsparser_model", DEFAULT_HOPSPARSER_MODEL_NAME)),
+    model_batch_size: int = 64,
+):
+    parser = SpacyParser(model, lang, model_path)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        textfile, _ = write_corpus(Path(tmpdir), rows)
+
+        results = {}
+        for name, sort_window in [("file order", 0), ("sorted", window)]:
+            recorder = RecordingParser(parser)
+            wrapped = LengthSortedParser(recorder, sort_window) if sort_window else recorder
+            with casanova.reader(textfile) as reader:
+                batches = yield_batches_of_texts(reader, "text", batch_size)
+                start = time.perf_counter()
+                annotations = [
+                    annotation
+                    for annotated, _ in wrapped.annotate_batches(batches, batch_size)
+                    for annotation in annotated
+                ]
+                seconds = time.perf_counter() - start
+            results[name] = annotations
+            print(
+                f"{name:10}: {rows / seconds:10.1f} texts/sec,",
+                f"padding {padding_ratio(recorder.batches, model_batch_size):.2f}x",
+            )
+
+    assert results["file order"] == results["sorted"], "Annotations differ"
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,80 @@
+"""
+Compare the throughput of match_dependencies with the previous
+implementation, which filled a copy of the row dictionary column by column,
+on the demo's parsed documents and complex_semgrex.json patterns.
+
+    python -m test.benchmarks.match_rows --docs 5000
+"""
+import time
+from itertools import cycle, islice
+from pathlib import Path
+
+import casanova
+import typer
+from spacy.tokens.doc import Doc
+from spacy.vocab import Vocab
+
+from src.cli.match_command import MatchIndex, form_column_prefix, match_dependencies
+from src.parsers import SemgrexMatcher
+from src.utils.conll import conll_to_doc
+
+
+def legacy_match_dependencies(
+    doc: Doc, parser: SemgrexMatcher, match_index: MatchIndex
+) -> list[list]:
+    rows = []
+    for pattern_hash, token_ids in parser.matcher(doc):
+        pattern_name = parser.matcher.vocab.strings[pattern_hash]
+        _, pattern = parser.matcher.get(pattern_hash)
+        d = match_index.row_dict.copy()
+        for i in range(len(token_ids)):
+            node_name = pattern[0][i]["RIGHT_ID"]
+            node_token = doc[token_ids[i]]
+            col_prefix = form_column_prefix(
+                pattern_name=pattern_name, node_name=node_name
+            )
+            d.update(
+                {
+                    "{}id".format(col_prefix): node_token.i,
+                    "{}lemma".format(col_prefix): node_token.lemma_,
+                    "{}pos".format(col_prefix): node_token.pos_,
+                    "{}deprel".format(col_prefix): node_token.dep_,
+                    "{}entity".format(col_prefix): node_token.ent_type_,
+                }
+            )
+        rows.append(list(d.values()))
+    return rows
+
+
+def load_docs(vocab: Vocab, n: int) -> list[Doc]:
+    with casanova.reader(Path("demo", "complex_parsed.csv")) as reader:
+        docs = [conll_to_doc(vocab, conll_str) for conll_str in reader.cells("conll_string")]
+    return list(islice(cycle(docs), n))
+
+
+def main(docs: int = 2000, matchfile: Path = Path("demo", "complex_semgrex.json")):
+    match_index = MatchIndex(matchfile)
+    vocab = Vocab()
+    parser = SemgrexMatcher(vocab)
+    parser.add_semgrex(match_index.matches)
+    corpus = load_docs(vocab, docs)
+
+    timings = {}
+    for name, match in [
+        ("legacy", legacy_match_dependencies),
+        ("match_dependencies", lambda *args: list(match_dependencies(*args))),
+    ]:
+        start = time.perf_counter()
+        rows = [match(doc, parser, match_index) for doc in corpus]
+        timings[name] = time.perf_counter() - start
+        n_rows = sum(map(len, rows))
+
+    legacy = timings["legacy"]
+    for name, seconds in timings.items():
+        print(
+            f"{name:20}: {docs / seconds:10.1f} docs/sec ({legacy / seconds:.1f}x), {n_rows} rows"
+        )
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,77 @@
+"""
+Compare the throughput of the --clean-social normalizer with the previous
+implementation, which ran emoji.replace_emoji and five separate regex passes
+on each text, on the texts of the demo and test data.
+
+    python -m test.benchmarks.normalizer --texts 50000 --workers 4
+"""
+import re
+import time
+from itertools import cycle, islice
+from pathlib import Path
+
+import casanova
+import emoji
+import typer
+from ural.patterns import URL_IN_TEXT_RE
+
+from src.cli.parse_command import preprocess_batches
+from src.utils.normalizer import normalize_batch
+
+DATAFILES = [
+    *Path("demo").glob("*_text.csv"),
+    *Path("test", "data").glob("*/*.text.csv"),
+]
+
+
+def legacy_normalizer(text: str) -> str:
+    text = emoji.replace_emoji(text, replace="")
+    text = re.sub(r"(^\s*\S+(\s+\S+)?\s*):", "\\1.", text)
+    text = URL_IN_TEXT_RE.sub(repl="", string=text)
+    text = re.sub(r"(?!https)via(\s{0,}@\w*)", "", text)
+    text = re.sub(r"[@#]", "", text)
+    text = text.strip()
+    text = re.sub(r"\s+", " ", text)
+    return text
+
+
+def load_texts(n: int | None = None) -> list[str]:
+    texts = []
+    for datafile in DATAFILES:
+        with casanova.reader(datafile) as reader:
+            texts.extend(reader.cells("text"))
+    if n is None:
+        return texts
+    return list(islice(cycle(texts), n))
+
+
+def texts_per_second(normalize, texts: list[str]) -> float:
+    start = time.perf_counter()
+    normalize(texts)
+    return len(texts) / (time.perf_counter() - start)
+
+
+def main(texts: int = 20000, workers: int = 4, batch_size: int = 1000):
+    corpus = load_texts(texts)
+
+    legacy = texts_per_second(
+        lambda texts: [legacy_normalizer(text) for text in texts], corpus
+    )
+    batched = texts_per_second(normalize_batch, corpus)
+    batches = [
+        [(text, []) for text in corpus[i : i + batch_size]]
+        for i in range(0, len(corpus), batch_size)
+    ]
+    pooled = texts_per_second(
+        lambda _: list(preprocess_batches(batches, workers)), corpus
+    )
+
+    print(f"legacy normalizer    : {legacy:10.1f} texts/sec")
+    print(f"normalize_batch      : {batched:10.1f} texts/sec ({batched / legacy:.1f}x)")
+    print(
+        f"{workers} worker processes   : {pooled:10.1f} texts/sec ({pooled / legacy:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    typer.run(main)
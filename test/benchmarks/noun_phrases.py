@@ -0,0 +1,83 @@
+"""
+Show that filling the noun phrase columns keeps match linear in the length
+of the documents: every nominal token of documents made of more and more
+sentences is matched, and its phrase is taken either from the per-document
+span index or by walking its subtree.
+
+    python -m test.benchmarks.noun_phrases --max-sentences 1000
+"""
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import typer
+from spacy.tokens.doc import Doc
+from spacy.vocab import Vocab
+
+from src.cli.match_command import MatchIndex, match_dependencies
+from src.parsers import SemgrexMatcher
+from src.utils.conll import conll_to_doc
+from test.prefilter import load_sentences
+
+# Match every nominal token alongside its head
+PATTERNS = {
+    "Nominal": [
+        {"RIGHT_ID": "head", "RIGHT_ATTRS": {}},
+        {
+            "LEFT_ID": "head",
+            "REL_OP": ">",
+            "RIGHT_ID": "nominal",
+            "RIGHT_ATTRS": {"POS": {"IN": ["NOUN", "PROPN", "PRON"]}},
+        },
+    ]
+}
+
+
+def subtree_phrases(doc: Doc, parser: SemgrexMatcher) -> list[str]:
+    phrases = []
+    for _, (_, token_id) in parser.matcher(doc):
+        subtree = list(doc[token_id].subtree)
+        phrases.append(doc[subtree[0].i : subtree[-1].i + 1].text)
+    return phrases
+
+
+def main(max_sentences: int = 1000):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        matchfile = Path(tmpdir).joinpath("patterns.json")
+        with open(matchfile, "w") as f:
+            json.dump(PATTERNS, f)
+        match_index = MatchIndex(matchfile)
+    vocab = Vocab()
+    parser = SemgrexMatcher(vocab)
+    parser.add_semgrex(match_index.matches)
+    sentences = load_sentences()
+
+    print(
+        f"{'sentences':>10} {'tokens':>8} {'matches':>8}",
+        f"{'index µs/match':>15} {'subtree µs/match':>17}",
+    )
+    n = 1
+    while n <= max_sentences:
+        conll_str = "\n\n".join(sentences[i % len(sentences)] for i in range(n))
+        doc = conll_to_doc(vocab, conll_str)
+        matcher_matches = parser.matcher(doc)
+
+        start = time.perf_counter()
+        rows = list(match_dependencies(doc, parser, match_index))
+        indexed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        subtree_phrases(doc, parser)
+        walked = time.perf_counter() - start
+
+        matches = len(matcher_matches)
+        print(
+            f"{n:>10} {len(doc):>8} {len(rows):>8}",
+            f"{indexed / matches * 1e6:>15.1f} {walked / matches * 1e6:>17.1f}",
+        )
+        n *= 10
+
+
+if __name__ == "__main__":
+    typer.run(main)
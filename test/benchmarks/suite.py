@@ -0,0 +1,304 @@
+"""
+Measure the throughput and peak memory of each stage of the parse and match
+commands on a synthetic corpus, made of the demo's texts and parsed texts
+repeated up to the requested number of rows, and save the results to a JSON
+file that can be compared with the results of another version.
+
+Each stage runs in a fresh process, so that its peak RSS isn't inflated by
+the stages before it. The spaCy stage loads an installed model, or a model
+directory, and never downloads anything.
+
+    python -m test.benchmarks.suite --rows 10000 --model en_core_web_sm \\
+        --output benchmark.json --baseline previous_benchmark.json
+"""
+import json
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from importlib.metadata import PackageNotFoundError, version
+from itertools import cycle, islice
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Callable, Optional
+
+import casanova
+import typer
+
+DEMO_DIR = Path("demo")
+MATCHFILE = DEMO_DIR.joinpath("complex_semgrex.json")
+
+
+def write_corpus(directory: Path, rows: int) -> tuple[Path, Path]:
+    """
+    Write synthetic text and parsed in-files of the given number of rows, by
+    repeating the demo's rows under new IDs.
+    """
+    texts, parsed = [], []
+    for name in ["simple", "complex"]:
+        with casanova.reader(DEMO_DIR.joinpath(f"{name}_text.csv")) as reader:
+            texts.extend(reader.cells("text"))
+        with casanova.reader(DEMO_DIR.joinpath(f"{name}_parsed.csv")) as reader:
+            parsed.extend(reader.cells("conll_string"))
+
+    textfile = directory.joinpath("corpus_text.csv")
+    with open(textfile, "w") as f:
+        writer = casanova.writer(f, fieldnames=["id", "text"])
+        for i, text in enumerate(islice(cycle(texts), rows)):
+            writer.writerow([i, text])
+
+    parsedfile = directory.joinpath("corpus_parsed.csv")
+    with open(parsedfile, "w") as f:
+        writer = casanova.writer(f, fieldnames=["id", "conll_string"])
+        for i, conll_string in enumerate(islice(cycle(parsed), rows)):
+            writer.writerow([i, conll_string])
+
+    return textfile, parsedfile
+
+
+def read_column(path: Path, column: str) -> list[str]:
+    with casanova.reader(path) as reader:
+        return list(reader.cells(column))
+
+
+# Each stage prepares its input, untimed, and returns the function to time,
+# which returns the number of items it processed, and the items' unit
+
+Stage = Callable[[Path, Path, str, int], tuple[Callable[[], int], str]]
+
+
+def batches_stage(textfile: Path, parsedfile: Path, model: str, batch_size: int):
+    from src.cli.parse_command import yield_batches_of_texts
+
+    def run():
+        with casanova.reader(textfile) as reader:
+            batches = yield_batches_of_texts(reader, "text", batch_size)
+            return sum(len(batch) for batch in batches)
+
+    return run, "texts"
+
+
+def normalizer_stage(textfile: Path, parsedfile: Path, model: str, batch_size: int):
+    from src.utils.normalizer import normalizer
+
+    texts = read_column(textfile, "text")
+
+    def run():
+        for text in texts:
+            normalizer(text)
+        return len(texts)
+
+    return run, "texts"
+
+
+def spacy_stage(textfile: Path, parsedfile: Path, model: str, batch_size: int):
+    from src.constants import ModelType
+    from src.parsers import SpacyParser
+
+    parser = SpacyParser(ModelType.spacy, model)
+    texts = read_column(textfile, "text")
+
+    def run():
+        return sum(1 for _ in parser.annotate(((t, []) for t in texts), batch_size))
+
+    return run, "texts"
+
+
+def conll_stage(textfile: Path, parsedfile: Path, model: str, batch_size: int):
+    from src.parsers import ConLLParser
+
+    parser = ConLLParser(model)
+    conll_strings = read_column(parsedfile, "conll_string")
+
+    def run():
+        for conll_string in conll_strings:
+            parser(conll_string)
+        return len(conll_strings)
+
+    return run, "documents"
+
+
+def match_stage(textfile: Path, parsedfile: Path, model: str, batch_size: int):
+    from spacy.vocab import Vocab
+
+    from src.cli.match_command import MatchIndex, match_dependencies
+    from src.parsers import SemgrexMatcher
+    from src.utils.conll import conll_to_doc
+
+    match_index = MatchIndex(MATCHFILE)
+    vocab = Vocab()
+    parser = SemgrexMatcher(vocab)
+    parser.add_semgrex(match_index.matches)
+    docs = [conll_to_doc(vocab, s) for s in read_column(parsedfile, "conll_string")]
+
+    def run():
+        for doc in docs:
+            for _ in match_dependencies(doc, parser, match_index):
+                pass
+        return len(docs)
+
+    return run, "documents"
+
+
+def match_workers_stage(workers: int) -> Stage:
+    def stage(textfile: Path, parsedfile: Path, model: str, batch_size: int):
+        from src.cli.match_command import MatcherPool, MatchIndex, conll_converter, match_docs
+        from src.parsers import ConLLParser, SemgrexMatcher
+
+        # As 'match --workers', from reading the CoNLL strings to the output
+        # rows, including the start of the worker processes
+        def run():
+            with casanova.reader(parsedfile) as reader:
+                if workers > 1:
+                    pool = MatcherPool(workers, "blank:en", MATCHFILE)
+                    rows = pool.match(reader, "conll_string")
+                else:
+                    conll_parser = ConLLParser("blank:en")
+                    parser = SemgrexMatcher(conll_parser.vocab)
+                    match_index = MatchIndex(MATCHFILE)
+                    parser.add_semgrex(match_index.matches)
+                    docs = conll_converter(
+                        reader, "conll_string", conll_parser, match_index
+                    )
+                    rows = match_docs(docs, parser, match_index)
+                return sum(1 for _ in rows)
+
+        return run, "documents"
+
+    return stage
+
+
+def output_stream_stage(compression: str) -> Stage:
+    def stage(textfile: Path, parsedfile: Path, model: str, batch_size: int):
+        from src.constants import Compression
+        from src.utils.filesystem import OutputStream
+
+        with casanova.reader(parsedfile) as reader:
+            rows = [reader.fieldnames, *reader]
+        outfile = parsedfile.with_name("compressed.csv")
+
+        def run():
+            # Write the rows as the out-files are, with a checkpoint per batch
+            with OutputStream(outfile, Compression(compression)) as stream:
+                writer = casanova.writer(stream, fieldnames=rows[0])
+                for i, row in enumerate(rows[1:], 1):
+                    writer.writerow(row)
+                    if i % batch_size == 0:
+                        stream.checkpoint()
+            return parsedfile.stat().st_size
+
+        return run, "bytes"
+
+    return stage
+
+
+STAGES: dict[str, Stage] = {
+    "yield_batches_of_texts": batches_stage,
+    "normalizer": normalizer_stage,
+    "spacy_annotate": spacy_stage,
+    "conll_parser": conll_stage,
+    "match_dependencies": match_stage,
+    "match_workers_1": match_workers_stage(1),
+    "match_workers_2": match_workers_stage(2),
+    "match_workers_4": match_workers_stage(4),
+    "output_stream_gzip": output_stream_stage("gzip"),
+    "output_stream_zstd": output_stream_stage("zstd"),
+}
+
+
+def run_stage(
+    name: str, textfile: Path, parsedfile: Path, model: str, batch_size: int
+) -> dict:
+    run, unit = STAGES[name](textfile, parsedfile, model, batch_size)
+    start = time.perf_counter()
+    items = run()
+    seconds = time.perf_counter() - start
+    # Linux reports the maximum resident set size in kilobytes
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return {
+        "items": items,
+        "unit": unit,
+        "seconds": seconds,
+        "throughput": items / seconds if seconds else None,
+        "peak_rss_mb": peak_rss / 1024 / 1024,
+    }
+
+
+def environment() -> dict:
+    def package_version(name: str) -> str | None:
+        try:
+            return version(name)
+        except PackageNotFoundError:
+            return None
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "packages": {
+            name: package_version(name)
+            for name in ["spacy", "spacy-conll", "casanova", "emoji"]
+        },
+    }
+
+
+def main(
+    rows: int = 10000,
+    model: str = "en_core_web_sm",
+    batch_size: int = 100,
+    output: Path = Path("benchmark.json"),
+    baseline: Optional[Path] = None,
+    stage: Optional[list[str]] = None,
+):
+    stages = stage or list(STAGES)
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise typer.BadParameter(
+            "Unknown stages: {}. Choose among {}".format(
+                ", ".join(sorted(unknown)), ", ".join(STAGES)
+            )
+        )
+    previous = json.loads(baseline.read_text())["stages"] if baseline else {}
+
+    results = {"rows": rows, "model": model, "batch_size": batch_size}
+    results.update(environment())
+    results["stages"] = {}
+    context = get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        textfile, parsedfile = write_corpus(Path(tmpdir), rows)
+        for name in stages:
+            # One process per stage, so that each peak RSS is the stage's own.
+            # Unlike a Pool's, the executor's process can start workers itself
+            with ProcessPoolExecutor(1, mp_context=context) as executor:
+                result = executor.submit(
+                    run_stage, name, textfile, parsedfile, model, batch_size
+                ).result()
+            results["stages"][name] = result
+            line = "{:24}: {:14.1f} {}/sec, peak RSS {:7.1f} MB".format(
+                name, result["throughput"], result["unit"], result["peak_rss_mb"]
+            )
+            if name in previous and previous[name]["throughput"]:
+                line += " ({:.2f}x baseline)".format(
+                    result["throughput"] / previous[name]["throughput"]
+                )
+            print(line, file=sys.stderr)
+
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to '{output}'", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,71 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.cli.parse_command import CachedParser
+from src.utils.cache import ParseCache
+
+
+class UpperCaseParser:
+    """Parser annotating texts in upper case, which records what it parsed."""
+
+    def __init__(self) -> None:
+        self.parsed = []
+
+    def annotate_batches(self, batches, batch_size, docbin=False):
+        for batch in batches:
+            self.parsed.extend(text for text, _ in batch)
+            yield [(row, text.upper(), text) for text, row in batch], None
+
+
+class Cache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpdir.name).joinpath("cache.db")
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_only_misses_are_parsed(self):
+        batches = [
+            [("a", ["1"]), ("b", ["2"]), ("a", ["3"])],
+            [("b", ["4"]), ("c", ["5"])],
+        ]
+        with ParseCache(self.path, "model") as cache:
+            parser = UpperCaseParser()
+            annotations = [
+                annotation
+                for batch, _ in CachedParser(parser, cache).annotate_batches(
+                    batches, batch_size=2
+                )
+                for annotation in batch
+            ]
+        assert parser.parsed == ["a", "b", "c"]
+        assert annotations == [
+            (["1"], "A", "a"),
+            (["2"], "B", "b"),
+            (["3"], "A", "a"),
+            (["4"], "B", "b"),
+            (["5"], "C", "c"),
+        ]
+        assert cache.hits == 2 and cache.misses == 3
+
+        # Another parser's annotations aren't reused
+        with ParseCache(self.path, "other model") as cache:
+            parser = UpperCaseParser()
+            list(CachedParser(parser, cache).annotate_batches(batches, batch_size=2))
+        assert parser.parsed == ["a", "b", "c"]
+
+    def test_least_recently_used_are_evicted(self):
+        with ParseCache(self.path, "model") as cache:
+            cache.max_bytes = 4
+            cache.put_many([("a", "a", "a", None), ("b", "b", "b", None)])
+            # Reading 'a' makes 'b' the least recently used entry
+            assert cache.get_many(["a"]) == {"a": ("a", "a", None)}
+            cache.put_many([("c", "c", "c", None)])
+            assert set(cache.get_many(["a", "b", "c"])) == {"a", "c"}
+            assert cache.total_bytes == 4
+
+
+if __name__ == "__main__":
+    unittest.main()
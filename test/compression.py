@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.constants import Compression
+from src.utils.filesystem import Checkpoint, OutputStream, open_infile, zstandard
+
+ROWS = ["id,text\n"] + ["{},été\n".format(i) for i in range(1000)]
+
+
+class Stream(unittest.TestCase):
+    def write_and_read(self, compression: Compression) -> str:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir).joinpath("out.csv")
+            with OutputStream(path, compression) as stream:
+                for i, row in enumerate(ROWS):
+                    stream.write(row)
+                    if i % 100 == 0:
+                        stream.checkpoint()
+            with open_infile(path) as f:
+                return f.read()
+
+    def test_gzip(self):
+        assert self.write_and_read(Compression.gzip) == "".join(ROWS)
+
+    def test_none(self):
+        assert self.write_and_read(Compression.none) == "".join(ROWS)
+
+    @unittest.skipIf(zstandard is None, "zstandard is not installed")
+    def test_zstd(self):
+        assert self.write_and_read(Compression.zstd) == "".join(ROWS)
+
+    def test_killed_after_checkpoint(self):
+        for compression in Compression:
+            if compression == Compression.zstd and zstandard is None:
+                continue
+            with tempfile.TemporaryDirectory() as tmpdir:
+                path = Path(tmpdir).joinpath("out.csv")
+                checkpoint = Checkpoint(path)
+                stream = OutputStream(path, compression).__enter__()
+                for i, row in enumerate(ROWS[:500]):
+                    stream.write(row)
+                    if i % 100 == 99:
+                        checkpoint.save(rows=i + 1, offset=stream.checkpoint())
+                # Rows written after the last checkpoint reach the file, but
+                # the program is killed before the next checkpoint, and the
+                # file is cut at the checkpointed size
+                for row in ROWS[500:]:
+                    stream.write(row)
+                stream.stream.flush()
+                stream.raw.flush()
+                assert path.stat().st_size > checkpoint.load()["offset"]
+                os.truncate(path, checkpoint.load()["offset"])
+                stream.raw.close()
+                with open_infile(path) as f:
+                    assert f.read() == "".join(ROWS[: checkpoint.load()["rows"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
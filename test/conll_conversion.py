@@ -1,5 +1,4 @@
-from src.main import setup_parser
-from src.parsers import ConLLParser
+from src.parsers import ConLLParser, setup_parser
 import unittest
 from spacy.tokens.doc import Doc
 
@@ -21,7 +20,7 @@ class LegitimateString(unittest.TestCase):
         dep_parser = setup_parser(lang="en")
         conll_parser = ConLLParser(lang="en")
         for doc, _ in dep_parser.pipe(batch=MISSING_LEMMA_BATCH, batch_size=1):
-            conll_str = doc._.conll_str
+            conll_str = dep_parser.to_conll(doc)
             doc = conll_parser(conll_str)
             assert isinstance(doc, Doc)
 
@@ -0,0 +1,76 @@
+import unittest
+from pathlib import Path
+
+import casanova
+import spacy
+from spacy.attrs import (
+    DEP,
+    ENT_IOB,
+    ENT_TYPE,
+    HEAD,
+    LEMMA,
+    MORPH,
+    ORTH,
+    POS,
+    SENT_START,
+    SPACY,
+    TAG,
+)
+from spacy_conll.parser import ConllParser
+
+from src.utils.conll import conll_to_doc
+
+demo_dir = Path("demo")
+
+ATTRS = [ORTH, SPACY, TAG, POS, MORPH, LEMMA, HEAD, DEP, ENT_IOB, ENT_TYPE, SENT_START]
+
+VALID_CONLL = "1\tJohn\tJohn\tPROPN\tNNP\t_\t2\tnsubj\t_\tNE=B-PER\n2\tSmith\tSmith\tPROPN\tNNP\t_\t0\troot\t_\tNE=I-PER|SpaceAfter=No\n\n1\tok\tok\tINTJ\tUH\t_\t0\troot\t_\tSpaceAfter=No\n"
+
+INVALID_CONLL = [
+    "",
+    "1\ta\ta\tX\tX\t_\t0\troot\t_\t_\n2\tb\tb\tX\tX\t_\t0\troot\t_\t_\n",
+    "1\ta\t\tX\tX\t_\t0\troot\t_\t_\n",
+    "1-2\ta\ta\tX\tX\t_\t0\troot\t_\t_\n",
+]
+
+
+class FastReader(unittest.TestCase):
+    def setUp(self):
+        nlp = spacy.blank("en")
+        nlp.add_pipe("conll_formatter")
+        self.legacy_parser = ConllParser(nlp)
+        self.vocab = nlp.vocab
+
+    def assert_same_doc(self, conll_str: str):
+        legacy_doc = self.legacy_parser.parse_conll_text_as_spacy(conll_str)
+        doc = conll_to_doc(self.vocab, conll_str)
+        assert doc.text == legacy_doc.text
+        assert (doc.to_array(ATTRS) == legacy_doc.to_array(ATTRS)).all()
+
+    def test_demo(self):
+        for datafile in demo_dir.glob("*_parsed.csv"):
+            with casanova.reader(datafile) as reader:
+                for conll_str in reader.cells("conll_string"):
+                    self.assert_same_doc(conll_str)
+
+    def test_entities(self):
+        self.assert_same_doc(VALID_CONLL)
+        doc = conll_to_doc(self.vocab, VALID_CONLL)
+        assert [(ent.text, ent.label_) for ent in doc.ents] == [("John Smith", "PER")]
+
+    def test_unspecified_pos(self):
+        # As written by 'parse --needs' when the POS tags aren't needed
+        conll_str = "1\tok\t_\t_\t_\t_\t0\troot\t_\t_\n"
+        doc = conll_to_doc(self.vocab, conll_str)
+        assert [(t.pos_, t.tag_, t.dep_) for t in doc] == [("", "", "ROOT")]
+
+    def test_invalid(self):
+        for conll_str in INVALID_CONLL:
+            with self.assertRaises(Exception) as legacy_error:
+                self.legacy_parser.parse_conll_text_as_spacy(conll_str)
+            with self.assertRaises(type(legacy_error.exception)):
+                conll_to_doc(self.vocab, conll_str)
+
+
+if __name__ == "__main__":
+    unittest.main()
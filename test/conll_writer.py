@@ -0,0 +1,116 @@
+import gzip
+import unittest
+from pathlib import Path
+
+import casanova
+import spacy
+import spacy_conll  # noqa: F401
+from spacy.tokens import Span
+from spacy.tokens.doc import Doc
+from spacy.vocab import Vocab
+
+from src.utils.conll import conll_to_doc, doc_to_conll
+
+DATAFILES = [
+    *Path("demo").glob("*_parsed.csv"),
+    *Path("test", "data").glob("*/*.conll.csv.gz"),
+]
+
+CONVERSION_MAPS = {
+    "LEMMA": {"": "_", "be": "BE"},
+    "FEATS": {"_": "None"},
+    "DEPREL": {"root": "ROOT", "nsubj": "subj"},
+}
+
+
+def load_conll_strings() -> list[str]:
+    conll_strings = []
+    for datafile in DATAFILES:
+        if datafile.suffix == ".gz":
+            f = gzip.open(datafile, "rt")
+        else:
+            f = open(datafile)
+        with f, casanova.reader(f) as reader:
+            conll_strings.extend(reader.cells("conll_string"))
+    return conll_strings
+
+
+def parsed_doc(vocab: Vocab, conll_str: str) -> Doc:
+    """
+    Rebuild the parsed Doc that a CoNLL string was written from, keeping its
+    fields verbatim, unlike the CoNLL reader which relabels the roots and
+    adds a space after each sentence.
+    """
+    words, spaces, lemmas, poses, tags, morphs = [], [], [], [], [], []
+    heads, deps, sent_starts = [], [], []
+    for sentence in conll_str.strip("\n").split("\n\n"):
+        offset = len(words)
+        for i, line in enumerate(sentence.splitlines()):
+            _, form, lemma, upos, xpos, feats, head, deprel, _, misc = line.split("\t")
+            words.append(form)
+            spaces.append(misc != "SpaceAfter=No")
+            lemmas.append(lemma)
+            poses.append(upos)
+            tags.append(xpos)
+            morphs.append("" if feats == "_" else feats)
+            heads.append(offset + int(head) - 1 if head != "0" else offset + i)
+            deps.append(deprel)
+            sent_starts.append(i == 0)
+    return Doc(
+        vocab,
+        words=words,
+        spaces=spaces,
+        lemmas=lemmas,
+        pos=poses,
+        tags=tags,
+        morphs=morphs,
+        heads=heads,
+        deps=deps,
+        sent_starts=sent_starts,
+    )
+
+
+class FastWriter(unittest.TestCase):
+    def setUp(self):
+        self.nlp = spacy.blank("en")
+        self.conll_strings = load_conll_strings()
+        assert self.conll_strings
+
+    def test_same_strings_as_parsed(self):
+        for conll_str in self.conll_strings:
+            doc = parsed_doc(self.nlp.vocab, conll_str)
+            assert doc_to_conll(doc) == conll_str
+
+    def test_same_strings_as_legacy(self):
+        for conversion_maps in [None, CONVERSION_MAPS]:
+            formatter = self.nlp.add_pipe(
+                "conll_formatter",
+                config={"conversion_maps": conversion_maps, "disable_pandas": True},
+            )
+            for conll_str in self.conll_strings:
+                doc = parsed_doc(self.nlp.vocab, conll_str)
+                expected = formatter(doc)._.conll_str
+                assert doc_to_conll(doc, conversion_maps) == expected
+            self.nlp.remove_pipe("conll_formatter")
+
+    def test_entities_are_read_back(self):
+        conll_str = self.conll_strings[0]
+        doc = parsed_doc(self.nlp.vocab, conll_str)
+        doc.set_ents(
+            [Span(doc, 0, 1, "ORG"), Span(doc, 2, 4, "WORK_OF_ART")],
+            default="outside",
+        )
+        read_doc = conll_to_doc(self.nlp.vocab, doc_to_conll(doc))
+        assert [(e.start, e.end, e.label_) for e in read_doc.ents] == [
+            (e.start, e.end, e.label_) for e in doc.ents
+        ]
+        # The strings of documents without entities are left as they were
+        doc.set_ents([], default="outside")
+        assert doc_to_conll(doc) == conll_str
+
+    def test_empty_doc(self):
+        assert doc_to_conll(self.nlp("")) == ""
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import casanova
+from spacy.attrs import DEP, HEAD, LEMMA, ORTH, POS
+from spacy.tokens import DocBin
+from spacy.vocab import Vocab
+
+from src.utils.conll import conll_to_doc
+from src.utils.filesystem import DocBinWriter, read_docbin
+
+demo_dir = Path("demo")
+
+ATTRS = [ORTH, POS, LEMMA, HEAD, DEP]
+
+
+class SideCar(unittest.TestCase):
+    def test_round_trip(self):
+        vocab = Vocab()
+        with casanova.reader(demo_dir.joinpath("complex_parsed.csv")) as reader:
+            rows = list(reader.cells("conll_string", with_rows=True))
+        docs = [conll_to_doc(vocab, conll_str) for _, conll_str in rows]
+        ids = [row[0] for row, _ in rows]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir).joinpath("complex_parsed.csv.docbin")
+            with DocBinWriter(path) as writer:
+                # Write one record per document, as with a batch size of 1
+                for doc_id, doc in zip(ids, docs):
+                    writer.write([doc_id], DocBin(docs=[doc]).to_bytes())
+
+            read_ids, read_docs = zip(*read_docbin(path, vocab))
+
+        assert list(read_ids) == ids
+        for doc, read_doc in zip(docs, read_docs):
+            assert (doc.to_array(ATTRS) == read_doc.to_array(ATTRS)).all()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,29 @@
+import unittest
+
+from test.benchmarks.import_time import import_time
+
+# Seconds that importing the CLI may take, whatever the model selected later
+IMPORT_BUDGET = 1.0
+
+
+class ImportTime(unittest.TestCase):
+    def test_cli(self):
+        seconds, imported = import_time("src.main")
+        assert imported == []
+        assert seconds < IMPORT_BUDGET
+
+    def test_conll_command(self):
+        # SpaCy is only imported once test-conll checks the strings
+        _, imported = import_time("src.cli.test_conll")
+        assert imported == []
+
+    def test_parsers(self):
+        # Only SpaCy is needed before a model is selected
+        _, imported = import_time("src.parsers")
+        assert "stanza" not in imported
+        assert "hopsparser" not in imported
+        assert "spacy_conll" not in imported
+
+
+if __name__ == "__main__":
+    unittest.main()
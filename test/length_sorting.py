@@ -0,0 +1,64 @@
+import unittest
+
+from spacy.tokens import Doc, DocBin
+from spacy.vocab import Vocab
+
+from src.cli.parse_command import LengthSortedParser
+
+
+class WordsParser:
+    """Parser splitting texts into words, which records the batches it parsed."""
+
+    def __init__(self) -> None:
+        self.vocab = Vocab()
+        self.batches = []
+
+    def annotate_batches(self, batches, batch_size, docbin=False):
+        for batch in batches:
+            self.batches.append([text for text, _ in batch])
+            docs = [Doc(self.vocab, words=text.split()) for text, _ in batch]
+            doc_bin = DocBin(docs=docs).to_bytes() if docbin else None
+            yield [(row, text.upper(), text) for text, row in batch], doc_bin
+
+
+class LengthSorting(unittest.TestCase):
+    def test_batches_are_sorted_and_restored(self):
+        texts = ["a b c d", "a", "a b c d e f", "a b", "a b c", "a b c d e"]
+        rows = [(text, [str(i)]) for i, text in enumerate(texts)]
+        batches = [rows[:4], [], rows[4:]]
+        parser = WordsParser()
+        annotated = list(
+            LengthSortedParser(parser, window=4).annotate_batches(
+                batches, batch_size=2, docbin=True
+            )
+        )
+
+        # The first window holds the first batch, the second one the others
+        assert parser.batches == [
+            ["a", "a b"],
+            ["a b c d", "a b c d e f"],
+            ["a b c", "a b c d e"],
+        ]
+        # One annotated batch per input batch, in the input order
+        assert [[row for row, _, _ in a] for a, _ in annotated] == [
+            [["0"], ["1"], ["2"], ["3"]],
+            [],
+            [["4"], ["5"]],
+        ]
+        for (annotations, doc_bin), batch in zip(annotated, batches):
+            docs = DocBin().from_bytes(doc_bin).get_docs(Vocab())
+            assert [[t.text for t in doc] for doc in docs] == [t.split() for t, _ in batch]
+            assert [text for _, _, text in annotations] == [text for text, _ in batch]
+
+    def test_windows_without_texts(self):
+        parser = WordsParser()
+        annotated = list(
+            LengthSortedParser(parser, window=1).annotate_batches(
+                [[("a", ["0"])], [], []], batch_size=2
+            )
+        )
+        assert annotated == [([(["0"], "A", "a")], None), ([], None), ([], None)]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,5 @@
 import unittest
 from pathlib import Path
-from src.constants import ModelType
 
 from src.main import match
 
@@ -12,18 +11,12 @@ FRENCH_KWARGS = {
     "matchfile": test_dir.joinpath("semgrex", "matches.json"),
     "datafile": outdir.joinpath("french", "french.conll.csv.gz"),
     "outfile": outdir.joinpath("french", "french.deps.csv"),
-    "model_path": "./hopsparser_model/UD_all_spoken_French-flaubert",
-    "model": ModelType.hop,
-    "lang": "fr",
 }
 
 ENGLISH_KWARGS = {
     "matchfile": test_dir.joinpath("semgrex", "matches.json"),
     "datafile": outdir.joinpath("english", "english.conll.csv.gz"),
     "outfile": outdir.joinpath("english", "english.deps.csv"),
-    "model_path": "./hopsparser_model/UD_all_spoken_French-flaubert",
-    "model": ModelType.stanza,
-    "lang": "en",
 }
 
 
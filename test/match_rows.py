@@ -0,0 +1,90 @@
+import json
+import unittest
+from pathlib import Path
+
+from spacy.vocab import Vocab
+
+from src.cli.match_command import (
+    LONG_COLUMNS,
+    MatchIndex,
+    match_dependencies,
+    match_dependencies_long,
+    noun_phrase_spans,
+)
+from src.parsers import SemgrexMatcher
+from src.utils.conll import conll_to_doc
+from test.benchmarks.match_rows import legacy_match_dependencies
+from test.prefilter import load_sentences
+
+MATCHFILES = [
+    Path("demo", "complex_semgrex.json"),
+    Path("demo", "simple_semgrex.json"),
+    Path("test", "semgrex", "matches.json"),
+]
+
+
+class MatchRows(unittest.TestCase):
+    def test_same_rows(self):
+        vocab = Vocab()
+        docs = [conll_to_doc(vocab, sentence) for sentence in load_sentences()]
+        for matchfile in MATCHFILES:
+            match_index = MatchIndex(matchfile)
+            parser = SemgrexMatcher(vocab)
+            parser.add_semgrex(match_index.matches)
+            n_rows = 0
+            phrase_columns = [
+                slot + 5 for slots in match_index.slots.values() for slot in slots
+            ]
+            for doc in docs:
+                rows = list(match_dependencies(doc, parser, match_index))
+                legacy_rows = legacy_match_dependencies(doc, parser, match_index)
+                # The previous implementation didn't fill the noun phrases
+                for row in rows:
+                    for i in phrase_columns:
+                        row[i] = None
+                assert rows == legacy_rows
+                n_rows += len(rows)
+            assert n_rows > 0, matchfile
+
+    def test_long_rows(self):
+        # Each match's wide row holds the columns of its long rows
+        vocab = Vocab()
+        docs = [conll_to_doc(vocab, sentence) for sentence in load_sentences()]
+        for matchfile in MATCHFILES:
+            match_index = MatchIndex(matchfile)
+            parser = SemgrexMatcher(vocab)
+            parser.add_semgrex(match_index.matches)
+            columns = list(match_index.row_dict)
+            for doc in docs:
+                wide_rows = list(match_dependencies(doc, parser, match_index))
+                long_rows = list(match_dependencies_long(doc, parser, match_index))
+                assert all(len(row) == len(LONG_COLUMNS) for row in long_rows)
+                assert len({row[1] for row in long_rows}) == len(wide_rows)
+                for pattern, match_id, node, *values in long_rows:
+                    slot = columns.index("{}_{}_id".format(pattern, node))
+                    assert wide_rows[match_id][slot : slot + 6] == values
+
+    def test_noun_phrases(self):
+        vocab = Vocab()
+        for sentence in load_sentences():
+            doc = conll_to_doc(vocab, sentence)
+            for token, span in zip(doc, noun_phrase_spans(doc)):
+                if token.pos_ in ["NOUN", "PROPN", "PRON"]:
+                    subtree = list(token.subtree)
+                    phrase = doc[subtree[0].i : subtree[-1].i + 1].text
+                    assert doc.text[span[0] : span[1]] == phrase
+                else:
+                    assert span is None
+
+    def test_columns(self):
+        match_index = MatchIndex(Path("demo", "complex_semgrex.json"))
+        columns = list(match_index.row_dict)
+        with open(Path("demo", "complex_semgrex.json")) as f:
+            nodes = [node["RIGHT_ID"].upper() for node in json.load(f)["SOV"]]
+        for node, slot in zip(nodes, match_index.slots["SOV"]):
+            assert columns[slot] == "SOV_{}_id".format(node)
+            assert columns[slot + 5] == "SOV_{}_noun_phrase".format(node)
+
+
+if __name__ == "__main__":
+    unittest.main()
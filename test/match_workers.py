@@ -0,0 +1,46 @@
+import unittest
+from pathlib import Path
+
+import casanova
+
+from src.cli.match_command import (
+    MatcherPool,
+    MatchIndex,
+    conll_converter,
+    match_dependencies_long,
+    match_docs,
+)
+from src.constants import MatchLayout
+from src.parsers import ConLLParser, SemgrexMatcher
+
+DATAFILE = Path("demo", "complex_parsed.csv")
+MATCHFILE = Path("test", "semgrex", "matches.json")
+# The CoNLL strings are converted on a blank pipeline's vocabulary
+SPACY_LANGUAGE = "blank:en"
+
+
+class MatchWorkers(unittest.TestCase):
+    def match(self, layout: MatchLayout, workers: int) -> list:
+        with casanova.reader(DATAFILE) as reader:
+            if workers > 1:
+                pool = MatcherPool(
+                    workers, SPACY_LANGUAGE, MATCHFILE, layout, chunk_size=3
+                )
+                return list(pool.match(reader, "conll_string"))
+            conll_parser = ConLLParser(SPACY_LANGUAGE)
+            dep_parser = SemgrexMatcher(conll_parser.vocab)
+            match_index = MatchIndex(MATCHFILE)
+            dep_parser.add_semgrex(match_index.matches)
+            docs = conll_converter(reader, "conll_string", conll_parser, match_index)
+            match_rows = match_dependencies_long if layout == MatchLayout.long else None
+            return list(match_docs(docs, dep_parser, match_index, match_rows))
+
+    def test_same_rows_in_order(self):
+        for layout in MatchLayout:
+            expected = self.match(layout, workers=1)
+            assert sum(len(matches) for _, matches in expected) > 0
+            assert self.match(layout, workers=2) == expected
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import json
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from src.utils.metrics import Metrics
+
+
+def slow_items(n: int, metrics: Metrics):
+    for i in range(n):
+        with metrics.stage("inner"):
+            time.sleep(0.01)
+        yield i
+
+
+class MetricsTest(unittest.TestCase):
+    def test_nested_stages_are_counted_once(self):
+        metrics = Metrics(enabled=True)
+        with metrics.stage("outer"):
+            time.sleep(0.01)
+            items = list(metrics.timed("items", slow_items(3, metrics)))
+        assert items == [0, 1, 2]
+        stages = metrics.to_dict()["stages"]
+        assert stages["inner"]["calls"] == 3
+        assert stages["inner"]["wall"] >= 0.03
+        # The time spent in the inner stage isn't counted again in the others
+        assert stages["items"]["wall"] < 0.01
+        assert 0.01 <= stages["outer"]["wall"] < 0.02
+        assert stages["items"]["calls"] == 4
+
+    def test_disabled_metrics_record_nothing(self):
+        metrics = Metrics()
+        with metrics.stage("outer"):
+            list(metrics.timed("items", range(3)))
+        metrics.count("docs", 3)
+        metrics.add_batch(1.0)
+        assert metrics.stages == {} and metrics.counters == {}
+        assert metrics.batch_latencies == []
+
+    def test_worker_metrics_are_merged(self):
+        metrics = Metrics(enabled=True)
+        metrics.add_time("nlp.pipe", 1.0, 0.5)
+        worker = Metrics(enabled=True)
+        worker.add_time("nlp.pipe", 2.0, 1.5)
+        worker.count("tokens", 10)
+        metrics.merge(*worker.drain())
+        assert metrics.stages == {"nlp.pipe": [3.0, 2.0, 2]}
+        assert metrics.counters == {"tokens": 10}
+        assert worker.stages == {} and worker.counters == {}
+
+    def test_snapshots(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir).joinpath("metrics.json")
+            metrics = Metrics(path=path, command="match", interval=0)
+            metrics.count("docs", 2)
+            metrics.add_batch(0.5)
+            snapshot = json.loads(path.read_text())
+            assert snapshot["command"] == "match"
+            assert not snapshot["finished"]
+            assert snapshot["counters"] == {"docs": 2}
+            assert snapshot["batches"]["count"] == 1
+
+            metrics.save(finished=True)
+            assert json.loads(path.read_text())["finished"]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+
+import emoji
+
+from src.cli.parse_command import preprocess_batches
+from src.utils.normalizer import normalize_batch, normalizer
+from test.benchmarks.normalizer import legacy_normalizer, load_texts
+
+
+class Equivalence(unittest.TestCase):
+    def test_corpus(self):
+        texts = load_texts()
+        assert normalize_batch(texts) == [legacy_normalizer(text) for text in texts]
+
+    def test_emojis(self):
+        # Every emoji, alone, repeated, followed by a variation selector
+        # or joined to another one
+        for emj in emoji.EMOJI_DATA:
+            for text in [
+                "Title {}: text".format(emj),
+                "{0}{0}@user #tag".format(emj),
+                "a{}︎b".format(emj),
+                "{}‍\U0001f4bb via @user".format(emj),
+            ]:
+                assert normalizer(text) == legacy_normalizer(text), text
+
+    def test_worker_pool(self):
+        batches = [[(text, [i]) for i, text in enumerate(load_texts(50))]] * 3
+        expected = [
+            [(legacy_normalizer(text), row) for text, row in batch] for batch in batches
+        ]
+        assert list(preprocess_batches(batches, workers=2)) == expected
+
+
+if __name__ == "__main__":
+    unittest.main()
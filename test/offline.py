@@ -0,0 +1,117 @@
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+import typer
+
+from src.cli.parse_command import ParserPool
+from src.constants import ModelType
+from src.exceptions import StanzaModelsMissingException
+from src.parsers import (
+    confirm_hopsparser_model_path,
+    stanza_models_present,
+    stanza_resources_version,
+)
+
+PROCESSORS = "tokenize,pos,lemma,depparse"
+
+RESOURCES = {
+    "fr": {
+        "default_processors": {
+            "tokenize": "gsd",
+            "mwt": "gsd",
+            "pos": "gsd_charlm",
+            "lemma": "gsd_nocharlm",
+            "depparse": "gsd_charlm",
+            "ner": "wikiner",
+        },
+        "pos": {
+            "gsd_charlm": {
+                "dependencies": [
+                    {"model": "pretrain", "package": "conll17"},
+                    {"model": "forward_charlm", "package": "newswiki"},
+                ]
+            }
+        },
+    },
+    "french": {"alias": "fr"},
+}
+
+MODELS = [
+    "tokenize/gsd",
+    "mwt/gsd",
+    "pos/gsd_charlm",
+    "lemma/gsd_nocharlm",
+    "depparse/gsd_charlm",
+    "pretrain/conll17",
+    "forward_charlm/newswiki",
+]
+
+
+class Offline(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.model_dir = Path(self.tmpdir.name)
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def download(self, models: list[str]):
+        with open(self.model_dir.joinpath("resources.json"), "w") as f:
+            json.dump(RESOURCES, f)
+        for model in models:
+            path = self.model_dir.joinpath("fr", model + ".pt")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.touch()
+
+    def test_models_present(self):
+        assert not stanza_models_present("fr", PROCESSORS, self.model_dir)
+        self.download(MODELS)
+        assert stanza_models_present("fr", PROCESSORS, self.model_dir)
+        assert stanza_models_present("french", PROCESSORS, self.model_dir)
+        # The entity recognizer wasn't downloaded
+        assert not stanza_models_present("fr", PROCESSORS + ",ner", self.model_dir)
+        assert not stanza_models_present("de", PROCESSORS, self.model_dir)
+
+    def test_dependencies_missing(self):
+        for missing in ["mwt/gsd", "forward_charlm/newswiki"]:
+            self.download([model for model in MODELS if model != missing])
+            self.model_dir.joinpath("fr", missing + ".pt").unlink(missing_ok=True)
+            assert not stanza_models_present("fr", PROCESSORS, self.model_dir)
+
+    def test_resources_version(self):
+        assert stanza_resources_version(self.model_dir) is None
+        self.download(MODELS)
+        downloaded = stanza_resources_version(self.model_dir)
+        assert downloaded is not None
+        assert stanza_resources_version(self.model_dir) == downloaded
+        # Downloading other models rewrites the manifest
+        with open(self.model_dir.joinpath("resources.json"), "w") as f:
+            json.dump({**RESOURCES, "de": {"default_processors": {}}}, f)
+        assert stanza_resources_version(self.model_dir) != downloaded
+
+    def test_hopsparser_model_path(self):
+        assert confirm_hopsparser_model_path("model", offline=True) == "model"
+        with self.assertRaises(typer.BadParameter):
+            confirm_hopsparser_model_path("", offline=True)
+        # Jobs run by a server can't prompt for it either
+        with self.assertRaises(typer.BadParameter):
+            confirm_hopsparser_model_path("", interactive=False)
+
+    @mock.patch("src.parsers.stanza_models_present", return_value=False)
+    def test_pool_downloads_stanza_models_once(self, _):
+        with self.assertRaises(StanzaModelsMissingException):
+            ParserPool(4, ModelType.stanza, "fr", offline=True)
+        downloads = []
+        stanza = SimpleNamespace(download=lambda *args, **kwargs: downloads.append(kwargs))
+        with mock.patch.dict(sys.modules, {"stanza": stanza}):
+            ParserPool(4, ModelType.stanza, "fr", needs={"POS"})
+        assert downloads == [{"processors": "tokenize,pos,lemma,depparse"}]
+
+
+if __name__ == "__main__":
+    unittest.main()
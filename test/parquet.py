@@ -0,0 +1,124 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.constants import Compression, OutputFormat
+from src.main import resolve_output_format
+from src.utils.filesystem import (
+    MatchEnricher,
+    ParquetReader,
+    ParseEnricher,
+    is_parquet,
+    open_infile,
+)
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+N_ROWS = 250
+MATCH_COLS = ["SOV_ROOT_id", "SOV_ROOT_lemma", "SOV_ROOT_pos", "SOV_ROOT_noun_phrase"]
+
+
+@unittest.skipIf(pq is None, "pyarrow is not installed")
+class Parquet(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmpdir.name)
+        self.datafile = self.dir.joinpath("data.csv")
+        with open(self.datafile, "w") as f:
+            f.write("id,text\n")
+            for i in range(N_ROWS):
+                f.write("{},text {}\n".format(i, i))
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def parse(
+        self,
+        datafile: Path,
+        output_format: OutputFormat,
+        compression: Compression = Compression.gzip,
+        level: int | None = None,
+    ) -> Path:
+        with ParseEnricher(
+            datafile,
+            self.dir.joinpath("parsed.csv"),
+            "id",
+            compression,
+            level,
+            output_format=output_format,
+        ) as enricher:
+            for row, text in enricher.cells("text", with_rows=True):
+                enricher.writerow(row, [text.upper(), ""])
+        return enricher.outfile
+
+    def match(self, datafile: Path, output_format: OutputFormat) -> Path:
+        with MatchEnricher(
+            datafile,
+            self.dir.joinpath("matches.csv"),
+            "id",
+            MATCH_COLS,
+            Compression.zstd,
+            output_format=output_format,
+        ) as enricher:
+            for row, parsed_text in enricher.cells("parsed_text", with_rows=True):
+                i = int(row[enricher.headers["id"]])
+                # Some documents have no match, others have two
+                for j in range(i % 3):
+                    enricher.writerow(row, [j, "be", "VERB" if j else "AUX", None])
+        return enricher.outfile
+
+    def test_parse_outfile(self):
+        outfile = self.parse(self.datafile, OutputFormat.parquet)
+        assert outfile.name == "parsed.csv.parquet"
+        assert is_parquet(outfile)
+        with ParquetReader(outfile) as reader:
+            assert reader.fieldnames == ["id", "parsed_text", "conll_string"]
+            assert reader.total == N_ROWS
+            rows = list(reader)
+        assert rows[7] == ["7", "TEXT 7", ""]
+
+    def test_uncompressed_with_level(self):
+        # The compression level of uncompressed out-files is ignored
+        outfile = self.parse(self.datafile, OutputFormat.parquet, Compression.none, 3)
+        assert pq.read_metadata(outfile).row_group(0).column(0).compression == "UNCOMPRESSED"
+        with ParquetReader(outfile) as reader:
+            assert reader.total == N_ROWS
+
+    def test_format_follows_suffix(self):
+        parquet_outfile = self.dir.joinpath("matches.parquet")
+        assert resolve_output_format(parquet_outfile, None) == OutputFormat.parquet
+        assert resolve_output_format(self.datafile, None) == OutputFormat.csv
+        assert (
+            resolve_output_format(parquet_outfile, OutputFormat.csv) == OutputFormat.csv
+        )
+
+    def test_match_columns_types(self):
+        parsed = self.parse(self.datafile, OutputFormat.parquet)
+        outfile = self.match(parsed, OutputFormat.parquet)
+        schema = pq.read_schema(outfile)
+        assert str(schema.field("SOV_ROOT_id").type) == "int64"
+        assert str(schema.field("SOV_ROOT_pos").type) == "dictionary<values=string, indices=int32, ordered=0>"
+        assert str(schema.field("SOV_ROOT_noun_phrase").type) == "string"
+
+    def test_parquet_matches_csv(self):
+        # The same rows are written from and to either format
+        csv_parsed = self.parse(self.datafile, OutputFormat.csv)
+        with open_infile(csv_parsed) as f:
+            csv_rows = f.read().splitlines()[1:]
+        parquet_parsed = self.parse(self.datafile, OutputFormat.parquet)
+        with ParquetReader(parquet_parsed) as reader:
+            assert [",".join(row) for row in reader] == csv_rows
+
+        csv_matches = self.match(csv_parsed, OutputFormat.csv)
+        with open_infile(csv_matches) as f:
+            csv_rows = f.read().splitlines()[1:]
+        parquet_matches = self.match(parquet_parsed, OutputFormat.parquet)
+        with ParquetReader(parquet_matches) as reader:
+            assert [",".join(row) for row in reader] == csv_rows
+
+
+if __name__ == "__main__":
+    unittest.main()
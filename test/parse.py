@@ -1,3 +1,4 @@
+import gzip
 import unittest
 from pathlib import Path
 
@@ -57,5 +58,23 @@ class French(unittest.TestCase):
         parse(**FRENCH_KWARGS)
 
 
+class Workers(unittest.TestCase):
+    def test_same_output(self):
+        df = outdir.joinpath("english", "english.small.text.csv")
+        kwargs = ENGLISH_KWARGS | {"datafile": df, "batch_size": 5}
+
+        single_outfile = outdir.joinpath("english", "english.single.conll.csv")
+        parse(**kwargs | {"outfile": single_outfile})
+
+        multi_outfile = outdir.joinpath("english", "english.workers.conll.csv")
+        parse(**kwargs | {"outfile": multi_outfile, "workers": 2})
+
+        with gzip.open(str(single_outfile) + ".gz", "rb") as f:
+            single_output = f.read()
+        with gzip.open(str(multi_outfile) + ".gz", "rb") as f:
+            multi_output = f.read()
+        assert single_output == multi_output
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,137 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+import spacy
+from spacy.language import Language
+
+from src.constants import Compression, MatchLayout
+from src.main import match, parse, parse_match
+from test.benchmarks.suite import write_corpus
+
+PATTERNS = {
+    "RootSubj": [
+        {"RIGHT_ID": "root", "RIGHT_ATTRS": {"DEP": "ROOT"}},
+        {
+            "LEFT_ID": "root",
+            "REL_OP": ">",
+            "RIGHT_ID": "subject",
+            "RIGHT_ATTRS": {"DEP": "nsubj"},
+        },
+    ],
+    "NounVerb": [
+        {"RIGHT_ID": "root", "RIGHT_ATTRS": {"POS": "NOUN", "DEP": "ROOT"}},
+        {
+            "LEFT_ID": "root",
+            "REL_OP": ">",
+            "RIGHT_ID": "verb",
+            "RIGHT_ATTRS": {"POS": "VERB"},
+        },
+    ],
+    "Org": [{"RIGHT_ID": "org", "RIGHT_ATTRS": {"ENT_TYPE": "ORG"}}],
+}
+
+
+@Language.component("fake_dependencies")
+def fake_dependencies(doc):
+    """Attach every token to the first of its sentence, with made-up tags."""
+    for sent in doc.sents:
+        for token in sent:
+            token.lemma_ = token.lower_
+            if token.lower_ in {"i", "you", "we", "it", "they"}:
+                token.pos_ = "PRON"
+            else:
+                token.pos_ = "VERB" if token.i % 3 == 1 else "NOUN"
+            token.tag_ = token.pos_
+            token.head = sent[0]
+            if token.i == sent[0].i:
+                token.dep_ = "ROOT"
+            else:
+                token.dep_ = "nsubj" if token.pos_ == "PRON" else "dep"
+    return doc
+
+
+class ParseMatch(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmpdir.name)
+        self.model = str(self.dir.joinpath("model"))
+        nlp = spacy.blank("en")
+        nlp.add_pipe("sentencizer")
+        nlp.add_pipe("fake_dependencies")
+        nlp.add_pipe("entity_ruler").add_patterns(
+            [{"label": "ORG", "pattern": [{"LOWER": "chatgpt"}]}]
+        )
+        nlp.to_disk(self.model)
+        self.matchfile = self.dir.joinpath("patterns.json")
+        self.matchfile.write_text(json.dumps(PATTERNS))
+        self.datafile, _ = write_corpus(self.dir, rows=50)
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_same_output_as_parse_then_match(self):
+        for layout in MatchLayout:
+            parsed = self.dir.joinpath("parsed.csv")
+            parse(
+                datafile=self.datafile,
+                outfile=parsed,
+                lang=self.model,
+                compression=Compression.none,
+            )
+            matches = self.dir.joinpath("matches.csv")
+            match(
+                datafile=parsed,
+                matchfile=self.matchfile,
+                outfile=matches,
+                spacy_language="blank:en",
+                layout=layout,
+                compression=Compression.none,
+            )
+
+            fused_parsed = self.dir.joinpath("fused_parsed.csv")
+            fused_matches = self.dir.joinpath("fused_matches.csv")
+            parse_match(
+                datafile=self.datafile,
+                matchfile=self.matchfile,
+                outfile=fused_matches,
+                lang=self.model,
+                layout=layout,
+                conll_outfile=fused_parsed,
+                compression=Compression.none,
+            )
+            assert fused_matches.read_text() == matches.read_text()
+            assert fused_parsed.read_text() == parsed.read_text()
+            assert len(matches.read_text().splitlines()) > 1
+            # The entities are found whether or not the documents went
+            # through their CoNLL strings
+            assert ",ORG," in matches.read_text()
+
+    def test_same_output_with_docbin(self):
+        parsed = self.dir.joinpath("parsed.csv")
+        parse(
+            datafile=self.datafile,
+            outfile=parsed,
+            lang=self.model,
+            compression=Compression.none,
+            docbin=True,
+        )
+        outputs = []
+        for docbin in [None, self.dir.joinpath("parsed.csv.docbin")]:
+            matches = self.dir.joinpath("matches.csv")
+            match(
+                datafile=parsed,
+                matchfile=self.matchfile,
+                outfile=matches,
+                spacy_language="blank:en",
+                compression=Compression.none,
+                docbin=docbin,
+            )
+            outputs.append(matches.read_text())
+        assert outputs[0] == outputs[1]
+        assert ",ORG," in outputs[0]
+
+
+if __name__ == "__main__":
+    unittest.main()
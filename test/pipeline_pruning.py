@@ -0,0 +1,79 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+import spacy
+import typer
+
+from src.constants import ModelType
+from src.parsers import ConLLParser, SpacyParser, parse_needs, pattern_needs
+
+
+class PipelinePruning(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # A small pipeline with components setting POS tags, lemmas and entities
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.model = str(Path(cls.tmpdir.name).joinpath("model"))
+        nlp = spacy.blank("en")
+        nlp.add_pipe("sentencizer")
+        nlp.add_pipe("attribute_ruler").add(
+            [[{"IS_ALPHA": True}]], {"TAG": "NN", "POS": "NOUN", "LEMMA": "thing"}
+        )
+        nlp.add_pipe("entity_ruler").add_patterns([{"label": "ORG", "pattern": "Paris"}])
+        nlp.to_disk(cls.model)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def test_needs(self):
+        assert parse_needs("pos, Dep,LEMMA") == {"POS", "LEMMA"}
+        with self.assertRaises(typer.BadParameter):
+            parse_needs("POS,FOO")
+
+    def test_pattern_needs(self):
+        with open(Path("demo", "complex_semgrex.json")) as f:
+            assert pattern_needs(json.load(f)) == set()
+        patterns = {
+            "P": [
+                {"RIGHT_ID": "a", "RIGHT_ATTRS": {"LEMMA": "be", "ORTH": "is"}},
+                {"RIGHT_ID": "b", "RIGHT_ATTRS": {"ENT_IOB": "B", "IS_ALPHA": True}},
+            ]
+        }
+        assert pattern_needs(patterns) == {"LEMMA", "ENT_TYPE"}
+        # The needs of custom extensions are unknown
+        patterns["P"][0]["RIGHT_ATTRS"]["_"] = {"custom": True}
+        assert pattern_needs(patterns) is None
+
+    def test_pruned_fields(self):
+        parser = SpacyParser(ModelType.spacy, self.model, needs={"POS"})
+        assert parser.nlp.pipe_names == [
+            "sentencizer",
+            "attribute_ruler",
+        ]
+        (annotations,), _ = parser.annotate_batch([("Paris is nice", ["1"])], 10)
+        _, _, conll_str = annotations
+        fields = [line.split("\t") for line in conll_str.splitlines()]
+        # The lemmas and fine-grained tags set by the attribute ruler are cleared
+        assert [f[2:5] for f in fields] == [["_", "NOUN", "_"]] * 3
+
+    def test_all_fields(self):
+        parser = SpacyParser(ModelType.spacy, self.model)
+        (annotations,), doc_bin = parser.annotate_batch(
+            [("Paris is nice", ["1"])], 10, docbin=True
+        )
+        _, _, conll_str = annotations
+        fields = [line.split("\t") for line in conll_str.splitlines()]
+        assert [f[2:5] for f in fields] == [["thing", "NOUN", "NN"]] * 3
+        assert "entity_ruler" in parser.nlp.pipe_names
+
+    def test_conll_parser_loads_no_component(self):
+        conll_parser = ConLLParser(self.model)
+        assert conll_parser.nlp.pipe_names == []
+        assert conll_parser.nlp.lang == "en"
+
+
+if __name__ == "__main__":
+    unittest.main()
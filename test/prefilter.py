@@ -0,0 +1,96 @@
+import gzip
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+import casanova
+from spacy.tokens import DocBin
+from spacy.vocab import Vocab
+
+from src.cli.match_command import MatchIndex, match_dependencies
+from src.parsers import SemgrexMatcher
+from src.utils.conll import conll_to_doc
+
+DATAFILES = [
+    *Path("demo").glob("*_parsed.csv"),
+    *Path("test", "data").glob("*/*.conll.csv.gz"),
+]
+
+PATTERNS = {
+    "VerbSubj": [
+        {"RIGHT_ID": "verb", "RIGHT_ATTRS": {"POS": "VERB"}},
+        {
+            "LEFT_ID": "verb",
+            "REL_OP": ">",
+            "RIGHT_ID": "subject",
+            "RIGHT_ATTRS": {"DEP": {"IN": ["nsubj", "nsubj:pass"]}},
+        },
+    ],
+    "Lemma": [
+        {"RIGHT_ID": "root", "RIGHT_ATTRS": {"dep": "ROOT", "lemma": "être"}},
+        {
+            "LEFT_ID": "root",
+            "REL_OP": ">>",
+            "RIGHT_ID": "word",
+            "RIGHT_ATTRS": {"TEXT": {"NOT_IN": ["a"]}, "LOWER": {"IN": ["chatgpt"]}},
+        },
+    ],
+}
+
+
+def load_sentences() -> list[str]:
+    """Each sentence of the CoNLL strings in the demo and test data."""
+    sentences = []
+    for datafile in DATAFILES:
+        f = gzip.open(datafile, "rt") if datafile.suffix == ".gz" else open(datafile)
+        with f, casanova.reader(f) as reader:
+            for conll_str in reader.cells("conll_string"):
+                sentences.extend(conll_str.strip().split("\n\n"))
+    return sentences
+
+
+class Prefilter(unittest.TestCase):
+    def assert_same_matches(self, patterns: dict):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            matchfile = Path(tmpdir).joinpath("patterns.json")
+            with open(matchfile, "w") as f:
+                json.dump(patterns, f)
+            match_index = MatchIndex(matchfile)
+
+        vocab = Vocab()
+        matcher = SemgrexMatcher(vocab)
+        matcher.add_semgrex(match_index.matches)
+
+        skipped = 0
+        for sentence in load_sentences():
+            doc = conll_to_doc(vocab, sentence)
+            matches = list(match_dependencies(doc, matcher, match_index))
+            # Documents read back from a DocBin are filtered the same way
+            doc_bin_doc = list(DocBin(docs=[doc]).get_docs(vocab))[0]
+            could_match = match_index.could_match_conll(sentence)
+            assert match_index.could_match_doc(doc_bin_doc) == could_match
+            if not could_match:
+                skipped += 1
+                assert matches == []
+        return skipped
+
+    def test_repo_patterns(self):
+        for matchfile in [
+            Path("demo", "complex_semgrex.json"),
+            Path("test", "semgrex", "matches.json"),
+        ]:
+            with open(matchfile) as f:
+                self.assert_same_matches(json.load(f))
+
+    def test_attributes(self):
+        assert self.assert_same_matches(PATTERNS) > 0
+
+    def test_unrestricted_pattern(self):
+        # A node without any required value can match any token
+        patterns = {"Any": [{"RIGHT_ID": "any", "RIGHT_ATTRS": {}}]}
+        assert self.assert_same_matches(patterns) == 0
+
+
+if __name__ == "__main__":
+    unittest.main()
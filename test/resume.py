@@ -0,0 +1,103 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.constants import Compression
+from src.utils.filesystem import Checkpoint, ParquetOutput, ParseEnricher, open_infile
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+N_ROWS = 250
+
+
+def write_rows(enricher: ParseEnricher, stop: int | None = None):
+    """Enrich the in-file's rows, checkpointing every 100 rows, and
+    interrupt the run after `stop` rows."""
+    processed_rows = enricher.resumed_rows
+    for row in enricher:
+        if processed_rows == stop:
+            raise KeyboardInterrupt
+        enricher.writerow(row, ["text", "conll"])
+        processed_rows += 1
+        if processed_rows % 100 == 0:
+            enricher.checkpoint(rows=processed_rows)
+
+
+class Resume(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.datafile = Path(self.tmpdir.name).joinpath("data.csv")
+        with open(self.datafile, "w") as f:
+            f.write("id,text\n")
+            for i in range(N_ROWS):
+                f.write("{},text\n".format(i))
+        self.outfile = Path(self.tmpdir.name).joinpath("out.csv")
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def run_enricher(self, resume: bool = False, stop: int | None = None):
+        try:
+            with ParseEnricher(
+                self.datafile, self.outfile, "id", Compression.gzip, resume=resume
+            ) as enricher:
+                write_rows(enricher, stop)
+        except KeyboardInterrupt:
+            pass
+        return enricher
+
+    def read_outfile(self) -> str:
+        with open_infile(self.outfile.with_suffix(".csv.gz")) as f:
+            return f.read()
+
+    def test_resume_from_checkpoint(self):
+        self.run_enricher()
+        expected = self.read_outfile()
+
+        self.run_enricher(stop=150)
+        enricher = self.run_enricher(resume=True)
+        assert enricher.resumed_rows == 100
+        assert self.read_outfile() == expected
+        assert not Checkpoint(enricher.outfile).path.exists()
+
+    def test_resume_without_checkpoint(self):
+        self.run_enricher()
+        expected = self.read_outfile()
+
+        enricher = self.run_enricher(stop=150)
+        Checkpoint(enricher.outfile).remove()
+        enricher = self.run_enricher(resume=True)
+        # The rows of the last document in the out-file are processed again
+        assert enricher.resumed_rows == 149
+        assert self.read_outfile() == expected
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_resume_parquet_infile(self):
+        self.run_enricher()
+        expected = self.read_outfile()
+
+        # The same in-file, as Parquet with several row groups
+        parquet_datafile = self.datafile.with_suffix(".parquet")
+        with ParquetOutput(
+            parquet_datafile, ["id", "text"], row_group_size=30
+        ) as output:
+            output.writerows([[str(i), "text"] for i in range(N_ROWS)])
+        self.datafile = parquet_datafile
+
+        self.run_enricher(stop=150)
+        enricher = self.run_enricher(resume=True)
+        assert enricher.resumed_rows == 100
+        assert self.read_outfile() == expected
+
+        enricher = self.run_enricher(stop=150)
+        Checkpoint(enricher.outfile).remove()
+        enricher = self.run_enricher(resume=True)
+        assert enricher.resumed_rows == 149
+        assert self.read_outfile() == expected
+
+
+if __name__ == "__main__":
+    unittest.main()
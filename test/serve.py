@@ -0,0 +1,117 @@
+import stat
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from typing import Optional
+
+import typer
+from typing_extensions import Annotated
+
+from src.cli.serve_command import JobServer, ResidentParsers, submit_job
+from src.constants import INTERRUPTED_EXIT_CODE, Compression
+
+
+class Recorder:
+    """Command recording the options of the jobs it runs."""
+
+    def __init__(self) -> None:
+        self.jobs = []
+
+    def __call__(
+        self,
+        datafile: Annotated[Path, typer.Option()],
+        outfile: Annotated[Optional[Path], typer.Option()] = None,
+        compression: Compression = Compression.gzip,
+        batch_size: int = 10,
+        server: Optional[Path] = None,
+    ):
+        if batch_size < 0:
+            # As the commands do when they're interrupted with Ctrl+C
+            raise typer.Exit(code=INTERRUPTED_EXIT_CODE)
+        if batch_size < 1:
+            raise ValueError("Invalid batch size")
+        self.jobs.append((datafile, outfile, compression, batch_size))
+
+
+class Serve(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.socket = Path(self.tmpdir.name).joinpath("keyfayqua.sock")
+        self.command = Recorder()
+        self.server = JobServer(self.socket, {"parse": self.command})
+        self.stopped = False
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.start()
+
+    def serve(self):
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            self.stopped = True
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.tmpdir.cleanup()
+
+    def test_jobs_keep_their_options(self):
+        options = {
+            "datafile": Path("data.csv"),
+            "outfile": None,
+            "compression": Compression.zstd,
+            "batch_size": 5,
+        }
+        submit_job(self.socket, "parse", options)
+        submit_job(self.socket, "parse", options)
+        # Relative paths are resolved in the client's working directory
+        expected = (Path("data.csv").absolute(), None, Compression.zstd, 5)
+        assert self.command.jobs == [expected, expected]
+
+    def test_only_the_user_can_connect(self):
+        assert stat.S_IMODE(self.socket.stat().st_mode) & 0o077 == 0
+
+    def test_failed_job(self):
+        with self.assertRaises(typer.Exit):
+            submit_job(self.socket, "parse", {"datafile": "data.csv", "batch_size": 0})
+        # The server still runs the next jobs
+        submit_job(self.socket, "parse", {"datafile": "data.csv"})
+        assert len(self.command.jobs) == 1
+
+    def test_interrupted_job(self):
+        with self.assertRaises(typer.Exit):
+            submit_job(self.socket, "parse", {"datafile": "data.csv", "batch_size": -1})
+        # The server stops rather than running the next jobs
+        self.thread.join()
+        assert self.stopped
+
+    def test_no_server(self):
+        with self.assertRaises(typer.BadParameter):
+            submit_job(self.socket.with_name("other.sock"), "parse", {})
+
+
+class Resident(unittest.TestCase):
+    def test_parsers_are_loaded_once_when_enabled(self):
+        resident = ResidentParsers()
+        loads = []
+        load = lambda: loads.append(1) or object()
+        assert resident.get("a", load) is not resident.get("a", load)
+        resident.enabled = True
+        assert resident.get("a", load) is resident.get("a", load)
+        assert resident.get("b", load) is not resident.get("a", load)
+        assert len(loads) == 4
+
+    def test_least_recently_used_parser_is_dropped(self):
+        resident = ResidentParsers(max_parsers=2)
+        resident.enabled = True
+        a = resident.get("a", object)
+        b = resident.get("b", object)
+        assert resident.get("a", object) is a
+        resident.get("c", object)
+        assert list(resident.parsers) == ["a", "c"]
+        assert resident.get("b", object) is not b
+
+
+if __name__ == "__main__":
+    unittest.main()